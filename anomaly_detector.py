@@ -0,0 +1,389 @@
+"""
+QuickShop Analytics - Anomaly Detector
+Incremental rolling z-score and EWMA anomaly detection over every KPI series
+"""
+
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from cohort_retention import dictionary_codes
+
+DB_PATH = 'quickshop.db'
+STATE_PATH = 'anomaly_state.npz'
+OUTPUT_PATH = 'anomalies.csv'
+WINDOW = 28  # days in the rolling mean / standard deviation
+MIN_PERIODS = 7  # observations a series needs before it can be flagged
+EWMA_SPAN = 14
+Z_WARNING = 2.0  # the README's two-standard-deviation rule
+Z_CRITICAL = 3.0
+FLAT_TOLERANCE = 1e-12  # M2 at or below this share of size * max(value^2) counts as no spread
+DIMENSIONS = ['all', 'shop', 'city', 'category']
+
+# metric -> (source, dimensions, additive). Additive metrics count a day with no
+# rows as 0; averages skip it, leaving the series state untouched.
+METRICS = {
+    'orders': ('orders', ['all', 'shop', 'city'], True),
+    'gmv': ('orders', ['all', 'shop', 'city'], True),
+    'cancelled_orders': ('orders', ['all', 'shop', 'city'], True),
+    'category_revenue': ('items', ['all', 'category'], True),
+    'units_sold': ('items', ['all', 'category'], True),
+    'deliveries': ('deliveries', ['all', 'shop', 'city'], True),
+    'avg_delivery_time': ('deliveries', ['all', 'shop', 'city'], False),
+    'avg_rating': ('deliveries', ['all', 'shop', 'city'], False)
+}
+METRIC_NAMES = list(METRICS)
+
+MEMBER_SQL = {'all': "'all'", 'shop': 's.shop_id', 'city': 's.city', 'category': 'p.category'}
+SOURCE_SQL = {
+    'orders': """
+        SELECT DATE(o.order_date), {member},
+            COUNT(*),
+            SUM(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE 0 END),
+            SUM(CASE WHEN o.status = 'Cancelled' THEN 1 ELSE 0 END)
+        FROM orders o
+        JOIN local_shops s ON s.shop_id = o.shop_id
+        WHERE o.order_date >= {p} AND o.order_date < {p}
+        GROUP BY DATE(o.order_date), {member}""",
+    'items': """
+        SELECT DATE(o.order_date), {member},
+            SUM(oi.total_price),
+            SUM(oi.quantity)
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        JOIN products p ON p.product_id = oi.product_id
+        WHERE o.order_date >= {p} AND o.order_date < {p} AND o.status <> 'Cancelled'
+        GROUP BY DATE(o.order_date), {member}""",
+    'deliveries': """
+        SELECT DATE(o.order_date), {member},
+            COUNT(*),
+            AVG(d.total_time_minutes),
+            AVG(d.delivery_rating)
+        FROM deliveries d
+        JOIN orders o ON o.order_id = d.order_id
+        JOIN local_shops s ON s.shop_id = o.shop_id
+        WHERE o.order_date >= {p} AND o.order_date < {p}
+        GROUP BY DATE(o.order_date), {member}"""
+}
+SOURCE_METRICS = {
+    'orders': ['orders', 'gmv', 'cancelled_orders'],
+    'items': ['category_revenue', 'units_sold'],
+    'deliveries': ['deliveries', 'avg_delivery_time', 'avg_rating']
+}
+
+def daily_aggregates(conn, first_day, last_day, placeholder='?'):
+    """Long (day, metric, dimension, member, value) rows for every series over [first_day, last_day]"""
+    cursor = conn.cursor()
+    start = str(np.datetime64(first_day, 'D'))
+    end = str(np.datetime64(last_day + 1, 'D'))
+    frames = []
+    for source, metrics in SOURCE_METRICS.items():
+        for dimension in DIMENSIONS:
+            wanted = [m for m in metrics if dimension in METRICS[m][1]]
+            if not wanted:
+                continue
+            member = MEMBER_SQL[dimension]
+            cursor.execute(SOURCE_SQL[source].format(member=member, p=placeholder), (start, end))
+            block = pd.DataFrame(cursor.fetchall(), columns=['day', 'member'] + metrics)
+            block = block.melt(id_vars=['day', 'member'], value_vars=wanted, var_name='metric')
+            frames.append(block.assign(dimension=dimension))
+    cursor.close()
+    rows = pd.concat(frames, ignore_index=True).dropna(subset=['value'])
+    rows['day'] = pd.to_datetime(rows['day'].astype(str)).to_numpy('datetime64[D]').astype(np.int64)
+    rows['member'] = rows['member'].astype(str)
+    rows['value'] = rows['value'].astype(np.float64)
+    return rows[['day', 'metric', 'dimension', 'member', 'value']]
+
+class AnomalyDetector:
+    """Rolling-window and EWMA state for every (metric, dimension, member) series
+
+    Each series keeps its last WINDOW observations in a ring buffer with a
+    windowed Welford mean / M2, plus an exponentially weighted mean and variance.
+    A day is folded in for all series at once, so a daily run costs O(series)
+    however long the history is. Values are scored against the state from
+    before the day, then folded in.
+    """
+
+    def __init__(self, window=WINDOW, ewma_span=EWMA_SPAN):
+        self.window = window
+        self.alpha = 2.0 / (ewma_span + 1)
+        self.keys = np.zeros(0, dtype=np.int64)  # metric << 48 | dimension << 40 | member code
+        self.members = {dimension: [] for dimension in DIMENSIONS}
+        self.ring = np.zeros((0, window))
+        self.count = np.zeros(0, dtype=np.int64)  # observations so far (ring position = count % window)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.ew_mean = np.zeros(0)
+        self.ew_var = np.zeros(0)
+        self.last_day = -1  # days since the epoch of the last folded day
+        self._order = None
+
+    def _rows(self, keys):
+        """Rows of the given series keys, appending series not seen before"""
+        if self._order is None:
+            self._order = np.argsort(self.keys, kind='stable')
+        position = np.searchsorted(self.keys, keys, sorter=self._order)
+        found = position < len(self.keys)
+        found[found] = self.keys[self._order[position[found]]] == keys[found]
+        new_keys = np.unique(keys[~found])
+        if len(new_keys):
+            extra = len(new_keys)
+            self.keys = np.concatenate([self.keys, new_keys])
+            self.ring = np.concatenate([self.ring, np.zeros((extra, self.window))])
+            for name in ['count', 'mean', 'm2', 'ew_mean', 'ew_var']:
+                value = getattr(self, name)
+                setattr(self, name, np.concatenate([value, np.zeros(extra, dtype=value.dtype)]))
+            self._order = np.argsort(self.keys, kind='stable')
+            position = np.searchsorted(self.keys, keys, sorter=self._order)
+        return self._order[position]
+
+    def series_keys(self, metrics, dimensions, members):
+        """Keys for (metric, dimension, member label) columns"""
+        metric_codes = pd.Categorical(metrics, categories=METRIC_NAMES).codes.astype(np.int64)
+        dimension_codes = pd.Categorical(dimensions, categories=DIMENSIONS).codes.astype(np.int64)
+        member_codes = np.zeros(len(members), dtype=np.int64)
+        members = np.asarray(members, dtype=str)
+        for code, dimension in enumerate(DIMENSIONS):
+            mask = dimension_codes == code
+            if mask.any():
+                member_codes[mask] = dictionary_codes(members[mask], self.members[dimension])
+        return metric_codes << 48 | dimension_codes << 40 | member_codes
+
+    def additive(self):
+        """Per series: is a missing day an observed 0?"""
+        flags = np.array([METRICS[name][2] for name in METRIC_NAMES])
+        return flags[self.keys >> 48]
+
+    def describe(self, rows):
+        """metric, dimension and member labels of series rows"""
+        keys = self.keys[rows]
+        dimension_codes = (keys >> 40) & 0xFF
+        member_codes = keys & 0xFFFFFFFFFF
+        members = [self.members[DIMENSIONS[d]][m] for d, m in zip(dimension_codes.tolist(), member_codes.tolist())]
+        return pd.DataFrame({
+            'metric': np.array(METRIC_NAMES, dtype=object)[keys >> 48],
+            'dimension': np.array(DIMENSIONS, dtype=object)[dimension_codes],
+            'member': members
+        })
+
+    def step(self, values, observed, z_threshold=Z_WARNING, min_periods=MIN_PERIODS):
+        """Score one day's values against the current state, then fold them in; returns flagged rows
+
+        values / observed are aligned with the series rows.
+        """
+        count = self.count
+        size = np.minimum(count, self.window)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(self.m2 / (size - 1))
+            z = (values - self.mean) / std
+            ew_z = (values - self.ew_mean) / np.sqrt(self.ew_var)
+        # A flat window has no spread; Welford can leave rounding dust in M2 instead of 0,
+        # so M2 is measured against the window's own scale rather than an absolute epsilon
+        filled = np.arange(self.window)[None, :] < size[:, None]
+        scale = np.where(filled, self.ring, 0.0) ** 2
+        z[~np.isfinite(z) | (self.m2 <= FLAT_TOLERANCE * size * scale.max(axis=1, initial=0.0))] = 0
+        ew_z[~np.isfinite(ew_z)] = 0
+        scored = observed & (count >= min_periods)
+        flagged = np.flatnonzero(scored & ((np.abs(z) >= z_threshold) | (np.abs(ew_z) >= z_threshold)))
+        report = {'row': flagged, 'value': values[flagged], 'rolling_mean': self.mean[flagged],
+                  'rolling_std': std[flagged], 'z_score': z[flagged], 'ewma': self.ew_mean[flagged],
+                  'ewma_z_score': ew_z[flagged]}
+
+        # Windowed Welford: append while the window fills, replace the oldest value after
+        rows = np.flatnonzero(observed)
+        x = values[rows]
+        n = count[rows]
+        slot = n % self.window
+        filling = n < self.window
+        old = np.where(filling, 0.0, self.ring[rows, slot])
+        mean = self.mean[rows]
+        size = np.minimum(n + 1, self.window)
+        delta = np.where(filling, x - mean, x - old)
+        new_mean = mean + delta / size
+        self.m2[rows] += np.where(filling, delta * (x - new_mean), delta * (x - new_mean + old - mean))
+        self.m2[rows] = np.maximum(self.m2[rows], 0)
+        self.mean[rows] = new_mean
+        self.ring[rows, slot] = x
+        # A window of equal values gets exactly that mean and no spread, as resync() computes it
+        filled = np.arange(self.window)[None, :] < size[:, None]
+        window = self.ring[rows]
+        high = np.where(filled, window, -np.inf).max(axis=1, initial=-np.inf)
+        flat = high == np.where(filled, window, np.inf).min(axis=1, initial=np.inf)
+        self.mean[rows[flat]] = high[flat]
+        self.m2[rows[flat]] = 0.0
+
+        # EWMA mean and variance, seeded by the first observation
+        first = n == 0
+        ew_delta = x - self.ew_mean[rows]
+        self.ew_mean[rows] = np.where(first, x, self.ew_mean[rows] + self.alpha * ew_delta)
+        self.ew_var[rows] = np.where(first, 0.0, (1 - self.alpha) * (self.ew_var[rows] + self.alpha * ew_delta ** 2))
+        self.count[rows] += 1
+        return report
+
+    def update(self, aggregates, z_threshold=Z_WARNING, min_periods=MIN_PERIODS):
+        """Fold in aggregates for the days after last_day, in day order; returns the anomalies found"""
+        aggregates = aggregates[aggregates['day'] > self.last_day]
+        rows = self._rows(self.series_keys(aggregates['metric'], aggregates['dimension'], aggregates['member']))
+        reports = []
+        for day, positions in pd.Series(np.arange(len(aggregates))).groupby(aggregates['day'].to_numpy()):
+            additive = self.additive()
+            series = rows[positions.to_numpy()]
+            values = np.where(additive, 0.0, np.nan)
+            values[series] = aggregates['value'].to_numpy()[positions.to_numpy()]
+            # Additive series only start counting zero days once they have been seen
+            observed = (additive & (self.count > 0)) | np.isin(np.arange(len(self.keys)), series)
+            report = self.step(values, observed, z_threshold, min_periods)
+            reports.append(pd.DataFrame(report).assign(day=day))
+            self.last_day = int(day)
+        if not reports:
+            return pd.DataFrame()
+        anomalies = pd.concat(reports, ignore_index=True)
+        labels = self.describe(anomalies['row'].to_numpy())
+        anomalies = pd.concat([anomalies.drop(columns='row'), labels], axis=1)
+        anomalies['date'] = anomalies['day'].to_numpy().astype('datetime64[D]').astype(str)
+        peak = np.maximum(anomalies['z_score'].abs(), anomalies['ewma_z_score'].abs())
+        anomalies['severity'] = np.where(peak >= Z_CRITICAL, 'Critical', 'Warning')
+        anomalies['direction'] = np.where(anomalies['z_score'] + anomalies['ewma_z_score'] >= 0, 'High', 'Low')
+        return anomalies[['date', 'metric', 'dimension', 'member', 'value', 'rolling_mean', 'rolling_std',
+                          'z_score', 'ewma', 'ewma_z_score', 'severity', 'direction']].round(3)
+
+    def resync(self):
+        """Recompute the rolling mean and M2 exactly from the ring buffers (bounds floating-point drift)"""
+        size = np.minimum(self.count, self.window)
+        filled = np.arange(self.window)[None, :] < size[:, None]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            self.mean = np.where(size > 0, np.where(filled, self.ring, 0).sum(axis=1) / size, 0)
+        self.m2 = np.where(filled, (self.ring - self.mean[:, None]) ** 2, 0).sum(axis=1)
+
+    def save(self, path):
+        """Persist series state and the last folded day"""
+        np.savez(path, keys=self.keys, ring=self.ring, count=self.count, ew_mean=self.ew_mean,
+                 ew_var=self.ew_var, window=self.window, alpha=self.alpha, last_day=self.last_day,
+                 metrics=np.array(METRIC_NAMES, dtype=str),
+                 **{f'members_{d}': np.array(self.members[d], dtype=str) for d in DIMENSIONS})
+
+    @classmethod
+    def load(cls, path):
+        """Restore a detector written by save()"""
+        state = np.load(path)
+        if state['metrics'].tolist() != METRIC_NAMES:
+            raise ValueError(f"{path} was written for a different metric list; rebuild it")
+        detector = cls(window=int(state['window']))
+        detector.alpha = float(state['alpha'])
+        detector.keys = state['keys']
+        detector.ring = state['ring']
+        detector.count = state['count']
+        detector.ew_mean = state['ew_mean']
+        detector.ew_var = state['ew_var']
+        detector.last_day = int(state['last_day'])
+        detector.members = {d: state[f'members_{d}'].tolist() for d in DIMENSIONS}
+        detector.resync()
+        return detector
+
+def check_rolling(detector, aggregates, samples=200):
+    """Compare the state of sampled series with a full-history pandas rolling recompute
+
+    Returns (series checked, mismatches).
+    """
+    keys = detector.series_keys(aggregates['metric'], aggregates['dimension'], aggregates['member'])
+    history = pd.DataFrame({'key': keys, 'day': aggregates['day'].to_numpy(), 'value': aggregates['value'].to_numpy()})
+    rows = np.random.default_rng(0).choice(len(detector.keys), min(samples, len(detector.keys)), replace=False)
+    additive = detector.additive()
+    first_day = int(history['day'].min())
+    mismatches = 0
+    for row in rows.tolist():
+        series = history[history['key'] == detector.keys[row]].set_index('day')['value']
+        if additive[row]:
+            series = series.reindex(np.arange(int(series.index.min()), detector.last_day + 1), fill_value=0.0)
+        series = series[series.index >= first_day].sort_index()
+        tail = series.iloc[-detector.window:]
+        expected_std = tail.std() if len(tail) > 1 else np.nan
+        actual_std = np.sqrt(detector.m2[row] / (min(detector.count[row], detector.window) - 1)) \
+            if detector.count[row] > 1 else np.nan
+        if abs(tail.mean() - detector.mean[row]) > 1e-6 * max(1, abs(tail.mean())) or \
+                not np.isclose(expected_std, actual_std, rtol=1e-6, atol=1e-6, equal_nan=True):
+            mismatches += 1
+    return len(rows), mismatches
+
+def to_day(value):
+    """Days since the epoch of a date or timestamp"""
+    return int(pd.Timestamp(str(value)).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+def order_day_range(conn):
+    """Days of the first and latest orders, or (-1, -1) without orders"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MIN(order_date), MAX(order_date) FROM orders")
+    first, latest = cursor.fetchone()
+    cursor.close()
+    return (to_day(first), to_day(latest)) if latest is not None else (-1, -1)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Flag KPI anomalies from per-series rolling state')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read from MySQL instead of SQLite')
+    parser.add_argument('--through', help='YYYY-MM-DD, last day to fold in (default: date of the latest order)')
+    parser.add_argument('--state', default=STATE_PATH, help='persisted series state, updated incrementally')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved state and replay all history')
+    parser.add_argument('--z-threshold', type=float, default=Z_WARNING)
+    parser.add_argument('--min-periods', type=int, default=MIN_PERIODS)
+    parser.add_argument('--output', default=OUTPUT_PATH, help='anomalies found in the days folded in')
+    parser.add_argument('--check', action='store_true', help='compare sampled series with a full recompute')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Anomaly Detection")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+    else:
+        conn = sqlite3.connect(args.db_path)
+    placeholder = '%s' if args.mysql else '?'
+    detector = AnomalyDetector.load(args.state) if Path(args.state).exists() and not args.rebuild \
+        else AnomalyDetector()
+    first_day, latest_day = order_day_range(conn)
+    through = int(np.datetime64(args.through, 'D').astype(np.int64)) if args.through else latest_day
+    since = max(detector.last_day + 1, first_day)
+    if through < since:
+        print(f"  ! Nothing to fold in: state is already through {np.datetime64(detector.last_day, 'D')}")
+        conn.close()
+        return
+
+    start = time.perf_counter()
+    aggregates = daily_aggregates(conn, since, through, placeholder)
+    print(f"  ✓ Loaded {len(aggregates):,} series-day aggregates for {np.datetime64(since, 'D')} .. "
+          f"{np.datetime64(through, 'D')} in {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    anomalies = detector.update(aggregates, args.z_threshold, args.min_periods)
+    print(f"  ✓ Updated {len(detector.keys):,} series over {through - since + 1:,} days "
+          f"in {time.perf_counter() - start:.2f}s")
+    detector.save(args.state)
+
+    if len(anomalies):
+        anomalies.to_csv(args.output, index=False)
+        print(f"  ✓ {len(anomalies):,} anomalies ({int((anomalies['severity'] == 'Critical').sum()):,} critical) "
+              f"saved to {args.output}")
+        latest = anomalies[anomalies['date'] == anomalies['date'].max()]
+        print(f"\nAnomalies on {latest['date'].iloc[0]}:")
+        print(latest.sort_values('z_score', key=np.abs, ascending=False).head(15).to_string(index=False))
+    else:
+        print("  ✓ No anomalies")
+
+    if args.check:
+        if args.rebuild or since == first_day:
+            history = aggregates
+        else:
+            history = daily_aggregates(conn, first_day, through, placeholder)
+        checked, mismatches = check_rolling(detector, history)
+        print(f"\n  {'✓' if mismatches == 0 else '✗'} {checked} series against a full rolling recompute, "
+              f"{mismatches} mismatches")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,234 @@
+"""
+QuickShop Analytics - Basket Co-occurrence Engine
+Sparse order x product matrices for cross-sell pairs, support, confidence and lift
+"""
+
+import sqlite3
+import argparse
+import time
+import re
+from pathlib import Path
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from sql_queries import get_query
+
+DB_PATH = 'quickshop.db'
+STATE_PATH = 'basket_state.npz'
+ORDERS_PER_BLOCK = 500_000
+MIN_COUNT = 10
+TOP_K = 5
+
+def sql_round(values, decimals):
+    """ROUND() as SQL does it: halves away from zero, tolerant of binary float error"""
+    scale = 10.0 ** decimals
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5 + 1e-9) / scale
+
+class CooccurrenceEngine:
+    """Running pair statistics over all orders up to last_order_id
+
+    pair_orders[a, b] counts orders containing both products (its diagonal is the
+    number of orders containing each product), pair_rows counts joined item-row pairs
+    and pair_value sums oi1.total_price + oi2.total_price over those rows, which is
+    what query 3.4 averages.
+    """
+
+    def __init__(self, num_products=0):
+        empty = sparse.csr_matrix((num_products, num_products), dtype=np.float64)
+        self.pair_orders = empty.copy()
+        self.pair_rows = empty.copy()
+        self.pair_value = empty.copy()
+        self.num_orders = 0
+        self.last_order_id = 0
+
+    @property
+    def num_products(self):
+        return self.pair_orders.shape[0]
+
+    def _resize(self, num_products):
+        if num_products > self.num_products:
+            for name in ['pair_orders', 'pair_rows', 'pair_value']:
+                matrix = getattr(self, name).tocoo()
+                setattr(self, name, sparse.csr_matrix((matrix.data, (matrix.row, matrix.col)),
+                                                      shape=(num_products, num_products)))
+
+    def add_items(self, order_ids, product_ids, total_prices):
+        """Fold a block of order items into the counts; every order must be complete in the block"""
+        if len(order_ids) == 0:
+            return
+        order_ids = np.asarray(order_ids, dtype=np.int64)
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        self._resize(int(product_ids.max()) + 1)
+        orders, rows = np.unique(order_ids, return_inverse=True)
+        shape = (len(orders), self.num_products)
+        # Duplicate (order, product) entries are summed: N holds item rows, V their prices
+        counts = sparse.csr_matrix((np.ones(len(rows)), (rows, product_ids)), shape=shape)
+        values = sparse.csr_matrix((np.asarray(total_prices, dtype=np.float64), (rows, product_ids)), shape=shape)
+        present = counts.copy()
+        present.data[:] = 1.0
+
+        self.pair_orders = self.pair_orders + (present.T @ present).tocsr()
+        self.pair_rows = self.pair_rows + (counts.T @ counts).tocsr()
+        self.pair_value = self.pair_value + (values.T @ counts + counts.T @ values).tocsr()
+        self.num_orders += len(orders)
+        self.last_order_id = max(self.last_order_id, int(orders[-1]))
+
+    def update_from_db(self, conn, orders_per_block=ORDERS_PER_BLOCK, placeholder='?'):
+        """Read order items past last_order_id in whole-order blocks; returns items added"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM order_items")
+        high = int(cursor.fetchone()[0])
+        added = 0
+        for low in range(self.last_order_id, high, orders_per_block):
+            cursor.execute(f"""
+                SELECT order_id, product_id, total_price FROM order_items
+                WHERE order_id > {placeholder} AND order_id <= {placeholder}""",
+                           (low, min(low + orders_per_block, high)))
+            block = np.array(cursor.fetchall(), dtype=np.float64).reshape(-1, 3)
+            self.add_items(block[:, 0], block[:, 1], block[:, 2])
+            added += len(block)
+        self.last_order_id = max(self.last_order_id, high)
+        cursor.close()
+        return added
+
+    def pairs(self, min_count=1):
+        """Product pairs (product_a < product_b) bought together in at least min_count orders"""
+        together = sparse.triu(self.pair_orders, k=1).tocoo()
+        keep = together.data >= min_count
+        a, b, count = together.row[keep], together.col[keep], together.data[keep]
+        product_orders = self.pair_orders.diagonal()
+        pair_rows = np.asarray(self.pair_rows[a, b]).ravel()
+        pair_value = np.asarray(self.pair_value[a, b]).ravel()
+        df = pd.DataFrame({
+            'product_a': a,
+            'product_b': b,
+            'times_bought_together': count.astype(np.int64),
+            'avg_combined_value': sql_round(pair_value / pair_rows, 2),
+            'support': count / max(self.num_orders, 1),
+            'confidence_a_to_b': count / product_orders[a],
+            'confidence_b_to_a': count / product_orders[b],
+            'lift': count * self.num_orders / (product_orders[a] * product_orders[b])
+        })
+        return df.sort_values(['times_bought_together', 'product_a', 'product_b'],
+                              ascending=[False, True, True]).reset_index(drop=True)
+
+    def top_partners(self, k=TOP_K, min_count=MIN_COUNT, by='lift'):
+        """The k best partners of every product ranked by lift, confidence or times_bought_together"""
+        together = self.pair_orders.tocoo()
+        keep = (together.row != together.col) & (together.data >= min_count)
+        product, partner, count = together.row[keep], together.col[keep], together.data[keep]
+        product_orders = self.pair_orders.diagonal()
+        metrics = {
+            'times_bought_together': count,
+            'confidence': count / product_orders[product],
+            'lift': count * self.num_orders / (product_orders[product] * product_orders[partner])
+        }
+        order = np.lexsort((partner, -metrics[by], product))
+        product, partner = product[order], partner[order]
+        # Position within each product's run of partners
+        starts = np.flatnonzero(np.r_[True, product[1:] != product[:-1]])
+        rank = np.arange(len(product)) - np.repeat(starts, np.diff(np.r_[starts, len(product)]))
+        top = rank < k
+        return pd.DataFrame({
+            'product_id': product[top],
+            'partner_id': partner[top],
+            'rank': rank[top] + 1,
+            'times_bought_together': count[order][top].astype(np.int64),
+            'confidence': metrics['confidence'][order][top],
+            'lift': metrics['lift'][order][top]
+        })
+
+    def save(self, path):
+        """Persist the counts and watermark to an .npz file"""
+        arrays = {'num_orders': self.num_orders, 'last_order_id': self.last_order_id}
+        for name in ['pair_orders', 'pair_rows', 'pair_value']:
+            matrix = getattr(self, name)
+            arrays.update({f'{name}_data': matrix.data, f'{name}_indices': matrix.indices,
+                           f'{name}_indptr': matrix.indptr})
+        np.savez_compressed(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Restore an engine written by save()"""
+        state = np.load(path)
+        engine = cls()
+        num_products = len(state['pair_orders_indptr']) - 1
+        for name in ['pair_orders', 'pair_rows', 'pair_value']:
+            setattr(engine, name, sparse.csr_matrix(
+                (state[f'{name}_data'], state[f'{name}_indices'], state[f'{name}_indptr']),
+                shape=(num_products, num_products)))
+        engine.num_orders = int(state['num_orders'])
+        engine.last_order_id = int(state['last_order_id'])
+        return engine
+
+def check_against_sql(conn, engine):
+    """Compare engine pairs with query 3.4 (without its LIMIT); returns (mismatches, SQL pairs)
+
+    Counts must match exactly. Rounded averages may differ by one cent on exact
+    half-cent ties, where the result depends on floating-point summation order.
+    """
+    query = re.sub(r'\s+LIMIT \d+;$', ';', get_query('3.4')['sql'])
+    expected = pd.read_sql_query(query, conn)
+    names = pd.read_sql_query("SELECT product_id, product_name FROM products", conn)
+    names = names.set_index('product_id')['product_name']
+    actual = engine.pairs(MIN_COUNT)
+    actual = actual.assign(product_a=actual['product_a'].map(names), product_b=actual['product_b'].map(names))
+    merged = expected.merge(actual, on=['product_a', 'product_b'], how='outer', suffixes=('_sql', ''))
+    mismatched = (merged['times_bought_together_sql'] != merged['times_bought_together']) | \
+        ((merged['avg_combined_value_sql'] - merged['avg_combined_value']).abs() > 0.0101)
+    return int(mismatched.sum()), len(expected)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Cross-sell pairs from a sparse order x product matrix')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read from the MySQL database in load_data_mysql.py')
+    parser.add_argument('--state', default=STATE_PATH, help='persisted counts, updated incrementally')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved state and recount all orders')
+    parser.add_argument('--top-k', type=int, default=TOP_K)
+    parser.add_argument('--min-count', type=int, default=MIN_COUNT)
+    parser.add_argument('--rank-by', choices=['lift', 'confidence', 'times_bought_together'], default='lift')
+    parser.add_argument('--output', default='cross_sell_partners.csv')
+    parser.add_argument('--check', action='store_true', help='compare pairs and counts with SQL query 3.4')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Basket Co-occurrence")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn, placeholder = create_connection(), '%s'
+        if conn is None:
+            return
+    else:
+        conn, placeholder = sqlite3.connect(args.db_path), '?'
+
+    if Path(args.state).exists() and not args.rebuild:
+        engine = CooccurrenceEngine.load(args.state)
+        print(f"  ✓ Loaded state through order {engine.last_order_id:,}")
+    else:
+        engine = CooccurrenceEngine()
+
+    start = time.perf_counter()
+    added = engine.update_from_db(conn, placeholder=placeholder)
+    elapsed = time.perf_counter() - start
+    print(f"  ✓ Added {added:,} order items in {elapsed:.2f}s ({added / max(elapsed, 1e-9):,.0f} items/s)")
+    engine.save(args.state)
+
+    partners = engine.top_partners(args.top_k, args.min_count, args.rank_by)
+    partners.to_csv(args.output, index=False)
+    print(f"  ✓ Saved top {args.top_k} partners for {partners['product_id'].nunique():,} products to {args.output}")
+
+    print("\nMost frequent pairs:")
+    print(engine.pairs(args.min_count).head(10).to_string(index=False))
+
+    if args.check:
+        mismatches, expected = check_against_sql(conn, engine)
+        print(f"\n  {'✓' if mismatches == 0 else '✗'} {expected:,} SQL pairs, {mismatches} mismatches")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
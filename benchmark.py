@@ -0,0 +1,242 @@
+"""
+QuickShop Analytics - Benchmark Suite
+Times generation, loading and every analytics query at TPC-H style scale factors
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from sql_queries import parse_queries, get_query
+
+REPO_DIR = Path(__file__).parent
+SCALE_FACTORS = [0.1, 1, 10, 100]  # multiples of the base 25,000-order dataset
+WORK_DIR = 'benchmark_work'
+RESULTS_PATH = 'benchmark_results.json'
+BASELINE_PATH = 'benchmark_baseline.json'
+REGRESSION_THRESHOLD = 0.25  # fractional slowdown (or RSS growth) that fails the run
+MIN_SECONDS = 0.1  # steps faster than this in both runs are treated as noise
+QUERY_REPEATS = 3
+TABLES = ['local_shops', 'products', 'customers', 'orders', 'order_items',
+          'deliveries', 'inventory', 'promotions']
+
+def run_measured(command, env=None):
+    """Run a command; returns (seconds, peak RSS in MB of it and its reaped children, stdout)"""
+    start = time.perf_counter()
+    proc = subprocess.Popen(command, cwd=REPO_DIR, env=env, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, text=True)
+    output = proc.stdout.read()
+    # wait4 gives this child's own rusage, unlike RUSAGE_CHILDREN which accumulates
+    _, status, usage = os.wait4(proc.pid, 0)
+    seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    proc.stdout.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(map(str, command))} failed:\n{output[-2000:]}")
+    return seconds, usage.ru_maxrss / 1024, output
+
+def count_csv_rows(data_dir):
+    """Data rows across all CSV files (newlines minus one header each)"""
+    total = 0
+    for path in Path(data_dir).rglob('*.csv'):
+        with open(path, 'rb') as f:
+            total += sum(block.count(b'\n') for block in iter(lambda: f.read(1 << 24), b'')) - 1
+    return total
+
+def count_db_rows(db_path):
+    """Rows across the QuickShop tables of a SQLite database"""
+    conn = sqlite3.connect(db_path)
+    total = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in TABLES)
+    conn.close()
+    return total
+
+def result(scale_factor, step, seconds, rows, peak_rss_mb, **extra):
+    """One benchmark record"""
+    return dict(scale_factor=scale_factor, step=step, seconds=round(seconds, 4), rows=rows,
+                rows_per_second=round(rows / max(seconds, 1e-9), 1), peak_rss_mb=round(peak_rss_mb, 1), **extra)
+
+def reset_mysql_tables():
+    """Empty the MySQL tables so a full load starts from scratch"""
+    from load_data_mysql import create_connection
+    connection = create_connection()
+    cursor = connection.cursor()
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for table in TABLES:
+        cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+    cursor.close()
+    connection.close()
+
+def run_query(engine, db_path, number, repeats):
+    """Child-process entry point: time one query and print JSON"""
+    sql = get_query(number)['sql']
+    if engine == 'mysql':
+        from load_data_mysql import create_connection
+        conn = create_connection()
+    else:
+        conn = sqlite3.connect(db_path)
+    timings, rows = [], 0
+    for _ in range(repeats):
+        cursor = conn.cursor()
+        start = time.perf_counter()
+        cursor.execute(sql)
+        rows = len(cursor.fetchall())
+        timings.append(time.perf_counter() - start)
+        cursor.close()
+    conn.close()
+    print(json.dumps({'timings': timings, 'rows': rows}))
+
+def benchmark_queries(scale_factor, engine, db_path, queries, repeats, fact_rows):
+    """Time each named query in its own process; rows/s is measured against the fact rows"""
+    results = []
+    for query in queries:
+        seconds, rss, output = run_measured([sys.executable, 'benchmark.py', '--run-query', query['number'],
+                                             '--engine', engine, '--db-path', str(db_path),
+                                             '--repeat', str(repeats)])
+        measured = json.loads(output.strip().splitlines()[-1])
+        best = sorted(measured['timings'])[len(measured['timings']) // 2]
+        results.append(result(scale_factor, f"query_{engine}:{query['name']}", best, fact_rows, rss,
+                              result_rows=measured['rows']))
+    return results
+
+def benchmark_scale_factor(scale_factor, args, queries):
+    """Generate, load and query one scale factor"""
+    sf_dir = Path(args.work_dir).resolve() / f'sf{scale_factor:g}'
+    data_dir, db_path = sf_dir / 'data', sf_dir / 'quickshop.db'
+    data_dir.mkdir(parents=True, exist_ok=True)
+    results = []
+
+    if not (args.reuse_data and (data_dir / 'orders.csv').exists()):
+        seconds, rss, _ = run_measured([sys.executable, 'generate_dataset.py', '--scale-factor', str(scale_factor),
+                                        '--output-dir', str(data_dir), '--workers', str(args.workers)])
+        results.append(result(scale_factor, 'generate', seconds, count_csv_rows(data_dir), rss))
+        report(results[-1])
+    csv_rows = count_csv_rows(data_dir)
+
+    seconds, rss, _ = run_measured([sys.executable, 'load_data.py', '--bulk', '--data-dir', str(data_dir),
+                                    '--db-path', str(db_path)])
+    results.append(result(scale_factor, 'load_sqlite', seconds, count_db_rows(db_path), rss))
+    report(results[-1])
+    conn = sqlite3.connect(db_path)
+    fact_rows = sum(conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ['orders', 'order_items', 'deliveries'])
+    conn.close()
+
+    engines = ['sqlite']
+    if args.mysql:
+        reset_mysql_tables()
+        env = dict(os.environ, QUICKSHOP_DATA_DIR=str(data_dir))
+        seconds, rss, _ = run_measured([sys.executable, 'load_data_mysql.py', '--fast',
+                                        '--workers', str(args.workers)], env=env)
+        results.append(result(scale_factor, 'load_mysql', seconds, csv_rows, rss))
+        report(results[-1])
+        engines.append('mysql')
+
+    for engine in engines:
+        for record in benchmark_queries(scale_factor, engine, db_path, queries, args.repeat, fact_rows):
+            results.append(record)
+            report(record)
+    return results
+
+def report(record):
+    """Print one benchmark record"""
+    print(f"  ✓ SF{record['scale_factor']:<6g} {record['step'][:58]:<58} {record['seconds']:9.3f}s "
+          f"{record['rows_per_second']:>14,.0f} rows/s {record['peak_rss_mb']:8.0f} MB")
+
+def compare_to_baseline(results, baseline, threshold, min_seconds):
+    """Regressions of wall time or peak RSS beyond threshold; returns messages"""
+    previous = {(r['scale_factor'], r['step']): r for r in baseline['results']}
+    regressions = []
+    for record in results:
+        before = previous.get((record['scale_factor'], record['step']))
+        if before is None:
+            continue
+        if max(record['seconds'], before['seconds']) >= min_seconds and \
+                record['seconds'] > before['seconds'] * (1 + threshold):
+            regressions.append(f"SF{record['scale_factor']:g} {record['step']}: "
+                               f"{before['seconds']:.3f}s -> {record['seconds']:.3f}s")
+        if record['peak_rss_mb'] > before['peak_rss_mb'] * (1 + threshold):
+            regressions.append(f"SF{record['scale_factor']:g} {record['step']}: "
+                               f"{before['peak_rss_mb']:.0f} MB -> {record['peak_rss_mb']:.0f} MB peak RSS")
+    return regressions
+
+def run_metadata():
+    """Machine and revision the numbers were taken on"""
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                  capture_output=True, text=True).stdout.strip()
+    except OSError:
+        revision = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sqlite': sqlite3.sqlite_version
+    }
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Benchmark generation, loading and queries by scale factor')
+    parser.add_argument('--scale-factors', type=float, nargs='+', default=SCALE_FACTORS)
+    parser.add_argument('--work-dir', default=WORK_DIR, help='datasets and databases per scale factor')
+    parser.add_argument('--output', default=RESULTS_PATH, help='JSON results file')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='results to compare against, if present')
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help='allowed fractional increase in wall time or peak RSS')
+    parser.add_argument('--min-seconds', type=float, default=MIN_SECONDS,
+                        help='ignore timing changes of steps faster than this')
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the new baseline')
+    parser.add_argument('--queries', nargs='*', help='only these query numbers (default: all)')
+    parser.add_argument('--repeat', type=int, default=QUERY_REPEATS, help='runs per query; the median is kept')
+    parser.add_argument('--workers', type=int, default=1, help='generator processes and MySQL load workers')
+    parser.add_argument('--reuse-data', action='store_true', help='skip generation when a dataset exists')
+    parser.add_argument('--mysql', action='store_true', help='also benchmark the MySQL loader and queries')
+    parser.add_argument('--run-query', help=argparse.SUPPRESS)
+    parser.add_argument('--engine', default='sqlite', help=argparse.SUPPRESS)
+    parser.add_argument('--db-path', help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    if args.run_query:
+        run_query(args.engine, args.db_path, args.run_query, args.repeat)
+        return
+
+    print("QuickShop Analytics - Benchmark Suite")
+    print("=" * 60)
+    queries = [q for q in parse_queries() if not args.queries or q['number'] in args.queries]
+    results = []
+    for scale_factor in args.scale_factors:
+        print(f"\nScale factor {scale_factor:g}")
+        results.extend(benchmark_scale_factor(scale_factor, args, queries))
+
+    run = {'meta': run_metadata(), 'results': results}
+    Path(args.output).write_text(json.dumps(run, indent=2))
+    print(f"\nResults written to {args.output}")
+
+    exit_code = 0
+    if args.update_baseline:
+        Path(args.baseline).write_text(json.dumps(run, indent=2))
+        print(f"Baseline updated: {args.baseline}")
+    elif Path(args.baseline).exists():
+        regressions = compare_to_baseline(results, json.loads(Path(args.baseline).read_text()),
+                                          args.threshold, args.min_seconds)
+        for message in regressions:
+            print(f"  ✗ Regression: {message}")
+        if regressions:
+            exit_code = 1
+        else:
+            print(f"  ✓ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+    sys.exit(exit_code)
+
+if __name__ == "__main__":
+    main()
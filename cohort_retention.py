@@ -0,0 +1,438 @@
+"""
+QuickShop Analytics - Cohort Retention Engine
+Per-customer activity bitmaps and popcount-based retention matrices by cohort
+"""
+
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from columnar_cache import open_table
+from generate_dataset import START_DATE
+
+DB_PATH = 'quickshop.db'
+STATE_PATH = 'cohort_state.npz'
+OUTPUT_PATH = 'cohort_retention.csv'
+MATRIX_PATH = 'cohort_retention_matrix.csv'
+ORDERS_PER_BLOCK = 1_000_000
+HORIZONS = [30, 60, 90]
+PERIOD_DAYS = 30
+NUM_PERIODS = 12
+GRAINS = ['registration_month', 'city', 'customer_segment']
+UNIT_DAYS = {'day': 1, 'week': 7}
+SECONDS_PER_DAY = 86_400
+
+# Reference for --check: registration-month cohorts, share of customers with an order
+# 1..h days after the registration day, among customers whose h days have all passed
+RETENTION_REFERENCE_SQL = """
+WITH cohort_customers AS (
+    SELECT customer_id, strftime('%Y-%m', registration_date) as cohort,
+           julianday(DATE(registration_date)) as registration_day
+    FROM customers
+),
+returns AS (
+    SELECT c.customer_id, MIN(julianday(DATE(o.order_date)) - c.registration_day) as first_return
+    FROM cohort_customers c
+    JOIN orders o ON o.customer_id = c.customer_id
+    WHERE julianday(DATE(o.order_date)) - c.registration_day >= 1
+    GROUP BY c.customer_id
+)
+SELECT
+    c.cohort,
+    COUNT(*) as customers,
+    {columns}
+FROM cohort_customers c
+LEFT JOIN returns r ON r.customer_id = c.customer_id
+GROUP BY c.cohort
+ORDER BY c.cohort
+"""
+
+class CohortEngine:
+    """Activity bitmaps (one bit per day or week since the start date) for every customer
+
+    Row customer_id of the bitmap holds n_words uint64 words; bit p is set when the
+    customer placed an order in unit p. Orders are folded in past an order_id
+    watermark, so new days are appended without rescanning. Retention windows
+    are relative to each customer's registration, so rows are shifted into
+    alignment once and every window is then a masked OR / popcount over the
+    same few words for all customers.
+    """
+
+    def __init__(self, start_date=START_DATE, grain='day'):
+        self.start_day = np.datetime64(start_date, 'D').astype(np.int64)
+        self.unit_days = UNIT_DAYS[grain]
+        self.grain = grain
+        self.bitmap = np.zeros((0, 1), dtype=np.uint64)
+        self.registration_day = np.zeros(0, dtype=np.int64)
+        self.known = np.zeros(0, dtype=bool)
+        self.city = np.zeros(0, dtype=np.int32)
+        self.segment = np.zeros(0, dtype=np.int32)
+        self.cities, self.segments = [], []
+        self.last_order_day = self.start_day
+        self.last_order_id = 0
+        self.skipped_orders = 0
+        self._layout = None
+        self._aligned = None
+        self._cohorts = {}
+
+    def _grow(self, rows, units):
+        rows = max(rows, self.bitmap.shape[0])
+        words = max(units // 64 + 2, self.bitmap.shape[1])  # one spare zero word past the last unit
+        if (rows, words) != self.bitmap.shape:
+            bitmap = np.zeros((rows, words), dtype=np.uint64)
+            bitmap[:self.bitmap.shape[0], :self.bitmap.shape[1]] = self.bitmap
+            self.bitmap = bitmap
+            extra = rows - len(self.known)
+            self.registration_day = np.concatenate([self.registration_day, np.zeros(extra, dtype=np.int64)])
+            self.known = np.concatenate([self.known, np.zeros(extra, dtype=bool)])
+            self.city = np.concatenate([self.city, np.zeros(extra, dtype=np.int32)])
+            self.segment = np.concatenate([self.segment, np.zeros(extra, dtype=np.int32)])
+
+    def unit(self, days):
+        """Bitmap position of a day number (days since 1970-01-01)"""
+        return (np.asarray(days, dtype=np.int64) - self.start_day) // self.unit_days
+
+    def add_customers(self, customer_ids, registration_seconds, cities, segments):
+        """Register customers and their cohort attributes"""
+        if len(customer_ids) == 0:
+            return
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        self._grow(int(customer_ids.max()) + 1, 0)
+        self.registration_day[customer_ids] = np.asarray(registration_seconds, dtype=np.int64) // SECONDS_PER_DAY
+        self.known[customer_ids] = True
+        self.city[customer_ids] = dictionary_codes(cities, self.cities)
+        self.segment[customer_ids] = dictionary_codes(segments, self.segments)
+        self._layout = None
+        self._aligned = None
+        self._cohorts = {}
+
+    def add_orders(self, order_ids, customer_ids, order_seconds):
+        """Set the activity bit of each order's customer and unit"""
+        if len(order_ids) == 0:
+            return
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        days = np.asarray(order_seconds, dtype=np.int64) // SECONDS_PER_DAY
+        units = self.unit(days)
+        keep = units >= 0
+        self.skipped_orders += int((~keep).sum())
+        customer_ids, units = customer_ids[keep], units[keep]
+        if len(units):
+            self._grow(int(customer_ids.max()) + 1, int(units.max()))
+            flat = self.bitmap.reshape(-1)
+            np.bitwise_or.at(flat, customer_ids * self.bitmap.shape[1] + (units >> 6),
+                             np.left_shift(np.uint64(1), (units & 63).astype(np.uint64)))
+            self.last_order_day = max(self.last_order_day, int(days[keep].max()))
+        self.last_order_id = max(self.last_order_id, int(np.max(order_ids)))
+        self._aligned = None
+
+    def update_from_db(self, conn, orders_per_block=ORDERS_PER_BLOCK, placeholder='?'):
+        """Fold in new customers and orders past the watermarks; returns orders added"""
+        cursor = conn.cursor()
+        known = np.flatnonzero(self.known)
+        cursor.execute(f"""
+            SELECT customer_id, registration_date, city, customer_segment FROM customers
+            WHERE customer_id > {placeholder}""", (int(known[-1]) if len(known) else 0,))
+        customers = pd.DataFrame(cursor.fetchall(),
+                                 columns=['customer_id', 'registration_date', 'city', 'customer_segment'])
+        self.add_customers(customers['customer_id'].to_numpy(), to_seconds(customers['registration_date']),
+                           customers['city'].to_numpy(), customers['customer_segment'].to_numpy())
+
+        cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+        high = int(cursor.fetchone()[0])
+        added = 0
+        for low in range(self.last_order_id, high, orders_per_block):
+            cursor.execute(f"""
+                SELECT order_id, customer_id, order_date FROM orders
+                WHERE order_id > {placeholder} AND order_id <= {placeholder}""",
+                           (low, min(low + orders_per_block, high)))
+            block = pd.DataFrame(cursor.fetchall(), columns=['order_id', 'customer_id', 'order_date'])
+            self.add_orders(block['order_id'].to_numpy(), block['customer_id'].to_numpy(),
+                            to_seconds(block['order_date']))
+            added += len(block)
+        self.last_order_id = max(self.last_order_id, high)
+        cursor.close()
+        return added
+
+    def update_from_cache(self, cache_dir):
+        """Fold in new customers and orders from the columnar cache; returns orders added"""
+        customers = open_table(cache_dir, 'customers')
+        known = np.flatnonzero(self.known)
+        new = customers.raw('customer_id') > (known[-1] if len(known) else 0)
+        self.add_customers(customers.raw('customer_id')[new], customers.raw('registration_date')[new],
+                           np.array(customers.columns['city']['dictionary'])[customers.raw('city')[new]],
+                           np.array(customers.columns['customer_segment']['dictionary'])
+                           [customers.raw('customer_segment')[new]])
+        orders = open_table(cache_dir, 'orders')
+        order_ids = orders.raw('order_id')
+        new = order_ids > self.last_order_id
+        self.add_orders(order_ids[new], orders.raw('customer_id')[new], orders.raw('order_date')[new])
+        return int(new.sum())
+
+    def by_registration(self):
+        """(customer_ids, registration days) of known customers in registration order
+
+        Eligibility for a window is "registered on or before a day", so in this
+        order the eligible customers of every window are a prefix of the rows.
+        """
+        if self._layout is None:
+            customer_ids = np.flatnonzero(self.known)
+            registered = self.registration_day[customer_ids]
+            key = registered - registered.min() if len(registered) else registered
+            if len(key) and key.max() < 1 << 16:
+                key = key.astype(np.uint16)  # radix sort
+            order = np.argsort(key, kind='stable')
+            self._layout = (customer_ids[order], registered[order])
+        return self._layout
+
+    def aligned(self, units):
+        """Bitmaps in registration order, shifted so bit r of a row is unit r after that
+        customer's registration unit
+
+        Returned as (words, customers) so every window below works on contiguous
+        word columns shared by all customers. Cached until new data arrives.
+        """
+        words = (units + 63) // 64
+        if self._aligned is None or self._aligned.shape[0] < words:
+            customer_ids, registered = self.by_registration()
+            width = self.bitmap.shape[1]
+            flat = self.bitmap.reshape(-1)
+            offset = customer_ids * width
+            shift = self.unit(registered)
+            # Aligned word j is the absolute words base + j and base + j + 1 joined at a per-row bit offset
+            base, bit = shift >> 6, (shift & 63).astype(np.uint64)
+            carry_shift = (np.uint64(64) - bit) & np.uint64(63)
+            carry_mask = np.where(bit > 0, ~np.uint64(0), np.uint64(0))
+            out = np.empty((words, len(customer_ids)), dtype=np.uint64)
+            low = gather_word(flat, offset, base, width)
+            for word in range(words):
+                high = gather_word(flat, offset, base + word + 1, width)
+                out[word] = (low >> bit) | ((high << carry_shift) & carry_mask)
+                low = high
+            self._aligned = out
+        return self._aligned
+
+    def window(self, rows, start, stop, count=False):
+        """For the first rows customers: whether any unit in [start, stop) after registration
+        is active, or with count=True the number of active units (a masked popcount)"""
+        aligned = self.aligned(stop)
+        result = np.zeros(rows, dtype=np.uint16 if count else np.uint64)
+        for word in range(start >> 6, (stop + 63) >> 6):
+            low, high = max(start - 64 * word, 0), min(stop - 64 * word, 64)
+            mask = np.uint64(((1 << high) - 1) ^ ((1 << low) - 1))
+            if count:
+                result += np.bitwise_count(aligned[word, :rows] & mask)
+            else:
+                result |= aligned[word, :rows] & mask
+        return result if count else result != 0
+
+    def eligible_rows(self, days_after, as_of_day):
+        """Number of leading customers (registration order) registered days_after or more days
+        before the as-of date"""
+        return int(np.searchsorted(self.by_registration()[1], as_of_day - days_after, side='right'))
+
+    def cohorts(self, grain):
+        """(cohort code per customer in registration order, cohort labels) for a cohort grain"""
+        if grain not in self._cohorts:
+            self._cohorts[grain] = self._cohort_codes(grain)
+        return self._cohorts[grain]
+
+    def _cohort_codes(self, grain):
+        customer_ids, registered = self.by_registration()
+        if grain == 'registration_month':
+            months = registered.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+            first = months[0] if len(months) else 0
+            present = np.bincount(months - first) > 0
+            codes = (np.cumsum(present) - 1)[months - first]
+            labels = [str(np.datetime64(int(month), 'M')) for month in np.flatnonzero(present) + first]
+            return codes, labels
+        if grain == 'city':
+            return self.city[customer_ids], list(self.cities)
+        if grain == 'customer_segment':
+            return self.segment[customer_ids], list(self.segments)
+        raise ValueError(f"Unknown cohort grain {grain!r}; expected one of {GRAINS}")
+
+    def _as_of_day(self, as_of):
+        return self.last_order_day if as_of is None else int(np.datetime64(as_of, 'D').astype(np.int64))
+
+    def retention(self, grain='registration_month', horizons=HORIZONS, as_of=None):
+        """Per cohort: share of customers with an order 1..h days after registering
+
+        Customers whose h days are not yet over at the as-of date are left out
+        of that horizon's denominator. With week bits, windows are rounded up to
+        whole weeks after the registration week.
+        """
+        as_of_day = self._as_of_day(as_of)
+        codes, labels = self.cohorts(grain)
+        result = pd.DataFrame({'cohort': labels, 'customers': np.bincount(codes, minlength=len(labels))})
+        self.aligned(-(-max(horizons) // self.unit_days) + 1)
+        for horizon in horizons:
+            rows = self.eligible_rows(horizon, as_of_day)
+            count = self.window(rows, 1, -(-horizon // self.unit_days) + 1, count=True)
+            eligible_count, retained_count = cohort_counts(codes[:rows], count > 0, len(labels))
+            active_units = np.bincount(codes[:rows], weights=count, minlength=len(labels))
+            result[f'eligible_{horizon}d'] = eligible_count
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result[f'retention_{horizon}d'] = np.round(100 * retained_count / eligible_count, 2)
+                result[f'active_{self.grain}s_{horizon}d'] = np.round(active_units / eligible_count, 3)
+        return result
+
+    def matrix(self, grain='registration_month', period_days=PERIOD_DAYS, periods=NUM_PERIODS, as_of=None):
+        """Cohort x period retention (%): period k covers days [k * period_days, (k + 1) * period_days)
+        after registration; cells whose period is not over at the as-of date are empty"""
+        as_of_day = self._as_of_day(as_of)
+        codes, labels = self.cohorts(grain)
+        matrix = {}
+        self.aligned(periods * period_days // self.unit_days)
+        for period in range(periods):
+            rows = self.eligible_rows((period + 1) * period_days - 1, as_of_day)
+            active = self.window(rows, period * period_days // self.unit_days,
+                                 (period + 1) * period_days // self.unit_days)
+            eligible_count, retained_count = cohort_counts(codes[:rows], active, len(labels))
+            with np.errstate(invalid='ignore', divide='ignore'):
+                matrix[period] = np.round(100 * retained_count / eligible_count, 2)
+        return pd.DataFrame(matrix, index=pd.Index(labels, name='cohort'))
+
+    def save(self, path):
+        """Persist bitmaps, customer attributes and watermarks"""
+        np.savez(path, bitmap=self.bitmap, registration_day=self.registration_day, known=self.known,
+                 city=self.city, segment=self.segment, cities=np.array(self.cities, dtype=str),
+                 segments=np.array(self.segments, dtype=str), start_day=self.start_day,
+                 unit_days=self.unit_days, grain=self.grain, last_order_day=self.last_order_day,
+                 last_order_id=self.last_order_id, skipped_orders=self.skipped_orders)
+
+    @classmethod
+    def load(cls, path):
+        """Restore an engine written by save()"""
+        state = np.load(path)
+        engine = cls(grain=str(state['grain']))
+        engine.start_day = int(state['start_day'])
+        engine.bitmap = state['bitmap']
+        engine.registration_day = state['registration_day']
+        engine.known = state['known']
+        engine.city = state['city']
+        engine.segment = state['segment']
+        engine.cities = state['cities'].tolist()
+        engine.segments = state['segments'].tolist()
+        engine.last_order_day = int(state['last_order_day'])
+        engine.last_order_id = int(state['last_order_id'])
+        engine.skipped_orders = int(state['skipped_orders'])
+        return engine
+
+def gather_word(flat, offset, word, width):
+    """flat[offset + word] per row, or 0 where word falls outside the row"""
+    values = flat.take(offset + np.clip(word, 0, width - 1))
+    values[(word < 0) | (word >= width)] = 0
+    return values
+
+def cohort_counts(codes, active, num_cohorts):
+    """(customers, active customers) per cohort, from one integer bincount"""
+    counts = np.bincount(codes * 2 + active, minlength=num_cohorts * 2).reshape(num_cohorts, 2)
+    return counts.sum(axis=1), counts[:, 1]
+
+def dictionary_codes(labels, dictionary):
+    """Codes of labels in a growing dictionary list (new labels are appended)"""
+    uniques, inverse = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+    index = {label: code for code, label in enumerate(dictionary)}
+    for label in uniques.tolist():
+        if label not in index:
+            index[label] = len(dictionary)
+            dictionary.append(label)
+    return np.array([index[label] for label in uniques.tolist()], dtype=np.int32)[inverse]
+
+def to_seconds(values):
+    """Timestamps (strings or datetimes) as int64 seconds since the epoch"""
+    return pd.to_datetime(pd.Series(values)).to_numpy('datetime64[s]').view(np.int64)
+
+def check_against_sql(conn, retention, horizons, as_of):
+    """Compare registration-month retention with the SQL reference; returns mismatched cohorts"""
+    columns = ',\n    '.join(
+        f"SUM(c.registration_day + {h} <= julianday(DATE(:as_of))) as eligible_{h}d,\n    "
+        f"ROUND(100.0 * SUM(c.registration_day + {h} <= julianday(DATE(:as_of)) AND r.first_return <= {h}) "
+        f"/ SUM(c.registration_day + {h} <= julianday(DATE(:as_of))), 2) as retention_{h}d"
+        for h in horizons)
+    expected = pd.read_sql_query(RETENTION_REFERENCE_SQL.format(columns=columns), conn,
+                                 params={'as_of': str(as_of)})
+    merged = expected.merge(retention, on='cohort', how='outer', suffixes=('_sql', ''))
+    mismatched = merged['customers_sql'] != merged['customers']
+    for h in horizons:
+        mismatched |= merged[f'eligible_{h}d_sql'] != merged[f'eligible_{h}d']
+        mismatched |= ~np.isclose(merged[f'retention_{h}d_sql'], merged[f'retention_{h}d'], equal_nan=True)
+    return merged.loc[mismatched, 'cohort'].tolist()
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Cohort retention from per-customer activity bitmaps')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read from MySQL instead of SQLite')
+    parser.add_argument('--cache-dir', help='read from this columnar cache instead of the database')
+    parser.add_argument('--cohort', choices=GRAINS, default='registration_month')
+    parser.add_argument('--horizons', type=int, nargs='+', default=HORIZONS, help='retention windows in days')
+    parser.add_argument('--period-days', type=int, default=PERIOD_DAYS, help='period length of the matrix')
+    parser.add_argument('--periods', type=int, default=NUM_PERIODS, help='periods in the matrix')
+    parser.add_argument('--grain', choices=list(UNIT_DAYS), default='day', help='one bit per day or per week')
+    parser.add_argument('--as-of', help='YYYY-MM-DD (default: date of the latest order)')
+    parser.add_argument('--state', default=STATE_PATH, help='persisted bitmaps, updated incrementally')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved state')
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--matrix-output', default=MATRIX_PATH)
+    parser.add_argument('--check', action='store_true', help='compare registration-month retention with SQL')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Cohort Retention")
+    print("=" * 60)
+    engine = None
+    if Path(args.state).exists() and not args.rebuild:
+        engine = CohortEngine.load(args.state)
+        if engine.grain != args.grain:
+            print(f"  ! Saved state uses {engine.grain} bits; rebuilding for {args.grain}")
+            engine = None
+    engine = engine or CohortEngine(grain=args.grain)
+
+    start = time.perf_counter()
+    if args.cache_dir:
+        added = engine.update_from_cache(args.cache_dir)
+    elif args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+        added = engine.update_from_db(conn, placeholder='%s')
+        conn.close()
+    else:
+        conn = sqlite3.connect(args.db_path)
+        added = engine.update_from_db(conn)
+        conn.close()
+    print(f"  ✓ Folded in {added:,} orders in {time.perf_counter() - start:.2f}s "
+          f"({engine.bitmap.shape[0] - 1:,} customers x {engine.bitmap.shape[1]} words)")
+    if engine.skipped_orders:
+        print(f"  ! {engine.skipped_orders:,} orders before the start date are not in the bitmaps")
+    engine.save(args.state)
+
+    as_of = args.as_of or str(np.datetime64(engine.last_order_day, 'D'))
+    start = time.perf_counter()
+    retention = engine.retention(args.cohort, args.horizons, as_of)
+    matrix = engine.matrix(args.cohort, args.period_days, args.periods, as_of)
+    print(f"  ✓ Retention by {args.cohort} as of {as_of} in {time.perf_counter() - start:.3f}s")
+    retention.to_csv(args.output, index=False)
+    matrix.to_csv(args.matrix_output)
+    print(f"  ✓ Saved to {args.output} and {args.matrix_output}")
+
+    print(f"\n{'/'.join(map(str, args.horizons))}-day retention (%):")
+    print(retention[['cohort', 'customers'] + [f'retention_{h}d' for h in args.horizons]].to_string(index=False))
+
+    if args.check:
+        if args.cohort != 'registration_month' or args.grain != 'day' or args.mysql or args.cache_dir:
+            print("\n  ! --check compares day-grain registration-month cohorts against SQLite only")
+            return
+        conn = sqlite3.connect(args.db_path)
+        mismatched = check_against_sql(conn, retention, args.horizons, as_of)
+        conn.close()
+        print(f"\n  {'✓' if not mismatched else '✗'} {len(retention)} cohorts against SQL, "
+              f"{len(mismatched)} mismatches {mismatched[:5] if mismatched else ''}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+QuickShop Analytics - Columnar Dataset Cache
+Converts the CSV tables to memory-mapped, per-column binary files
+"""
+
+import argparse
+import json
+import os
+import time
+import zipfile
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+DATA_DIR = '../data'
+CACHE_DIR = '../data/columnar'
+CHUNK_SIZE = 1_000_000
+TABLES = ['local_shops', 'products', 'customers', 'orders', 'order_items',
+          'deliveries', 'inventory', 'promotions']
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+INTEGER_TYPES = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32, np.int64]
+
+# On-disk layout: <cache_dir>/<table>/<column>.npy plus _meta.json. Timestamps are
+# int64 seconds (NaT = int64 min), strings are integer codes into a dictionary kept
+# in the metadata, integers use the smallest type that holds their range and floats
+# are stored as float32 only when that round-trips exactly.
+
+def source_files(source):
+    """Map table name -> (opener, size, mtime) for a data directory or Dataset.zip"""
+    source = Path(source)
+    files = {}
+    if zipfile.is_zipfile(source):
+        archive = zipfile.ZipFile(source)
+        for info in archive.infolist():
+            name = Path(info.filename).name
+            for suffix in ['_tableau.csv', '.csv']:
+                if name.endswith(suffix) and name[:-len(suffix)] in TABLES:
+                    files[name[:-len(suffix)]] = (lambda info=info: archive.open(info),
+                                                  info.file_size, list(info.date_time))
+                    break
+    else:
+        for table in TABLES:
+            path = source / f'{table}.csv'
+            if path.exists():
+                stat = path.stat()
+                files[table] = (lambda path=path: open(path, 'rb'), stat.st_size, stat.st_mtime)
+    return files
+
+def column_kind(series):
+    """Storage kind for a column of the first chunk"""
+    if pd.api.types.is_bool_dtype(series):
+        return 'bool'
+    if pd.api.types.is_integer_dtype(series):
+        return 'int'
+    if pd.api.types.is_float_dtype(series):
+        return 'float'
+    values = series.dropna()
+    if len(values) and pd.to_datetime(values, format=TIMESTAMP_FORMAT, errors='coerce').notna().all():
+        return 'timestamp'
+    return 'dictionary'
+
+def smallest_integer_type(low, high):
+    """Narrowest numpy integer dtype holding [low, high]"""
+    for dtype in INTEGER_TYPES:
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+class ColumnBuilder:
+    """Accumulates one column chunk by chunk in a wide temporary file, then narrows it"""
+
+    def __init__(self, path, kind):
+        self.path = path
+        self.kind = kind
+        self.raw_path = path.with_suffix('.raw')
+        self.raw = open(self.raw_path, 'wb')
+        self.dtype = {'bool': np.bool_, 'int': np.int64, 'float': np.float64,
+                      'timestamp': np.int64, 'dictionary': np.int64}[kind]
+        self.low, self.high = 0, 0
+        self.float32_exact = True
+        self.dictionary = {}
+        self.rows = 0
+
+    def append(self, series):
+        if self.kind == 'int':
+            if series.isna().any():
+                raise ValueError(f"{self.path.stem}: missing values in an integer column")
+            values = series.to_numpy(np.int64)
+            if len(values):
+                low, high = int(values.min()), int(values.max())
+                self.low, self.high = (low, high) if self.rows == 0 else (min(self.low, low), max(self.high, high))
+        elif self.kind == 'float':
+            values = series.to_numpy(np.float64)
+            if self.float32_exact:
+                self.float32_exact = np.array_equal(values.astype(np.float32).astype(np.float64), values,
+                                                    equal_nan=True)
+        elif self.kind == 'bool':
+            values = series.to_numpy(np.bool_)
+        elif self.kind == 'timestamp':
+            values = pd.to_datetime(series, format=TIMESTAMP_FORMAT).to_numpy('datetime64[s]').view(np.int64)
+        else:
+            codes, uniques = pd.factorize(series, use_na_sentinel=True)
+            # Re-map chunk-local codes onto the table-wide dictionary (-1 stays missing)
+            mapping = np.array([self.dictionary.setdefault(value, len(self.dictionary)) for value in uniques]
+                               + [-1], dtype=np.int64)
+            values = mapping[codes]
+        np.asarray(values, dtype=self.dtype).tofile(self.raw)
+        self.rows += len(values)
+
+    def finish(self):
+        """Write the narrowed .npy and return the column's metadata"""
+        self.raw.close()
+        raw = np.memmap(self.raw_path, dtype=self.dtype, mode='r', shape=(self.rows,)) if self.rows \
+            else np.zeros(0, dtype=self.dtype)
+        meta = {'kind': self.kind}
+        if self.kind == 'int':
+            dtype = smallest_integer_type(self.low, self.high)
+        elif self.kind == 'float':
+            dtype = np.dtype(np.float32 if self.float32_exact else np.float64)
+        elif self.kind == 'dictionary':
+            dtype = smallest_integer_type(-1, len(self.dictionary))
+            meta['dictionary'] = list(self.dictionary)
+        else:
+            dtype = np.dtype(self.dtype)
+        out = np.lib.format.open_memmap(self.path, mode='w+', dtype=dtype, shape=(self.rows,))
+        for start in range(0, self.rows, CHUNK_SIZE):
+            out[start:start + CHUNK_SIZE] = raw[start:start + CHUNK_SIZE]
+        out.flush()
+        del out, raw
+        os.remove(self.raw_path)
+        meta['dtype'] = dtype.str
+        return meta
+
+def convert_table(opener, table_dir, source_size, source_mtime, chunk_size=CHUNK_SIZE):
+    """Stream one CSV into per-column .npy files; returns the number of rows"""
+    table_dir.mkdir(parents=True, exist_ok=True)
+    builders = {}
+    with opener() as f:
+        for chunk in pd.read_csv(f, chunksize=chunk_size):
+            if not builders:
+                builders = {column: ColumnBuilder(table_dir / f'{column}.npy', column_kind(chunk[column]))
+                            for column in chunk.columns}
+            for column, builder in builders.items():
+                builder.append(chunk[column])
+    meta = {
+        'rows': next(iter(builders.values())).rows if builders else 0,
+        'source_size': source_size,
+        'source_mtime': source_mtime,
+        'columns': {column: builder.finish() for column, builder in builders.items()}
+    }
+    (table_dir / '_meta.json').write_text(json.dumps(meta))
+    return meta['rows']
+
+def convert_dataset(source=DATA_DIR, cache_dir=CACHE_DIR, tables=None, chunk_size=CHUNK_SIZE, force=False):
+    """Convert every table found in source whose cache is missing or stale; returns {table: rows}"""
+    converted = {}
+    for table, (opener, size, mtime) in source_files(source).items():
+        if tables and table not in tables:
+            continue
+        table_dir = Path(cache_dir) / table
+        if not force and is_fresh(table_dir, size, mtime):
+            continue
+        converted[table] = convert_table(opener, table_dir, size, mtime, chunk_size)
+    return converted
+
+def is_fresh(table_dir, source_size, source_mtime):
+    """True when the cached table was built from a source of this size and mtime"""
+    meta_path = Path(table_dir) / '_meta.json'
+    if not meta_path.exists():
+        return False
+    meta = json.loads(meta_path.read_text())
+    return meta['source_size'] == source_size and meta['source_mtime'] == source_mtime
+
+class ColumnarTable:
+    """Read-only view over a cached table; columns are memory-mapped, nothing is read up front"""
+
+    def __init__(self, cache_dir, table):
+        self.table_dir = Path(cache_dir) / table
+        meta = json.loads((self.table_dir / '_meta.json').read_text())
+        self.rows = meta['rows']
+        self.columns = meta['columns']
+        self._arrays = {}
+
+    def raw(self, column):
+        """Zero-copy stored array: codes for dictionary columns, int64 seconds for timestamps"""
+        if column not in self._arrays:
+            self._arrays[column] = np.load(self.table_dir / f'{column}.npy', mmap_mode='r')
+        return self._arrays[column]
+
+    def column(self, column):
+        """Column as analysts expect it: datetime64[s], pandas Categorical, or the numeric memmap"""
+        meta = self.columns[column]
+        values = self.raw(column)
+        if meta['kind'] == 'timestamp':
+            return values.view('datetime64[s]')
+        if meta['kind'] == 'dictionary':
+            return pd.Categorical.from_codes(values, categories=meta['dictionary'])
+        return values
+
+    def to_pandas(self, columns=None, start=0, stop=None):
+        """DataFrame over the selected columns and rows, without copying numeric data"""
+        columns = columns or list(self.columns)
+        return pd.DataFrame({column: self.column(column)[start:stop] for column in columns}, copy=False)
+
+    def iter_rows(self, chunk_size=CHUNK_SIZE):
+        """Yield (column names, row tuples) per chunk with the Python values a CSV load would bind"""
+        names = list(self.columns)
+        for start in range(0, self.rows, chunk_size):
+            columns = []
+            for name in names:
+                meta = self.columns[name]
+                values = self.raw(name)[start:start + chunk_size]
+                if meta['kind'] == 'timestamp':
+                    text = np.datetime_as_string(values.view('datetime64[s]'), unit='s')
+                    columns.append([None if t == 'NaT' else t.replace('T', ' ') for t in text.tolist()])
+                elif meta['kind'] == 'dictionary':
+                    dictionary = np.array(meta['dictionary'] + [None], dtype=object)
+                    columns.append(dictionary[values].tolist())
+                elif meta['kind'] == 'float':
+                    values = values.astype(np.float64)
+                    columns.append(np.where(np.isnan(values), None, values).tolist())
+                else:
+                    columns.append(values.tolist())
+            yield names, zip(*columns)
+
+def open_table(cache_dir, table):
+    """Open a cached table"""
+    return ColumnarTable(cache_dir, table)
+
+def read_table(source, table, columns=None, cache_dir=None):
+    """DataFrame for a table, from the columnar cache when it is fresh, else from the CSV"""
+    files = source_files(source)
+    opener, size, mtime = files[table]
+    if cache_dir and is_fresh(Path(cache_dir) / table, size, mtime):
+        return open_table(cache_dir, table).to_pandas(columns)
+    with opener() as f:
+        return pd.read_csv(f, usecols=columns)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Convert the QuickShop CSVs to a memory-mapped columnar cache')
+    parser.add_argument('--source', default=DATA_DIR, help='data directory or Dataset.zip')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--tables', nargs='*', help='only these tables (default: all found)')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--force', action='store_true', help='rebuild even if the cache is up to date')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Columnar Cache")
+    print("=" * 60)
+    start = time.perf_counter()
+    converted = convert_dataset(args.source, args.cache_dir, args.tables, args.chunk_size, args.force)
+    for table, rows in converted.items():
+        table_dir = Path(args.cache_dir) / table
+        size = sum(f.stat().st_size for f in table_dir.glob('*.npy'))
+        print(f"  ✓ {table}: {rows:,} rows, {size / 1e6:,.1f} MB")
+    if not converted:
+        print("  ✓ Cache is up to date")
+    print(f"\nFinished in {time.perf_counter() - start:.2f}s -> {args.cache_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+"""
+QuickShop Analytics - Data Validation
+Streaming per-chunk integrity rules for the loaders, with quarantine output
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from incremental_load import PRIMARY_KEYS
+
+DATA_DIR = '../data'
+QUARANTINE_DIR = 'quarantine'
+CHUNK_SIZE = 200_000
+LOOKUP_BATCH = 900  # keys per IN (...) lookup, under SQLite's default bound-parameter limit
+# Parents before children, so referential checks see every accepted parent key
+LOAD_ORDER = ['local_shops', 'products', 'customers', 'orders', 'order_items', 'deliveries',
+              'inventory', 'promotions']
+
+# table -> [(reason code, column, referenced table)]
+FOREIGN_KEYS = {
+    'orders': [('orphan_customer', 'customer_id', 'customers'), ('orphan_shop', 'shop_id', 'local_shops')],
+    'order_items': [('orphan_order', 'order_id', 'orders'), ('orphan_product', 'product_id', 'products')],
+    'deliveries': [('orphan_order', 'order_id', 'orders')],
+    'inventory': [('orphan_shop', 'shop_id', 'local_shops'), ('orphan_product', 'product_id', 'products')]
+}
+
+def value_rules(table, chunk):
+    """[(reason code, violation mask)] for the row-local rules of a table
+
+    Mirrors section 5 of the analytics SQL (negative amounts, zero prices, stock /
+    is_available mismatches) plus the value checks the schema cannot express.
+    """
+    column = lambda name: pd.to_numeric(chunk[name], errors='coerce')
+    rules = []
+    if table == 'orders':
+        amounts = [column(name) for name in ['subtotal', 'discount', 'delivery_fee', 'total_amount']]
+        rules.append(('negative_amount', np.logical_or.reduce([(a < 0).to_numpy() for a in amounts])))
+    elif table == 'order_items':
+        rules.append(('zero_price', (column('unit_price') <= 0).to_numpy()))
+        rules.append(('nonpositive_quantity', (column('quantity') <= 0).to_numpy()))
+    elif table == 'products':
+        rules.append(('zero_price', (column('base_price') <= 0).to_numpy()))
+    elif table == 'deliveries':
+        rules.append(('negative_duration', np.logical_or.reduce([
+            (column(name) < 0).to_numpy()
+            for name in ['preparation_time_minutes', 'delivery_time_minutes', 'total_time_minutes']])))
+    elif table == 'inventory':
+        stock = column('stock_level')
+        available = chunk['is_available'].astype(str).str.lower().isin(['true', '1'])
+        rules.append(('negative_stock', (stock < 0).to_numpy()))
+        rules.append(('availability_mismatch', ((available & (stock == 0)) | (~available & (stock > 0))).to_numpy()))
+    return rules
+
+class KeySet:
+    """Membership set over integer keys, stored as a growable bitmap indexed by key"""
+
+    def __init__(self):
+        self.present = np.zeros(0, dtype=bool)
+
+    def add(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        if len(keys) == 0:
+            return
+        if keys.max() >= len(self.present):
+            grown = np.zeros(max(int(keys.max()) + 1, 2 * len(self.present)), dtype=bool)
+            grown[:len(self.present)] = self.present
+            self.present = grown
+        self.present[keys[keys >= 0]] = True
+
+    def contains(self, keys):
+        keys = np.asarray(keys, dtype=np.int64)
+        inside = (keys >= 0) & (keys < len(self.present))
+        found = np.zeros(len(keys), dtype=bool)
+        found[inside] = self.present[keys[inside]]
+        return found
+
+    def __len__(self):
+        return int(self.present.sum())
+
+class ChunkValidator:
+    """Checks loader chunks in one pass: bad rows go to <quarantine_dir>/<table>.csv, good rows pass through
+
+    Referential checks use the in-memory key sets of rows already accepted (and,
+    for incremental loads, point lookups of keys already in the database), so
+    children of a quarantined parent are quarantined too. Counters are kept per table and rule.
+    """
+
+    def __init__(self, quarantine_dir=QUARANTINE_DIR):
+        self.quarantine_dir = Path(quarantine_dir)
+        self.keys = {table: KeySet() for table in PRIMARY_KEYS}
+        self.counters = {}
+        self.delivered_order_ids = []
+        self.delivered_ids = KeySet()  # order_ids that have a delivery record
+        self.conn = None
+        self.placeholder = '?'
+        self._started = set()
+
+    def attach_database(self, conn, placeholder='?'):
+        """Also accept keys already in the database, for incremental loads
+
+        Only keys a chunk references that this run has not accepted are looked up,
+        so the cost follows the size of the delta rather than the loaded history.
+        """
+        self.conn, self.placeholder = conn, placeholder
+
+    def lookup(self, table, column, keys):
+        """Those of keys found in table.column of the attached database"""
+        keys = np.unique(keys[keys >= 0])
+        found = []
+        cursor = self.conn.cursor()
+        for start in range(0, len(keys), LOOKUP_BATCH):
+            batch = [int(key) for key in keys[start:start + LOOKUP_BATCH]]
+            cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN "
+                           f"({', '.join([self.placeholder] * len(batch))})", batch)
+            found += [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return np.asarray(found, dtype=np.int64)
+
+    def contains(self, table, keys):
+        """Mask of keys accepted this run or already in the attached database"""
+        keys = np.asarray(keys, dtype=np.int64)
+        found = self.keys[table].contains(keys)
+        if self.conn is not None and not found.all():
+            # Keys found in the database are remembered, so each is looked up at most once
+            self.keys[table].add(self.lookup(table, PRIMARY_KEYS[table], keys[~found]))
+            found = self.keys[table].contains(keys)
+        return found
+
+    def count(self, table, rule, n):
+        counters = self.counters.setdefault(table, {'checked': 0, 'accepted': 0})
+        counters[rule] = counters.get(rule, 0) + int(n)
+
+    def validate(self, table, chunk, upsert=False):
+        """Good rows of a chunk; bad ones are quarantined with '|'-joined reason codes
+
+        With upsert, rows may repeat keys that are already loaded (dimension upserts).
+        """
+        if len(chunk) == 0:
+            return chunk
+        chunk = chunk.reset_index(drop=True)
+        rules = []
+        key = PRIMARY_KEYS.get(table)
+        if key in chunk:
+            ids = pd.to_numeric(chunk[key], errors='coerce')
+            missing = ids.isna().to_numpy()
+            ids = ids.fillna(-1).to_numpy(np.int64)
+            repeated = pd.Series(ids).duplicated().to_numpy().copy()
+            if not upsert:
+                repeated |= self.contains(table, ids)
+            rules += [('missing_key', missing), ('duplicate_key', repeated & ~missing)]
+        for reason, column, parent in FOREIGN_KEYS.get(table, []):
+            refs = pd.to_numeric(chunk[column], errors='coerce')
+            rules.append((reason, refs.isna().to_numpy() | ~self.contains(parent, refs.fillna(-1))))
+        rules += value_rules(table, chunk)
+
+        bad = np.zeros(len(chunk), dtype=bool)
+        for reason, mask in rules:
+            bad |= mask
+            if mask.any():
+                self.count(table, reason, mask.sum())
+        self.count(table, 'checked', len(chunk))
+        self.count(table, 'accepted', len(chunk) - bad.sum())
+        if bad.any():
+            reasons = np.full(bad.sum(), '', dtype=object)
+            for reason, mask in rules:
+                hit = mask[bad]
+                reasons[hit] = np.where(reasons[hit] == '', reason, reasons[hit] + '|' + reason)
+            self.quarantine(table, chunk[bad].assign(reason=reasons))
+        good = chunk[~bad]
+
+        if key in good:
+            self.keys[table].add(good[key].to_numpy(np.int64))
+        if table == 'orders':
+            delivered = good.loc[good['status'] == 'Delivered', 'order_id'].to_numpy(np.int64)
+            self.delivered_order_ids.append(delivered)
+        elif table == 'deliveries':
+            self.delivered_ids.add(good['order_id'].to_numpy(np.int64))
+        return good
+
+    def quarantine(self, table, rows):
+        """Append rejected rows, reason first; a table's file is started afresh on each run"""
+        self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+        path = self.quarantine_dir / f'{table}.csv'
+        fresh = table not in self._started
+        self._started.add(table)
+        columns = ['reason'] + [c for c in rows.columns if c != 'reason']
+        rows[columns].to_csv(path, mode='w' if fresh else 'a', header=fresh, index=False)
+
+    def finish(self):
+        """Cross-table rules that need every chunk: delivered orders loaded this run without a delivery"""
+        if self.delivered_order_ids:
+            delivered = np.concatenate(self.delivered_order_ids)
+            missing = delivered[~self.delivered_ids.contains(delivered)]
+            if self.conn is not None and len(missing):
+                self.delivered_ids.add(self.lookup('deliveries', 'order_id', missing))
+                missing = delivered[~self.delivered_ids.contains(delivered)]
+            self.counters.setdefault('orders', {'checked': 0, 'accepted': 0})
+            self.counters['orders']['delivered_without_delivery'] = len(missing)
+            if len(missing):
+                # Flagged, not rejected: the orders themselves are already loaded and valid
+                self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+                pd.DataFrame({'order_id': missing, 'reason': 'delivered_without_delivery'}) \
+                    .to_csv(self.quarantine_dir / 'orders_delivered_without_delivery.csv', index=False)
+        return self.summary()
+
+    def summary(self):
+        """Per-table checked / accepted counts and per-rule violation counts"""
+        rows = []
+        for table, counters in self.counters.items():
+            for rule, count in counters.items():
+                rows.append({'table': table, 'rule': rule, 'rows': count})
+        return pd.DataFrame(rows, columns=['table', 'rule', 'rows'])
+
+    def print_summary(self):
+        """Print rule counters the way the loaders report progress"""
+        summary = self.finish()
+        print("\nValidation:")
+        for table, counters in self.counters.items():
+            rejected = counters['checked'] - counters['accepted']
+            marker = '✓' if rejected == 0 and not counters.get('delivered_without_delivery') else '!'
+            rules = ', '.join(f"{rule} {count:,}" for rule, count in counters.items()
+                              if rule not in ('checked', 'accepted') and count)
+            print(f"  {marker} {table}: {counters['accepted']:,}/{counters['checked']:,} rows accepted"
+                  + (f" ({rules})" if rules else ''))
+        if self._started:
+            print(f"  Quarantined rows written to {self.quarantine_dir}/")
+        return summary
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Validate the QuickShop CSV files without loading them')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--quarantine-dir', default=QUARANTINE_DIR)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Data Validation")
+    print("=" * 60)
+    validator = ChunkValidator(args.quarantine_dir)
+    start = time.perf_counter()
+    for table in LOAD_ORDER:
+        for chunk in pd.read_csv(os.path.join(args.data_dir, f'{table}.csv'), chunksize=args.chunk_size):
+            validator.validate(table, chunk)
+    print(f"  ✓ Checked all tables in {time.perf_counter() - start:.2f}s")
+    validator.print_summary()
+
+if __name__ == "__main__":
+    main()
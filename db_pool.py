@@ -0,0 +1,27 @@
+"""
+QuickShop Analytics - Connection Pool
+Fixed-size pool of open database connections shared by the streaming and serving tools
+"""
+
+import queue
+from contextlib import contextmanager
+
+class ConnectionPool:
+    """A fixed set of open connections lent out to worker threads"""
+
+    def __init__(self, connect, size):
+        self.connections = queue.Queue()
+        for _ in range(size):
+            self.connections.put(connect())
+
+    @contextmanager
+    def connection(self):
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def close(self):
+        while not self.connections.empty():
+            self.connections.get().close()
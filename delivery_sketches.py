@@ -0,0 +1,372 @@
+"""
+QuickShop Analytics - Delivery Time Sketches
+Mergeable t-digest quantile sketches of delivery times per shop and day
+"""
+
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from columnar_cache import open_table
+
+DB_PATH = 'quickshop.db'
+OUTPUT_PATH = 'delivery_sla.csv'
+METRICS = ['total_time_minutes', 'delivery_time_minutes', 'preparation_time_minutes']
+QUANTILES = [0.5, 0.9, 0.99]
+COMPRESSION = 100  # t-digest delta: at most ~COMPRESSION / 2 centroids per sketch
+DELIVERIES_PER_BLOCK = 1_000_000
+DAY_BITS = 20  # sketch key = shop_id << DAY_BITS | days since 1970-01-01
+SECONDS_PER_DAY = 86_400
+
+# Rollup name -> sketch attributes it groups by
+ROLLUPS = {
+    'shop_day': ['shop_id', 'date'],
+    'shop': ['shop_id'],
+    'shop_month': ['shop_id', 'month'],
+    'city': ['city'],
+    'city_day': ['city', 'date'],
+    'city_month': ['city', 'month'],
+    'day': ['date'],
+    'month': ['month'],
+    'all': []
+}
+
+def compress(keys, means, weights, compression=COMPRESSION):
+    """Merge weighted points into t-digest centroids, for every key at once
+
+    Points are sorted by (key, mean) and cut wherever the k1 scale function
+    k(q) = delta / (2 pi) * asin(2q - 1) crosses an integer, so centroids are
+    small in the tails and large around the median. Returns (keys, means,
+    weights) sorted by key then mean.
+    """
+    if len(keys) == 0:
+        return keys, means, weights
+    order = np.lexsort((means, keys))
+    keys, means, weights = keys[order], means[order], weights[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    group = np.cumsum(np.r_[True, keys[1:] != keys[:-1]]) - 1
+    cumulative = np.cumsum(weights)
+    before = np.r_[0.0, cumulative[:-1]][starts][group]  # weight of earlier keys
+    totals = np.add.reduceat(weights, starts)[group]
+    q = (cumulative - before - weights / 2) / totals
+    scale = np.floor(compression / (2 * np.pi) * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+    boundary = np.r_[True, (keys[1:] != keys[:-1]) | (scale[1:] != scale[:-1])]
+    run = np.cumsum(boundary) - 1
+    merged_weights = np.bincount(run, weights=weights)
+    merged_means = np.bincount(run, weights=weights * means) / merged_weights
+    return keys[boundary], merged_means, merged_weights
+
+def quantiles(keys, means, weights, minimums, maximums, qs):
+    """Quantile estimates per key from compressed centroids; returns (unique keys, {q: values})
+
+    minimums / maximums are per unique key. Between centroid centres the estimate
+    is interpolated linearly; below the first and above the last centre it is
+    interpolated towards the key's exact minimum and maximum.
+    """
+    unique_keys, starts = np.unique(keys, return_index=True)
+    stops = np.r_[starts[1:], len(keys)]
+    cumulative = np.cumsum(weights)
+    offset = np.r_[0.0, cumulative[:-1]][starts]
+    totals = cumulative[stops - 1] - offset
+    centres = cumulative - weights / 2  # global positions, increasing across keys
+    # Interpolation knots per key: (offset, min), (centre, mean) per centroid, (offset + total, max)
+    first, last = starts, stops - 1
+    results = {}
+    for q in qs:
+        target = offset + q * totals
+        right = np.searchsorted(centres, target, side='right')
+        below, above = right <= first, right > last
+        inner_right = np.clip(right, first + 1, np.maximum(last, first + 1))
+        inner_right = np.minimum(inner_right, len(centres) - 1)
+        x0 = np.where(below, offset, np.where(above, centres[last], centres[inner_right - 1]))
+        y0 = np.where(below, minimums, np.where(above, means[last], means[inner_right - 1]))
+        x1 = np.where(below, centres[first], np.where(above, offset + totals, centres[inner_right]))
+        y1 = np.where(below, means[first], np.where(above, maximums, means[inner_right]))
+        span = x1 - x0
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(span > 0, (target - x0) / span, 0.0)
+        results[q] = np.clip(y0 + fraction * (y1 - y0), minimums, maximums)
+    return unique_keys, results
+
+def sketch_key(shop_ids, days):
+    """Combined (shop_id, day) key"""
+    return (np.asarray(shop_ids, dtype=np.int64) << DAY_BITS) | np.asarray(days, dtype=np.int64)
+
+class DeliverySketches:
+    """One t-digest per (shop, day) of a delivery time metric, updated past a delivery_id watermark
+
+    Centroids of all sketches live in three flat arrays sorted by sketch key, so
+    filling, merging and querying are vectorized across sketches. Only sketches
+    that receive new deliveries are recompressed on update.
+    """
+
+    def __init__(self, metric='total_time_minutes', compression=COMPRESSION):
+        self.metric = metric
+        self.compression = compression
+        self.keys = np.zeros(0, dtype=np.int64)
+        self.means = np.zeros(0, dtype=np.float64)
+        self.weights = np.zeros(0, dtype=np.float64)
+        self.sketch_keys = np.zeros(0, dtype=np.int64)  # sorted, one per sketch
+        self.minimums = np.zeros(0, dtype=np.float64)
+        self.maximums = np.zeros(0, dtype=np.float64)
+        self.last_delivery_id = 0
+
+    def add(self, shop_ids, days, values):
+        """Fold delivery times into the sketches of their (shop, day)"""
+        values = np.asarray(values, dtype=np.float64)
+        keep = ~np.isnan(values)
+        if not keep.any():
+            return
+        keys, values = sketch_key(shop_ids, days)[keep], values[keep]
+        new_keys, inverse = np.unique(keys, return_inverse=True)
+        affected = np.isin(self.keys, new_keys)
+        merged = compress(np.concatenate([self.keys[affected], keys]),
+                          np.concatenate([self.means[affected], values]),
+                          np.concatenate([self.weights[affected], np.ones(len(values))]),
+                          self.compression)
+        kept = ~affected
+        combined_keys = np.concatenate([self.keys[kept], merged[0]])
+        order = np.argsort(combined_keys, kind='stable')  # both parts are (key, mean) sorted
+        self.keys = combined_keys[order]
+        self.means = np.concatenate([self.means[kept], merged[1]])[order]
+        self.weights = np.concatenate([self.weights[kept], merged[2]])[order]
+
+        new_min = np.full(len(new_keys), np.inf)
+        new_max = np.full(len(new_keys), -np.inf)
+        np.minimum.at(new_min, inverse, values)
+        np.maximum.at(new_max, inverse, values)
+        sketch_keys = np.union1d(self.sketch_keys, new_keys)
+        minimums = np.full(len(sketch_keys), np.inf)
+        maximums = np.full(len(sketch_keys), -np.inf)
+        old = np.searchsorted(sketch_keys, self.sketch_keys)
+        minimums[old], maximums[old] = self.minimums, self.maximums
+        new = np.searchsorted(sketch_keys, new_keys)
+        minimums[new] = np.minimum(minimums[new], new_min)
+        maximums[new] = np.maximum(maximums[new], new_max)
+        self.sketch_keys, self.minimums, self.maximums = sketch_keys, minimums, maximums
+
+    def update_from_db(self, conn, rows_per_block=DELIVERIES_PER_BLOCK, placeholder='?'):
+        """Fold in deliveries past last_delivery_id; returns deliveries added"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(delivery_id), 0) FROM deliveries")
+        high = int(cursor.fetchone()[0])
+        added = 0
+        for low in range(self.last_delivery_id, high, rows_per_block):
+            cursor.execute(f"""
+                SELECT o.shop_id, o.order_date, d.{self.metric}
+                FROM deliveries d
+                JOIN orders o ON d.order_id = o.order_id
+                WHERE d.delivery_id > {placeholder} AND d.delivery_id <= {placeholder}""",
+                           (low, min(low + rows_per_block, high)))
+            block = pd.DataFrame(cursor.fetchall(), columns=['shop_id', 'order_date', 'value'])
+            days = pd.to_datetime(block['order_date']).to_numpy('datetime64[D]').view(np.int64)
+            self.add(block['shop_id'].to_numpy(), days, pd.to_numeric(block['value']).to_numpy(np.float64))
+            added += len(block)
+        self.last_delivery_id = max(self.last_delivery_id, high)
+        cursor.close()
+        return added
+
+    def update_from_cache(self, cache_dir):
+        """Fold in deliveries past last_delivery_id from the columnar cache"""
+        deliveries = open_table(cache_dir, 'deliveries')
+        orders = open_table(cache_dir, 'orders')
+        delivery_ids = deliveries.raw('delivery_id')
+        new = delivery_ids > self.last_delivery_id
+        order_ids = orders.raw('order_id')
+        position = np.searchsorted(order_ids, deliveries.raw('order_id')[new])
+        days = orders.raw('order_date')[position] // SECONDS_PER_DAY
+        self.add(orders.raw('shop_id')[position], days, deliveries.raw(self.metric)[new])
+        if len(delivery_ids):
+            self.last_delivery_id = max(self.last_delivery_id, int(delivery_ids.max()))
+        return int(new.sum())
+
+    def attributes(self, shop_cities):
+        """DataFrame of shop_id, city, date and month per sketch"""
+        shop_ids = self.sketch_keys >> DAY_BITS
+        dates = (self.sketch_keys & ((1 << DAY_BITS) - 1)).astype('datetime64[D]')
+        return pd.DataFrame({
+            'shop_id': shop_ids,
+            'city': pd.Series(shop_ids).map(shop_cities).fillna('Unknown').to_numpy(),
+            'date': dates.astype(str),
+            'month': dates.astype('datetime64[M]').astype(str)
+        })
+
+    def rollup(self, rollup, shop_cities, qs=QUANTILES):
+        """Merge sketches up to a rollup and estimate quantiles; one row per group"""
+        attributes = self.attributes(shop_cities)
+        columns = ROLLUPS[rollup]
+        if columns:
+            group = attributes.groupby(columns, sort=True).ngroup().to_numpy()
+            labels = attributes.groupby(columns, sort=True).size().reset_index()[columns]
+        else:
+            group = np.zeros(len(attributes), dtype=np.int64)
+            labels = pd.DataFrame(index=[0])
+        sketch_group = group[np.searchsorted(self.sketch_keys, self.keys)]
+        keys, means, weights = compress(sketch_group, self.means, self.weights, self.compression)
+        minimums = np.full(len(labels), np.inf)
+        maximums = np.full(len(labels), -np.inf)
+        np.minimum.at(minimums, group, self.minimums)
+        np.maximum.at(maximums, group, self.maximums)
+        unique_groups, estimates = quantiles(keys, means, weights, minimums, maximums, qs)
+        result = labels.iloc[unique_groups].reset_index(drop=True)
+        result['deliveries'] = np.bincount(keys, weights=weights).astype(np.int64)[unique_groups]
+        result['mean'] = np.round(np.bincount(keys, weights=weights * means)[unique_groups]
+                                  / result['deliveries'].to_numpy(), 2)
+        for q in qs:
+            result[f'p{q * 100:g}'] = np.round(estimates[q], 2)
+        return result
+
+    def save(self, path):
+        """Persist centroids, per-sketch extremes and the watermark"""
+        np.savez(path, keys=self.keys, means=self.means, weights=self.weights, sketch_keys=self.sketch_keys,
+                 minimums=self.minimums, maximums=self.maximums, last_delivery_id=self.last_delivery_id,
+                 metric=self.metric, compression=self.compression)
+
+    @classmethod
+    def load(cls, path):
+        """Restore sketches written by save()"""
+        state = np.load(path)
+        sketches = cls(str(state['metric']), int(state['compression']))
+        sketches.keys = state['keys']
+        sketches.means = state['means']
+        sketches.weights = state['weights']
+        sketches.sketch_keys = state['sketch_keys']
+        sketches.minimums = state['minimums']
+        sketches.maximums = state['maximums']
+        sketches.last_delivery_id = int(state['last_delivery_id'])
+        return sketches
+
+def state_path(db_path, metric):
+    """Sketch file kept next to the database"""
+    db_path = Path(db_path)
+    return db_path.with_name(f'{db_path.stem}_{metric}_sketches.npz')
+
+def load_shop_cities(conn):
+    """{shop_id: city}"""
+    return dict(conn.execute("SELECT shop_id, city FROM local_shops").fetchall())
+
+def rank_tolerance(q, compression=COMPRESSION):
+    """Rank error allowed at quantile q: 1.5 times the k1 centroid width 2 pi sqrt(q (1 - q)) / delta
+
+    Interpolating between two centroid centres can be off by about one centroid
+    width, and rolling up merges child centroids whole, which can stretch a
+    centroid by up to half a width more.
+    """
+    return 1.5 * 2 * np.pi * np.sqrt(q * (1 - q)) / compression
+
+def check_error_bounds(conn, sketches, shop_cities, qs=QUANTILES):
+    """Rank error of every estimate against exact percentiles, per rollup
+
+    An estimate x for quantile q of n values is within bounds when q lies within
+    rank_tolerance(q) + 1 / n of [share of values < x, share of values <= x].
+    """
+    exact = pd.read_sql_query(f"""
+        SELECT o.shop_id, DATE(o.order_date) as date, d.{sketches.metric} as value
+        FROM deliveries d
+        JOIN orders o ON d.order_id = o.order_id
+        WHERE d.{sketches.metric} IS NOT NULL AND d.delivery_id <= ?""", conn,
+                              params=(sketches.last_delivery_id,))
+    exact['city'] = exact['shop_id'].map(shop_cities).fillna('Unknown')
+    exact['month'] = exact['date'].str[:7]
+    span = exact['value'].max() - exact['value'].min() + 2
+    report = []
+    for rollup, columns in ROLLUPS.items():
+        estimates = sketches.rollup(rollup, shop_cities, qs)
+        group = exact.groupby(columns).ngroup().to_numpy() if columns else np.zeros(len(exact), dtype=np.int64)
+        # One sorted array of group * span + value answers every rank lookup with searchsorted
+        ranked = np.sort(group * span + (exact['value'].to_numpy() - exact['value'].min()))
+        sizes = np.bincount(group)
+        starts = np.r_[0, np.cumsum(sizes)[:-1]]
+        if columns:
+            labels = exact.groupby(columns).size().reset_index()[columns]
+            estimates = labels.merge(estimates, on=columns, how='left')
+        worst, failures = 0.0, 0
+        for q in qs:
+            value = estimates[f'p{q * 100:g}'].to_numpy() - exact['value'].min()
+            base = np.arange(len(sizes)) * span
+            below = (np.searchsorted(ranked, base + value, side='left') - starts) / sizes
+            at_most = (np.searchsorted(ranked, base + value, side='right') - starts) / sizes
+            error = np.maximum(np.maximum(below - q, q - at_most), 0)
+            worst = max(worst, float(np.nan_to_num(error, nan=1.0).max()))
+            failures += int((~(error <= rank_tolerance(q, sketches.compression) + 1 / sizes)).sum())
+        report.append({'rollup': rollup, 'groups': len(sizes), 'max_rank_error': round(worst, 4),
+                       'failures': failures})
+    return pd.DataFrame(report)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Delivery time percentiles from mergeable t-digest sketches')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read deliveries from MySQL instead of SQLite')
+    parser.add_argument('--cache-dir', help='read deliveries from this columnar cache instead of the database')
+    parser.add_argument('--metric', choices=METRICS, default='total_time_minutes')
+    parser.add_argument('--state', help='sketch file (default: next to the database)')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved sketches')
+    parser.add_argument('--compression', type=int, default=COMPRESSION, help='t-digest delta')
+    parser.add_argument('--rollup', choices=list(ROLLUPS), default='shop')
+    parser.add_argument('--quantiles', type=float, nargs='+', default=QUANTILES)
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--check', action='store_true', help='check rank error against exact percentiles')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Delivery Time Sketches")
+    print("=" * 60)
+    path = Path(args.state) if args.state else state_path(args.db_path, args.metric)
+    sketches = None
+    if path.exists() and not args.rebuild:
+        sketches = DeliverySketches.load(path)
+        if (sketches.metric, sketches.compression) != (args.metric, args.compression):
+            print(f"  ! {path} holds {sketches.metric} sketches at delta {sketches.compression}; rebuilding")
+            sketches = None
+    sketches = sketches or DeliverySketches(args.metric, args.compression)
+
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT shop_id, city FROM local_shops")
+        shop_cities = dict(cursor.fetchall())
+        cursor.close()
+    else:
+        conn = sqlite3.connect(args.db_path)
+        shop_cities = load_shop_cities(conn)
+
+    start = time.perf_counter()
+    if args.cache_dir:
+        added = sketches.update_from_cache(args.cache_dir)
+    else:
+        added = sketches.update_from_db(conn, placeholder='%s' if args.mysql else '?')
+    print(f"  ✓ Folded in {added:,} deliveries in {time.perf_counter() - start:.2f}s "
+          f"({len(sketches.sketch_keys):,} shop-day sketches, {len(sketches.keys):,} centroids)")
+    sketches.save(path)
+    print(f"  ✓ Sketches saved to {path}")
+
+    start = time.perf_counter()
+    result = sketches.rollup(args.rollup, shop_cities, args.quantiles)
+    print(f"  ✓ {len(result):,} {args.rollup} groups in {time.perf_counter() - start:.3f}s")
+    result.to_csv(args.output, index=False)
+    print(f"  ✓ Saved to {args.output}")
+    print(f"\n{args.metric} by {args.rollup}:")
+    print(result.head(15).to_string(index=False))
+
+    if args.check:
+        if args.mysql:
+            print("\n  ! --check runs against SQLite only")
+        else:
+            report = check_error_bounds(conn, sketches, shop_cities, args.quantiles)
+            bounds = ', '.join(f"p{q * 100:g} {rank_tolerance(q, sketches.compression):.4f}"
+                               for q in args.quantiles)
+            print(f"\nRank error against exact percentiles (bounds {bounds}, plus 1/n):")
+            for row in report.itertuples():
+                print(f"  {'✓' if row.failures == 0 else '✗'} {row.rollup:<12} {row.groups:>8,} groups  "
+                      f"max rank error {row.max_rank_error:.4f}  {row.failures} outside bounds")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+QuickShop Analytics - Demand Forecasting
+Dense shop x product demand matrix, vectorized forecasts and reorder recommendations
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import time
+import numpy as np
+import pandas as pd
+
+from columnar_cache import open_table
+
+DB_PATH = 'quickshop.db'
+OUTPUT_PATH = 'reorder_recommendations.csv'
+HISTORY_DAYS = 90
+SHORT_WINDOW = 7
+LONG_WINDOW = 28
+LEAD_TIME_DAYS = 7  # demand expected before a reorder arrives
+COVER_DAYS = 30  # demand a reorder should cover
+ROWS_PER_BLOCK = 1_000_000
+SERIES_PER_TASK = 100_000
+PRODUCT_BITS = 32  # series key = shop_id << PRODUCT_BITS | product_id
+SECONDS_PER_DAY = 86_400
+# Coefficient of variation cut-offs -> confidence, and the safety factor each earns
+CONFIDENCE_LEVELS = [(0.5, 'High', 1.2), (1.0, 'Medium', 1.35), (np.inf, 'Low', 1.5)]
+
+def series_key(shop_ids, product_ids):
+    """Combined (shop_id, product_id) key"""
+    return (np.asarray(shop_ids, dtype=np.int64) << PRODUCT_BITS) | np.asarray(product_ids, dtype=np.int64)
+
+class DemandMatrix:
+    """Units sold per (series, day) over the history window, for the inventory's shop x product pairs
+
+    Rows follow the sorted series keys; column d is history_start + d days.
+    Cancelled orders are not demand.
+    """
+
+    def __init__(self, inventory, as_of_day, history_days=HISTORY_DAYS):
+        self.inventory = inventory.assign(key=series_key(inventory['shop_id'], inventory['product_id'])) \
+            .sort_values('key').reset_index(drop=True)
+        self.keys = self.inventory['key'].to_numpy()
+        self.history_days = history_days
+        self.first_day = as_of_day - history_days + 1
+        self.units = np.zeros((len(self.keys), history_days), dtype=np.float32)
+        self.rows = 0
+
+    def add(self, shop_ids, product_ids, order_seconds, quantities):
+        """Fold order item quantities into the matrix"""
+        day = np.asarray(order_seconds, dtype=np.int64) // SECONDS_PER_DAY - self.first_day
+        keys = series_key(shop_ids, product_ids)
+        if len(self.keys) == 0:
+            return
+        row = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        keep = (day >= 0) & (day < self.history_days) & (self.keys[row] == keys)
+        cells = row[keep] * self.history_days + day[keep]
+        # Scatter-add into the flat view: a block touches far fewer cells than the matrix holds
+        np.add.at(self.units.reshape(-1), cells, np.asarray(quantities, dtype=np.float32)[keep])
+        self.rows += int(keep.sum())
+
+    def fill_from_db(self, conn, rows_per_block=ROWS_PER_BLOCK, placeholder='?'):
+        """Scan order_items joined to orders in order_id blocks"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MIN(order_id), 1), COALESCE(MAX(order_id), 0) FROM orders")
+        low, high = (int(v) for v in cursor.fetchone())
+        first_date = str(np.datetime64(self.first_day, 'D'))
+        for first in range(low, high + 1, rows_per_block):
+            cursor.execute(f"""
+                SELECT o.shop_id, oi.product_id, o.order_date, oi.quantity
+                FROM orders o
+                JOIN order_items oi ON oi.order_id = o.order_id
+                WHERE o.order_id >= {placeholder} AND o.order_id <= {placeholder}
+                  AND o.order_date >= {placeholder} AND o.status <> 'Cancelled'""",
+                           (first, min(first + rows_per_block - 1, high), first_date))
+            block = pd.DataFrame(cursor.fetchall(), columns=['shop_id', 'product_id', 'order_date', 'quantity'])
+            if len(block):
+                seconds = pd.to_datetime(block['order_date']).to_numpy('datetime64[s]').view(np.int64)
+                self.add(block['shop_id'].to_numpy(), block['product_id'].to_numpy(), seconds,
+                         block['quantity'].to_numpy())
+        cursor.close()
+
+    def fill_from_cache(self, cache_dir, rows_per_block=ROWS_PER_BLOCK):
+        """Scan order_items from the columnar cache, looking up their orders by order_id"""
+        orders = open_table(cache_dir, 'orders')
+        items = open_table(cache_dir, 'order_items')
+        order_ids = orders.raw('order_id')
+        statuses = orders.columns['status']['dictionary']
+        cancelled = statuses.index('Cancelled') if 'Cancelled' in statuses else -1
+        for start in range(0, items.rows, rows_per_block):
+            stop = min(start + rows_per_block, items.rows)
+            position = np.searchsorted(order_ids, items.raw('order_id')[start:stop])
+            demand = orders.raw('status')[position] != cancelled
+            self.add(orders.raw('shop_id')[position][demand], items.raw('product_id')[start:stop][demand],
+                     orders.raw('order_date')[position][demand], items.raw('quantity')[start:stop][demand])
+
+def forecast_block(units, stock_level, reorder_point, lead_time_days=LEAD_TIME_DAYS, cover_days=COVER_DAYS):
+    """Forecasts and reorder quantities for a block of series (rows of the demand matrix)
+
+    Level is the 7-day moving average, trend the least-squares slope over the
+    whole history; daily demand d days ahead is max(level + trend * d, 0).
+    Volatility is the coefficient of variation of weekly totals, since daily
+    demand for a single shop x product is mostly zero.
+    """
+    units = np.asarray(units, dtype=np.float64)
+    days = units.shape[1]
+    t = np.arange(days) - (days - 1) / 2
+    ma_short = units[:, -SHORT_WINDOW:].mean(axis=1)
+    ma_long = units[:, -LONG_WINDOW:].mean(axis=1)
+    trend = (units @ t) / (t @ t) if days > 1 else np.zeros(len(units))
+    weeks = units[:, days % 7:].reshape(len(units), -1, 7).sum(axis=2)
+    weekly_mean = weeks.mean(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cv = np.where(weekly_mean > 0, weeks.std(axis=1) / weekly_mean, np.inf)
+
+    horizon = max(lead_time_days, cover_days, 30)
+    ahead = np.maximum(ma_short[:, None] + trend[:, None] * np.arange(1, horizon + 1)[None, :], 0)
+    # cumulative[:, d] is the demand over the next d days, so a lead time of 0 reorders against stock on hand
+    cumulative = np.concatenate([np.zeros((len(units), 1)), np.cumsum(ahead, axis=1)], axis=1)
+    forecast_7d, forecast_30d = cumulative[:, 7], cumulative[:, 30]
+    lead_demand, cover_demand = cumulative[:, lead_time_days], cumulative[:, cover_days]
+
+    band = np.searchsorted([cutoff for cutoff, _, _ in CONFIDENCE_LEVELS[:-1]], cv, side='right')
+    confidence = np.array([label for _, label, _ in CONFIDENCE_LEVELS], dtype=object)[band]
+    safety = np.array([factor for _, _, factor in CONFIDENCE_LEVELS])[band]
+
+    projected_stock = stock_level - lead_demand
+    target = reorder_point + safety * cover_demand
+    reorder_quantity = np.where(projected_stock < reorder_point,
+                                np.ceil(np.maximum(target - projected_stock, 0)), 0).astype(np.int64)
+    return {
+        'ma_7d': np.round(ma_short, 3),
+        'ma_28d': np.round(ma_long, 3),
+        'trend_per_day': np.round(trend, 4),
+        'forecast_7d': np.round(forecast_7d, 2),
+        'forecast_30d': np.round(forecast_30d, 2),
+        'cv': np.round(cv, 3),
+        'confidence': confidence,
+        'projected_stock': np.round(projected_stock, 2),
+        'reorder_quantity': reorder_quantity,
+        'urgent': stock_level < reorder_point
+    }
+
+_worker_context = {}
+
+def _init_worker(context):
+    """Pool initializer: map the demand matrix written by the parent"""
+    _worker_context.update(context)
+    _worker_context['units'] = np.load(context['units_path'], mmap_mode='r')
+
+def _forecast_task(task):
+    """Forecast one row range of the shared demand matrix"""
+    start, stop = task
+    ctx = _worker_context
+    return start, forecast_block(ctx['units'][start:stop], ctx['stock_level'][start:stop],
+                                 ctx['reorder_point'][start:stop], ctx['lead_time_days'], ctx['cover_days'])
+
+def forecast_all(matrix, workers=1, series_per_task=SERIES_PER_TASK, lead_time_days=LEAD_TIME_DAYS,
+                 cover_days=COVER_DAYS):
+    """Forecast every series, on a process pool when workers > 1; returns a DataFrame"""
+    stock_level = matrix.inventory['stock_level'].to_numpy(np.float64)
+    reorder_point = matrix.inventory['reorder_point'].to_numpy(np.float64)
+    tasks = [(start, min(start + series_per_task, len(matrix.keys)))
+             for start in range(0, len(matrix.keys), series_per_task)]
+    if workers > 1 and len(tasks) > 1:
+        # Workers map the matrix from a temporary .npy file instead of receiving a pickled copy
+        with tempfile.TemporaryDirectory() as tmp:
+            units_path = os.path.join(tmp, 'units.npy')
+            np.save(units_path, matrix.units)
+            context = {'units_path': units_path, 'stock_level': stock_level, 'reorder_point': reorder_point,
+                       'lead_time_days': lead_time_days, 'cover_days': cover_days}
+            with multiprocessing.Pool(workers, _init_worker, (context,)) as pool:
+                parts = dict(pool.imap_unordered(_forecast_task, tasks))
+    else:
+        parts = {start: forecast_block(matrix.units[start:stop], stock_level[start:stop],
+                                       reorder_point[start:stop], lead_time_days, cover_days)
+                 for start, stop in tasks}
+    result = matrix.inventory[['shop_id', 'product_id', 'stock_level', 'reorder_point']].copy()
+    if tasks:
+        for column in parts[0]:
+            result[column] = np.concatenate([parts[start][column] for start, _ in tasks])
+    return result
+
+def load_inventory(conn):
+    """shop_id, product_id, stock_level, reorder_point for every stocked pair"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT shop_id, product_id, stock_level, reorder_point FROM inventory")
+    inventory = pd.DataFrame(cursor.fetchall(), columns=['shop_id', 'product_id', 'stock_level', 'reorder_point'])
+    cursor.close()
+    return inventory
+
+def latest_order_day(conn):
+    """Day number of the most recent order"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT MAX(order_date) FROM orders")
+    latest = cursor.fetchone()[0]
+    cursor.close()
+    return int(pd.Timestamp(latest).to_datetime64().astype('datetime64[D]').astype(np.int64))
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Forecast demand for every shop x product and recommend reorders')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read from MySQL instead of SQLite')
+    parser.add_argument('--cache-dir', help='read orders and order_items from this columnar cache')
+    parser.add_argument('--as-of', help='YYYY-MM-DD, last day of history (default: date of the latest order)')
+    parser.add_argument('--history-days', type=int, default=HISTORY_DAYS,
+                        help='days of demand history, at least one week')
+    parser.add_argument('--lead-time-days', type=int, default=LEAD_TIME_DAYS,
+                        help='days until a reorder arrives (0 = reorder against stock on hand)')
+    parser.add_argument('--cover-days', type=int, default=COVER_DAYS)
+    parser.add_argument('--workers', type=int, default=1, help='forecasting processes')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='series that need a reorder')
+    parser.add_argument('--forecast-output', help='also write the forecast for every series here')
+    args = parser.parse_args()
+    # Volatility is measured on whole weeks of history
+    if args.history_days < 7:
+        parser.error('--history-days must be at least 7')
+    if args.lead_time_days < 0 or args.cover_days < 0:
+        parser.error('--lead-time-days and --cover-days cannot be negative')
+    return args
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Demand Forecasting")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+    else:
+        conn = sqlite3.connect(args.db_path)
+    as_of_day = int(np.datetime64(args.as_of, 'D').astype(np.int64)) if args.as_of else latest_order_day(conn)
+
+    start = time.perf_counter()
+    matrix = DemandMatrix(load_inventory(conn), as_of_day, args.history_days)
+    if args.cache_dir:
+        matrix.fill_from_cache(args.cache_dir)
+    else:
+        matrix.fill_from_db(conn, placeholder='%s' if args.mysql else '?')
+    conn.close()
+    print(f"  ✓ Demand matrix {matrix.units.shape[0]:,} series x {matrix.units.shape[1]} days "
+          f"to {np.datetime64(as_of_day, 'D')} from {matrix.rows:,} order items "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    forecasts = forecast_all(matrix, args.workers, lead_time_days=args.lead_time_days, cover_days=args.cover_days)
+    print(f"  ✓ Forecast {len(forecasts):,} series in {time.perf_counter() - start:.2f}s")
+    if args.forecast_output:
+        forecasts.to_csv(args.forecast_output, index=False)
+        print(f"  ✓ All forecasts saved to {args.forecast_output}")
+
+    reorders = forecasts[forecasts['reorder_quantity'] > 0] \
+        .sort_values(['urgent', 'reorder_quantity'], ascending=[False, False])
+    reorders.to_csv(args.output, index=False)
+    print(f"  ✓ {len(reorders):,} reorder recommendations ({int(reorders['urgent'].sum()):,} urgent) "
+          f"saved to {args.output}")
+    print("\nConfidence levels:")
+    print(forecasts['confidence'].value_counts().to_string())
+    print("\nLargest reorders:")
+    print(reorders[['shop_id', 'product_id', 'stock_level', 'reorder_point', 'forecast_7d', 'forecast_30d',
+                    'confidence', 'reorder_quantity', 'urgent']].head(10).to_string(index=False))
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,12 @@ Generates synthetic but realistic data for a quick commerce platform
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
 import random
 import json
-
-# Set random seed for reproducibility
-np.random.seed(42)
-random.seed(42)
+import shutil
+import multiprocessing
 
 # Configuration
 START_DATE = datetime(2024, 1, 1)
@@ -20,6 +20,34 @@ NUM_CUSTOMERS = 5000
 NUM_LOCAL_SHOPS = 150
 NUM_PRODUCTS = 500
 NUM_ORDERS = 25000
+CHUNK_SIZE = 250_000
+ORDER_STATUSES = ['Delivered', 'Cancelled', 'In Progress']
+PAYMENT_METHODS = ['Credit Card', 'Debit Card', 'PayPal', 'Cash']
+FACT_TABLES = ['orders', 'order_items', 'deliveries']
+POPULARITY_STREAM = 2**32 - 1  # SeedSequence spawn key reserved for popularity rankings
+
+# Relative order intensity by weekday (Mon..Sun) and hour of day, used with --seasonality
+WEEKDAY_WEIGHTS = [0.90, 0.85, 0.90, 0.95, 1.10, 1.25, 1.05]
+HOURLY_WEIGHTS = [0.20, 0.10, 0.05, 0.05, 0.05, 0.10, 0.30, 0.60, 0.80, 0.90, 1.00, 1.40,
+                  1.70, 1.50, 1.10, 1.00, 1.20, 1.60, 2.00, 2.10, 1.80, 1.30, 0.80, 0.40]
+
+shop_types = ['Supermarket', 'Grocery Store', 'Specialty Store', 'Butcher',
+              'Bakery', 'Wine Merchant', 'Greengrocer', 'Convenience Store']
+cities = ['Berlin', 'Munich', 'Hamburg', 'Frankfurt', 'Cologne', 'Stuttgart',
+          'Düsseldorf', 'Dortmund', 'Leipzig', 'Dresden']
+districts = ['Mitte', 'Kreuzberg', 'Prenzlauer Berg', 'Charlottenburg', 'Neukölln',
+             'Friedrichshain', 'Schöneberg', 'Tempelhof', 'Pankow', 'Lichtenberg']
+categories = {
+    'Fresh Produce': ['Tomatoes', 'Lettuce', 'Carrots', 'Apples', 'Bananas', 'Oranges', 'Potatoes', 'Onions'],
+    'Dairy': ['Milk', 'Cheese', 'Yogurt', 'Butter', 'Cream', 'Eggs'],
+    'Meat & Fish': ['Chicken Breast', 'Ground Beef', 'Salmon', 'Pork Chops', 'Turkey', 'Shrimp'],
+    'Bakery': ['Bread', 'Croissants', 'Baguette', 'Rolls', 'Cake', 'Cookies'],
+    'Beverages': ['Water', 'Juice', 'Soda', 'Beer', 'Wine', 'Coffee', 'Tea'],
+    'Pantry': ['Pasta', 'Rice', 'Canned Tomatoes', 'Olive Oil', 'Flour', 'Sugar', 'Salt'],
+    'Snacks': ['Chips', 'Chocolate', 'Nuts', 'Crackers', 'Candy', 'Popcorn'],
+    'Household': ['Toilet Paper', 'Paper Towels', 'Dish Soap', 'Laundry Detergent', 'Trash Bags']
+}
+customer_segments = ['New', 'Regular', 'VIP', 'Churned']
 
 # Helper functions
 def random_date(start, end):
@@ -33,271 +61,550 @@ def weighted_choice(choices, weights):
     """Make weighted random choice"""
     return random.choices(choices, weights=weights, k=1)[0]
 
-print("Generating QuickShop Analytics Dataset...")
-print("=" * 60)
+def weighted_sampler(weights):
+    """Precompute a (cdf, guide table) pair for fast weighted index draws"""
+    cdf = np.cumsum(np.asarray(weights, dtype=np.float64))
+    cdf /= cdf[-1]
+    cdf[-1] = 1.0
+    num_buckets = 4 * len(cdf)
+    guide = np.searchsorted(cdf, np.arange(num_buckets) / num_buckets, side='right')
+    return cdf, guide
 
-# 1. Generate Local Shops
-print("\n1. Generating local_shops table...")
-shop_types = ['Supermarket', 'Grocery Store', 'Specialty Store', 'Butcher', 
-              'Bakery', 'Wine Merchant', 'Greengrocer', 'Convenience Store']
-cities = ['Berlin', 'Munich', 'Hamburg', 'Frankfurt', 'Cologne', 'Stuttgart', 
-          'Düsseldorf', 'Dortmund', 'Leipzig', 'Dresden']
-districts = ['Mitte', 'Kreuzberg', 'Prenzlauer Berg', 'Charlottenburg', 'Neukölln',
-             'Friedrichshain', 'Schöneberg', 'Tempelhof', 'Pankow', 'Lichtenberg']
+def draw_indices(rng, num_choices, size, sampler=None):
+    """Draw indices from range(num_choices), uniformly or from a weighted_sampler
 
-local_shops = []
-for i in range(1, NUM_LOCAL_SHOPS + 1):
-    city = random.choice(cities)
-    local_shops.append({
-        'shop_id': i,
-        'shop_name': f"{random.choice(['Fresh', 'Quick', 'Daily', 'Express', 'Local', 'Prime'])} {random.choice(shop_types)} {i}",
-        'shop_type': random.choice(shop_types),
-        'city': city,
-        'district': random.choice(districts),
-        'partnership_start_date': random_date(datetime(2022, 1, 1), datetime(2024, 12, 31)),
-        'commission_rate': round(random.uniform(0.10, 0.25), 2),
-        'avg_preparation_time_minutes': random.randint(5, 20),
-        'is_active': weighted_choice([True, False], [0.92, 0.08])
-    })
+    The guide table jumps straight to the right CDF bucket, so weighted draws cost
+    about the same as uniform ones instead of a binary search each.
+    """
+    if sampler is None:
+        return rng.integers(0, num_choices, size)
+    cdf, guide = sampler
+    u = rng.random(size).ravel()
+    idx = guide[(u * len(guide)).astype(np.int64)]
+    todo = np.flatnonzero(cdf[idx] <= u)
+    while len(todo):
+        idx[todo] += 1
+        todo = todo[cdf[idx[todo]] <= u[todo]]
+    return idx.reshape(size)
 
-df_shops = pd.DataFrame(local_shops)
-print(f"   Created {len(df_shops)} local shops")
+def sample_distinct(rng, num_rows, k, num_choices, sampler=None):
+    """Draw k distinct indices per row from range(num_choices), vectorized
 
-# 2. Generate Products
-print("\n2. Generating products table...")
-categories = {
-    'Fresh Produce': ['Tomatoes', 'Lettuce', 'Carrots', 'Apples', 'Bananas', 'Oranges', 'Potatoes', 'Onions'],
-    'Dairy': ['Milk', 'Cheese', 'Yogurt', 'Butter', 'Cream', 'Eggs'],
-    'Meat & Fish': ['Chicken Breast', 'Ground Beef', 'Salmon', 'Pork Chops', 'Turkey', 'Shrimp'],
-    'Bakery': ['Bread', 'Croissants', 'Baguette', 'Rolls', 'Cake', 'Cookies'],
-    'Beverages': ['Water', 'Juice', 'Soda', 'Beer', 'Wine', 'Coffee', 'Tea'],
-    'Pantry': ['Pasta', 'Rice', 'Canned Tomatoes', 'Olive Oil', 'Flour', 'Sugar', 'Salt'],
-    'Snacks': ['Chips', 'Chocolate', 'Nuts', 'Crackers', 'Candy', 'Popcorn'],
-    'Household': ['Toilet Paper', 'Paper Towels', 'Dish Soap', 'Laundry Detergent', 'Trash Bags']
-}
+    Column j is redrawn only where it repeats an earlier column, which is exactly
+    successive sampling without replacement, also under a skewed sampler.
+    """
+    draws = draw_indices(rng, num_choices, (num_rows, k), sampler)
+    for j in range(1, k):
+        dup_rows = np.flatnonzero((draws[:, :j] == draws[:, j:j + 1]).any(axis=1))
+        while len(dup_rows):
+            draws[dup_rows, j] = draw_indices(rng, num_choices, len(dup_rows), sampler)
+            dup_rows = dup_rows[(draws[dup_rows, :j] == draws[dup_rows, j:j + 1]).any(axis=1)]
+    return draws
 
-products = []
-product_id = 1
-for category, items in categories.items():
-    for item in items:
-        for variant in range(random.randint(2, 5)):
-            products.append({
-                'product_id': product_id,
-                'product_name': f"{item} {['Premium', 'Organic', 'Regular', 'Value', 'Fresh'][variant % 5]}",
-                'category': category,
-                'subcategory': item,
-                'base_price': round(random.uniform(0.99, 29.99), 2),
-                'unit': random.choice(['piece', 'kg', 'liter', 'pack', 'bottle'])
-            })
-            product_id += 1
+def zipf_sampler(num_items, exponent, rng):
+    """Zipf popularity over randomly ranked items; None means uniform"""
+    if exponent <= 0:
+        return None
+    rank = rng.permutation(num_items) + 1
+    return weighted_sampler(1.0 / rank.astype(np.float64) ** exponent)
+
+def seasonal_day_sampler():
+    """Day offsets from START_DATE, weighted by weekday"""
+    days = np.arange((END_DATE - START_DATE).days + 1)
+    weekday = (START_DATE.weekday() + days) % 7
+    return weighted_sampler(np.asarray(WEEKDAY_WEIGHTS)[weekday])
+
+def seasonal_hour_sampler():
+    """Hours of the day, weighted by the diurnal profile"""
+    return weighted_sampler(HOURLY_WEIGHTS)
+
+def generate_local_shops():
+    """Generate the local_shops dimension"""
+    local_shops = []
+    for i in range(1, NUM_LOCAL_SHOPS + 1):
+        city = random.choice(cities)
+        local_shops.append({
+            'shop_id': i,
+            'shop_name': f"{random.choice(['Fresh', 'Quick', 'Daily', 'Express', 'Local', 'Prime'])} {random.choice(shop_types)} {i}",
+            'shop_type': random.choice(shop_types),
+            'city': city,
+            'district': random.choice(districts),
+            'partnership_start_date': random_date(datetime(2022, 1, 1), datetime(2024, 12, 31)),
+            'commission_rate': round(random.uniform(0.10, 0.25), 2),
+            'avg_preparation_time_minutes': random.randint(5, 20),
+            'is_active': weighted_choice([True, False], [0.92, 0.08])
+        })
+    return pd.DataFrame(local_shops)
+
+def generate_products():
+    """Generate the products catalog"""
+    products = []
+    product_id = 1
+    for category, items in categories.items():
+        for item in items:
+            for variant in range(random.randint(2, 5)):
+                products.append({
+                    'product_id': product_id,
+                    'product_name': f"{item} {['Premium', 'Organic', 'Regular', 'Value', 'Fresh'][variant % 5]}",
+                    'category': category,
+                    'subcategory': item,
+                    'base_price': round(random.uniform(0.99, 29.99), 2),
+                    'unit': random.choice(['piece', 'kg', 'liter', 'pack', 'bottle'])
+                })
+                product_id += 1
+                if product_id > NUM_PRODUCTS:
+                    break
             if product_id > NUM_PRODUCTS:
                 break
         if product_id > NUM_PRODUCTS:
             break
-    if product_id > NUM_PRODUCTS:
-        break
+    return pd.DataFrame(products)
 
-df_products = pd.DataFrame(products)
-print(f"   Created {len(df_products)} products across {len(categories)} categories")
+def generate_customers(num_customers):
+    """Generate the customers dimension (aggregates are filled in after orders)"""
+    customers = []
+    for i in range(1, num_customers + 1):
+        registration_date = random_date(datetime(2022, 1, 1), datetime(2025, 12, 31))
+        customers.append({
+            'customer_id': i,
+            'registration_date': registration_date,
+            'city': random.choice(cities),
+            'customer_segment': weighted_choice(customer_segments, [0.25, 0.45, 0.20, 0.10]),
+            'total_orders': 0,  # Will be updated after orders
+            'total_spent': 0.0,  # Will be updated after orders
+            'last_order_date': None  # Will be updated after orders
+        })
+    return pd.DataFrame(customers)
 
-# 3. Generate Customers
-print("\n3. Generating customers table...")
-customer_segments = ['New', 'Regular', 'VIP', 'Churned']
-customers = []
-for i in range(1, NUM_CUSTOMERS + 1):
-    registration_date = random_date(datetime(2022, 1, 1), datetime(2025, 12, 31))
-    customers.append({
-        'customer_id': i,
-        'registration_date': registration_date,
-        'city': random.choice(cities),
-        'customer_segment': weighted_choice(customer_segments, [0.25, 0.45, 0.20, 0.10]),
-        'total_orders': 0,  # Will be updated after orders
-        'total_spent': 0.0,  # Will be updated after orders
-        'last_order_date': None  # Will be updated after orders
-    })
+def draw_order_plan(rng, num_orders):
+    """Draw order status and item count, which fix how many item and delivery IDs a batch uses"""
+    status = rng.choice(ORDER_STATUSES, num_orders, p=[0.88, 0.07, 0.05])
+    num_items = rng.choice([1, 2, 3, 4, 5], num_orders, p=[0.30, 0.30, 0.20, 0.15, 0.05])
+    return status, num_items
 
-df_customers = pd.DataFrame(customers)
-print(f"   Created {len(df_customers)} customers")
-
-# 4. Generate Orders
-print("\n4. Generating orders table...")
-order_statuses = ['Delivered', 'Cancelled', 'In Progress']
-payment_methods = ['Credit Card', 'Debit Card', 'PayPal', 'Cash']
-
-orders = []
-order_items = []
-deliveries = []
-
-for i in range(1, NUM_ORDERS + 1):
-    customer = df_customers.sample(1).iloc[0]
-    shop = df_shops[df_shops['is_active'] == True].sample(1).iloc[0]
-    
-    order_date = random_date(START_DATE, END_DATE)
-    status = weighted_choice(order_statuses, [0.88, 0.07, 0.05])
-    
-    # Generate order items
-    num_items = weighted_choice([1, 2, 3, 4, 5], [0.30, 0.30, 0.20, 0.15, 0.05])
-    selected_products = df_products.sample(num_items)
-    
-    subtotal = 0
-    for _, product in selected_products.iterrows():
-        quantity = random.randint(1, 3)
-        price = product['base_price']
-        item_total = price * quantity
-        subtotal += item_total
-        
-        order_items.append({
-            'order_item_id': len(order_items) + 1,
-            'order_id': i,
-            'product_id': product['product_id'],
-            'quantity': quantity,
-            'unit_price': price,
-            'total_price': round(item_total, 2)
-        })
-    
-    # Apply random discount
-    discount = 0
-    if random.random() < 0.15:  # 15% chance of discount
-        discount = round(subtotal * random.uniform(0.05, 0.20), 2)
-    
-    delivery_fee = weighted_choice([0, 1.99, 2.99], [0.40, 0.40, 0.20])
-    total_amount = round(subtotal - discount + delivery_fee, 2)
-    
-    orders.append({
-        'order_id': i,
-        'customer_id': customer['customer_id'],
-        'shop_id': shop['shop_id'],
-        'order_date': order_date,
+def generate_orders(rng, order_ids, status, num_items, customer_ids, shops, products,
+                    first_item_id=1, first_delivery_id=1, skew=None):
+    """Generate orders, order items and deliveries for a batch of order IDs as columnar frames
+
+    skew optionally holds samplers ('customer', 'shop', 'product', 'day', 'hour'); a missing or
+    None entry keeps that draw uniform.
+    """
+    skew = skew or {}
+    num_orders = len(order_ids)
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+
+    # Order header draws
+    shop_idx = draw_indices(rng, len(shops), num_orders, skew.get('shop'))
+    num_days = (END_DATE - START_DATE).days + 1
+    day_offsets = draw_indices(rng, num_days, num_orders, skew.get('day'))
+    if skew.get('hour') is None:
+        second_offsets = rng.integers(0, 86400 + 1, num_orders)
+    else:
+        second_offsets = (draw_indices(rng, 24, num_orders, skew['hour']) * 3600
+                          + rng.integers(0, 3600, num_orders))
+    order_dates = (np.datetime64(START_DATE, 's')
+                   + day_offsets.astype('timedelta64[D]')
+                   + second_offsets.astype('timedelta64[s]'))
+
+    # Order items: distinct products per order, flattened in order_id order
+    product_draws = sample_distinct(rng, num_orders, 5, len(products), skew.get('product'))
+    product_idx = product_draws[np.arange(5) < num_items[:, None]]
+    item_order_pos = np.repeat(np.arange(num_orders), num_items)
+    quantity = rng.integers(1, 4, len(product_idx))
+    unit_price = products['base_price'].to_numpy()[product_idx]
+    item_total = unit_price * quantity
+    subtotal = np.bincount(item_order_pos, weights=item_total, minlength=num_orders)
+
+    # Pricing
+    discount = np.where(rng.random(num_orders) < 0.15,
+                        np.round(subtotal * rng.uniform(0.05, 0.20, num_orders), 2), 0.0)
+    delivery_fee = rng.choice([0, 1.99, 2.99], num_orders, p=[0.40, 0.40, 0.20])
+    total_amount = np.round(subtotal - discount + delivery_fee, 2)
+
+    df_orders = pd.DataFrame({
+        'order_id': order_ids,
+        'customer_id': customer_ids[draw_indices(rng, len(customer_ids), num_orders, skew.get('customer'))],
+        'shop_id': shops['shop_id'].to_numpy()[shop_idx],
+        'order_date': order_dates,
         'status': status,
-        'subtotal': round(subtotal, 2),
+        'subtotal': np.round(subtotal, 2),
         'discount': discount,
         'delivery_fee': delivery_fee,
         'total_amount': total_amount,
-        'payment_method': random.choice(payment_methods)
+        'payment_method': rng.choice(PAYMENT_METHODS, num_orders)
     })
-    
-    # Generate delivery record if delivered
-    if status == 'Delivered':
-        prep_time = shop['avg_preparation_time_minutes'] + random.randint(-3, 5)
-        delivery_time = random.randint(15, 45)
-        
-        deliveries.append({
-            'delivery_id': len(deliveries) + 1,
-            'order_id': i,
-            'preparation_time_minutes': max(prep_time, 3),
-            'delivery_time_minutes': delivery_time,
-            'total_time_minutes': prep_time + delivery_time,
-            'delivery_rating': weighted_choice([3, 4, 5], [0.10, 0.30, 0.60]) if random.random() < 0.70 else None
-        })
 
-df_orders = pd.DataFrame(orders)
-df_order_items = pd.DataFrame(order_items)
-df_deliveries = pd.DataFrame(deliveries)
-
-print(f"   Created {len(df_orders)} orders")
-print(f"   Created {len(df_order_items)} order items")
-print(f"   Created {len(df_deliveries)} delivery records")
-
-# Update customer statistics
-print("\n5. Updating customer statistics...")
-customer_stats = df_orders[df_orders['status'] == 'Delivered'].groupby('customer_id').agg({
-    'order_id': 'count',
-    'total_amount': 'sum',
-    'order_date': 'max'
-}).reset_index()
-customer_stats.columns = ['customer_id', 'total_orders', 'total_spent', 'last_order_date']
-
-df_customers = df_customers.merge(customer_stats, on='customer_id', how='left', suffixes=('', '_new'))
-df_customers['total_orders'] = df_customers['total_orders_new'].fillna(0).astype(int)
-df_customers['total_spent'] = df_customers['total_spent_new'].fillna(0).round(2)
-df_customers['last_order_date'] = df_customers['last_order_date_new']
-df_customers = df_customers.drop(columns=['total_orders_new', 'total_spent_new', 'last_order_date_new'])
-
-# 6. Generate Inventory
-print("\n6. Generating inventory table...")
-inventory = []
-for shop_id in df_shops[df_shops['is_active'] == True]['shop_id']:
-    # Each shop carries 60-80% of products
-    num_products_in_shop = int(len(df_products) * random.uniform(0.60, 0.80))
-    shop_products = df_products.sample(num_products_in_shop)
-    
-    for _, product in shop_products.iterrows():
-        stock_level = random.randint(0, 150)
-        inventory.append({
-            'inventory_id': len(inventory) + 1,
-            'shop_id': shop_id,
-            'product_id': product['product_id'],
-            'stock_level': stock_level,
-            'reorder_point': random.randint(10, 30),
-            'last_restocked': random_date(datetime(2026, 1, 1), datetime(2026, 2, 13)),
-            'is_available': stock_level > 0
+    df_order_items = pd.DataFrame({
+        'order_item_id': np.arange(first_item_id, first_item_id + len(product_idx)),
+        'order_id': order_ids[item_order_pos],
+        'product_id': products['product_id'].to_numpy()[product_idx],
+        'quantity': quantity,
+        'unit_price': unit_price,
+        'total_price': np.round(item_total, 2)
+    })
+
+    # Delivery records for delivered orders only
+    delivered = np.flatnonzero(status == 'Delivered')
+    num_delivered = len(delivered)
+    prep_time = (shops['avg_preparation_time_minutes'].to_numpy()[shop_idx[delivered]]
+                 + rng.integers(-3, 6, num_delivered))
+    delivery_time = rng.integers(15, 46, num_delivered)
+    rating = np.where(rng.random(num_delivered) < 0.70,
+                      rng.choice([3, 4, 5], num_delivered, p=[0.10, 0.30, 0.60]), np.nan)
+
+    df_deliveries = pd.DataFrame({
+        'delivery_id': np.arange(first_delivery_id, first_delivery_id + num_delivered),
+        'order_id': order_ids[delivered],
+        'preparation_time_minutes': np.maximum(prep_time, 3),
+        'delivery_time_minutes': delivery_time,
+        'total_time_minutes': prep_time + delivery_time,
+        'delivery_rating': rating
+    })
+
+    return df_orders, df_order_items, df_deliveries
+
+def generate_inventory(df_shops, df_products):
+    """Generate shop x product inventory for active shops"""
+    inventory = []
+    for shop_id in df_shops[df_shops['is_active'] == True]['shop_id']:
+        # Each shop carries 60-80% of products
+        num_products_in_shop = int(len(df_products) * random.uniform(0.60, 0.80))
+        shop_products = df_products.sample(num_products_in_shop)
+
+        for _, product in shop_products.iterrows():
+            stock_level = random.randint(0, 150)
+            inventory.append({
+                'inventory_id': len(inventory) + 1,
+                'shop_id': shop_id,
+                'product_id': product['product_id'],
+                'stock_level': stock_level,
+                'reorder_point': random.randint(10, 30),
+                'last_restocked': random_date(datetime(2026, 1, 1), datetime(2026, 2, 13)),
+                'is_available': stock_level > 0
+            })
+    return pd.DataFrame(inventory)
+
+def generate_promotions():
+    """Generate marketing promotions"""
+    promotion_types = ['Percentage Discount', 'Fixed Amount', 'Free Delivery', 'BOGO']
+    promotions = []
+    for i in range(1, 51):
+        start_date = random_date(datetime(2024, 1, 1), datetime(2026, 1, 31))
+        duration = random.randint(3, 21)
+        end_date = start_date + timedelta(days=duration)
+
+        promo_type = random.choice(promotion_types)
+        if promo_type == 'Percentage Discount':
+            discount_value = random.choice([5, 10, 15, 20, 25])
+        elif promo_type == 'Fixed Amount':
+            discount_value = random.choice([2, 3, 5, 10])
+        else:
+            discount_value = 0
+
+        promotions.append({
+            'promotion_id': i,
+            'promotion_name': f"{promo_type} - {random.choice(['Weekend', 'Flash', 'Weekly', 'Special', 'Holiday'])} Deal {i}",
+            'promotion_type': promo_type,
+            'discount_value': discount_value,
+            'start_date': start_date,
+            'end_date': end_date,
+            'min_order_value': random.choice([0, 15, 20, 25, 30]),
+            'total_uses': random.randint(50, 5000),
+            'total_revenue_impact': round(random.uniform(500, 50000), 2)
         })
+    return pd.DataFrame(promotions)
+
+
+class CustomerStats:
+    """Running per-customer aggregates (delivered orders only), folded in shard by shard"""
+
+    def __init__(self, customer_ids):
+        self.customer_ids = np.asarray(customer_ids)
+        self.total_orders = np.zeros(len(self.customer_ids), dtype=np.int64)
+        self.total_spent = np.zeros(len(self.customer_ids))
+        self.last_order = np.full(len(self.customer_ids), np.iinfo(np.int64).min)
+
+    @staticmethod
+    def partial(df_orders):
+        """Aggregate one batch of orders into (customer_ids, orders, spent, last order seconds)"""
+        delivered = df_orders[df_orders['status'] == 'Delivered']
+        ids, pos = np.unique(delivered['customer_id'].to_numpy(), return_inverse=True)
+        last_order = np.full(len(ids), np.iinfo(np.int64).min)
+        order_seconds = delivered['order_date'].to_numpy().astype('datetime64[s]').astype(np.int64)
+        np.maximum.at(last_order, pos, order_seconds)
+        return (ids,
+                np.bincount(pos, minlength=len(ids)),
+                np.bincount(pos, weights=delivered['total_amount'].to_numpy(), minlength=len(ids)),
+                last_order)
+
+    def fold(self, partial):
+        """Fold a partial aggregate into the running totals"""
+        ids, total_orders, total_spent, last_order = partial
+        pos = np.searchsorted(self.customer_ids, ids)
+        self.total_orders[pos] += total_orders
+        self.total_spent[pos] += total_spent
+        self.last_order[pos] = np.maximum(self.last_order[pos], last_order)
+
+    def apply(self, df_customers):
+        """Return df_customers with the aggregate columns filled in"""
+        df_customers = df_customers.copy()
+        has_orders = self.total_orders > 0
+        df_customers['total_orders'] = self.total_orders
+        df_customers['total_spent'] = self.total_spent.round(2)
+        df_customers['last_order_date'] = pd.Series(
+            np.where(has_orders, self.last_order, 0).astype('datetime64[s]'),
+            index=df_customers.index).where(has_orders)
+        return df_customers
+
+class TableWriter:
+    """Merges per-shard fact table parts into final CSVs, optionally split into order_date month folders"""
+
+    def __init__(self, output_dir, partition_by_month=False):
+        self.output_dir = Path(output_dir)
+        self.partition_by_month = partition_by_month
+        self.rows_written = {table: 0 for table in FACT_TABLES}
+        self._started = set()
+        for table in FACT_TABLES:
+            if partition_by_month:
+                shutil.rmtree(self.output_dir / table, ignore_errors=True)
+            (self.output_dir / f'{table}.csv').unlink(missing_ok=True)
+
+    def append_part(self, table, month, part_path):
+        """Append one shard's part file (with header) to the table output, then remove it"""
+        if self.partition_by_month:
+            dest = self.output_dir / table / f'order_month={month}' / f'{table}.csv'
+        else:
+            dest = self.output_dir / f'{table}.csv'
+        with open(part_path, 'rb') as src:
+            if dest in self._started:
+                src.readline()
+            else:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                self._started.add(dest)
+            with open(dest, 'ab') as out:
+                shutil.copyfileobj(src, out, 1 << 20)
+        Path(part_path).unlink()
+
+# Shard workers. A shard is a contiguous order_id range whose random streams depend
+# only on (seed, shard index), so output is identical for any number of workers.
+_shard_context = {}
 
-df_inventory = pd.DataFrame(inventory)
-print(f"   Created {len(df_inventory)} inventory records")
-
-# 7. Generate Promotions
-print("\n7. Generating promotions table...")
-promotion_types = ['Percentage Discount', 'Fixed Amount', 'Free Delivery', 'BOGO']
-promotions = []
-for i in range(1, 51):
-    start_date = random_date(datetime(2024, 1, 1), datetime(2026, 1, 31))
-    duration = random.randint(3, 21)
-    end_date = start_date + timedelta(days=duration)
-    
-    promo_type = random.choice(promotion_types)
-    if promo_type == 'Percentage Discount':
-        discount_value = random.choice([5, 10, 15, 20, 25])
-    elif promo_type == 'Fixed Amount':
-        discount_value = random.choice([2, 3, 5, 10])
+def shard_rngs(seed, shard):
+    """Independent plan and body generators for one shard"""
+    return (np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard, 0))),
+            np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(shard, 1))))
+
+def _init_shard_worker(context):
+    """Pool initializer: keep the dimension arrays each shard samples from"""
+    _shard_context.update(context)
+
+def _plan_shard(task):
+    """Count the order items and deliveries a shard will produce"""
+    shard, start, stop = task
+    plan_rng, _ = shard_rngs(_shard_context['seed'], shard)
+    status, num_items = draw_order_plan(plan_rng, stop - start)
+    return int(num_items.sum()), int((status == 'Delivered').sum())
+
+def _generate_shard(task):
+    """Generate one shard and write its tables as part files"""
+    shard, start, stop, first_item_id, first_delivery_id = task
+    ctx = _shard_context
+    plan_rng, rng = shard_rngs(ctx['seed'], shard)
+    status, num_items = draw_order_plan(plan_rng, stop - start)
+    tables = dict(zip(FACT_TABLES, generate_orders(
+        rng, np.arange(start, stop), status, num_items, ctx['customer_ids'], ctx['shops'],
+        ctx['products'], first_item_id, first_delivery_id, ctx['skew'])))
+
+    df_orders = tables['orders']
+    order_months = df_orders['order_date'].dt.strftime('%Y-%m')
+    month_by_order = pd.Series(order_months.to_numpy(), index=df_orders['order_id'])
+    parts = []
+    for table, df in tables.items():
+        if ctx['partition_by_month']:
+            months = month_by_order.reindex(df['order_id']).to_numpy()
+            groups = df.groupby(months, sort=True)
+        else:
+            groups = [(None, df)]
+        for month, part in groups:
+            part_path = Path(ctx['shard_dir']) / f'{table}-{month}-{shard:06d}.csv'
+            part.to_csv(part_path, index=False)
+            parts.append((table, month, part_path))
+
+    delivered = df_orders['status'] == 'Delivered'
+    return {
+        'parts': parts,
+        'rows': {table: len(df) for table, df in tables.items()},
+        'customers': CustomerStats.partial(df_orders),
+        'gmv': df_orders.loc[delivered, 'total_amount'].sum(),
+        'delivered': int(delivered.sum())
+    }
+
+def generate_sharded_orders(context, num_orders, chunk_size, workers, writer, customer_stats):
+    """Generate all orders shard by shard (optionally on a process pool) and merge in shard order"""
+    bounds = [(shard, start, min(start + chunk_size, num_orders + 1))
+              for shard, start in enumerate(range(1, num_orders + 1, chunk_size))]
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, _init_shard_worker, (context,))
+        imap = lambda fn, tasks: pool.imap(fn, tasks)
     else:
-        discount_value = 0
-    
-    promotions.append({
-        'promotion_id': i,
-        'promotion_name': f"{promo_type} - {random.choice(['Weekend', 'Flash', 'Weekly', 'Special', 'Holiday'])} Deal {i}",
-        'promotion_type': promo_type,
-        'discount_value': discount_value,
-        'start_date': start_date,
-        'end_date': end_date,
-        'min_order_value': random.choice([0, 15, 20, 25, 30]),
-        'total_uses': random.randint(50, 5000),
-        'total_revenue_impact': round(random.uniform(500, 50000), 2)
-    })
+        _init_shard_worker(context)
+        imap = map
+
+    try:
+        # Pass 1: size every shard so item and delivery IDs get disjoint, gap-free ranges
+        counts = np.array(list(imap(_plan_shard, bounds)), dtype=np.int64).reshape(-1, 2)
+        first_ids = np.vstack([np.zeros((1, 2), dtype=np.int64), np.cumsum(counts, axis=0)[:-1]]) + 1
+        tasks = [(shard, start, stop, int(first_ids[shard, 0]), int(first_ids[shard, 1]))
+                 for shard, start, stop in bounds]
+
+        # Pass 2: generate, merging parts and customer aggregates strictly in shard order
+        summary = {'gmv': 0.0, 'delivered': 0}
+        for shard, result in enumerate(imap(_generate_shard, tasks)):
+            for table, month, part_path in result['parts']:
+                writer.append_part(table, month, part_path)
+            for table, rows in result['rows'].items():
+                writer.rows_written[table] += rows
+            customer_stats.fold(result['customers'])
+            summary['gmv'] += result['gmv']
+            summary['delivered'] += result['delivered']
+            print(f"   Generated shard {shard + 1}/{len(bounds)} "
+                  f"({writer.rows_written['orders']:,}/{num_orders:,} orders)...", end='\r')
+        print()
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    return summary
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Generate the QuickShop Analytics dataset')
+    parser.add_argument('--scale-factor', type=float, default=1.0,
+                        help=f'multiple of the base dataset ({NUM_ORDERS:,} orders, {NUM_CUSTOMERS:,} customers)')
+    parser.add_argument('--orders', type=int, help='number of orders (overrides the scale factor)')
+    parser.add_argument('--seed', type=int, default=42, help='base random seed')
+    parser.add_argument('--workers', type=int, default=1, help='processes used to generate shards')
+    parser.add_argument('--output-dir', default='.', help='directory for the CSV files')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='orders per shard; part of the dataset identity together with the seed')
+    parser.add_argument('--partition-by-month', action='store_true',
+                        help='write orders, order_items and deliveries into order_date month folders')
+    parser.add_argument('--customer-skew', type=float, default=0.0,
+                        help='Zipf exponent for customer order frequency (0 = uniform)')
+    parser.add_argument('--shop-skew', type=float, default=0.0,
+                        help='Zipf exponent for shop popularity (0 = uniform)')
+    parser.add_argument('--product-skew', type=float, default=0.0,
+                        help='Zipf exponent for product popularity (0 = uniform)')
+    parser.add_argument('--seasonality', action='store_true',
+                        help='weight order_date by weekday and hour of day instead of uniformly')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    num_orders = args.orders if args.orders is not None else int(round(NUM_ORDERS * args.scale_factor))
+    num_customers = max(int(round(NUM_CUSTOMERS * args.scale_factor)), 1)
+
+    # Set random seed for reproducibility
+    np.random.seed(args.seed)
+    random.seed(args.seed)
+
+    print("Generating QuickShop Analytics Dataset...")
+    print("=" * 60)
+
+    # 1. Generate Local Shops
+    print("\n1. Generating local_shops table...")
+    df_shops = generate_local_shops()
+    print(f"   Created {len(df_shops)} local shops")
+
+    # 2. Generate Products
+    print("\n2. Generating products table...")
+    df_products = generate_products()
+    print(f"   Created {len(df_products)} products across {len(categories)} categories")
+
+    # 3. Generate Customers
+    print("\n3. Generating customers table...")
+    df_customers = generate_customers(num_customers)
+    print(f"   Created {len(df_customers)} customers")
+
+    # 4. Generate Orders (sharded, streamed to disk shard by shard)
+    print(f"\n4. Generating orders table ({args.workers} worker(s))...")
+    shard_dir = output_dir / '_shards'
+    shard_dir.mkdir(exist_ok=True)
+    active_shops = df_shops.loc[df_shops['is_active'] == True,
+                                ['shop_id', 'avg_preparation_time_minutes']].reset_index(drop=True)
+    popularity_rng = np.random.default_rng(np.random.SeedSequence(args.seed, spawn_key=(POPULARITY_STREAM,)))
+    skew = {
+        'customer': zipf_sampler(len(df_customers), args.customer_skew, popularity_rng),
+        'shop': zipf_sampler(len(active_shops), args.shop_skew, popularity_rng),
+        'product': zipf_sampler(len(df_products), args.product_skew, popularity_rng),
+        'day': seasonal_day_sampler() if args.seasonality else None,
+        'hour': seasonal_hour_sampler() if args.seasonality else None
+    }
+    context = {
+        'seed': args.seed,
+        'customer_ids': df_customers['customer_id'].to_numpy(),
+        'shops': active_shops,
+        'products': df_products[['product_id', 'base_price']],
+        'skew': skew,
+        'shard_dir': str(shard_dir),
+        'partition_by_month': args.partition_by_month
+    }
+    writer = TableWriter(output_dir, args.partition_by_month)
+    customer_stats = CustomerStats(df_customers['customer_id'].to_numpy())
+    summary = generate_sharded_orders(context, num_orders, args.chunk_size, args.workers,
+                                      writer, customer_stats)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+
+    print(f"   Created {writer.rows_written['orders']} orders")
+    print(f"   Created {writer.rows_written['order_items']} order items")
+    print(f"   Created {writer.rows_written['deliveries']} delivery records")
+
+    # 5. Update customer statistics (folded in shard by shard)
+    print("\n5. Updating customer statistics...")
+    df_customers = customer_stats.apply(df_customers)
+
+    # 6. Generate Inventory
+    print("\n6. Generating inventory table...")
+    df_inventory = generate_inventory(df_shops, df_products)
+    print(f"   Created {len(df_inventory)} inventory records")
+
+    # 7. Generate Promotions
+    print("\n7. Generating promotions table...")
+    df_promotions = generate_promotions()
+    print(f"   Created {len(df_promotions)} promotions")
+
+    # Save dimension tables to CSV (fact tables were written while generating)
+    print("\n8. Saving datasets to CSV files...")
+    df_shops.to_csv(output_dir / 'local_shops.csv', index=False)
+    df_products.to_csv(output_dir / 'products.csv', index=False)
+    df_customers.to_csv(output_dir / 'customers.csv', index=False)
+    df_inventory.to_csv(output_dir / 'inventory.csv', index=False)
+    df_promotions.to_csv(output_dir / 'promotions.csv', index=False)
+
+    print("\n" + "=" * 60)
+    print("Dataset Generation Complete!")
+    print("=" * 60)
+    print("\nDataset Summary:")
+    print(f"  Local Shops: {len(df_shops):,}")
+    print(f"  Products: {len(df_products):,}")
+    print(f"  Customers: {len(df_customers):,}")
+    print(f"  Orders: {num_orders:,}")
+    print(f"  Order Items: {writer.rows_written['order_items']:,}")
+    print(f"  Deliveries: {writer.rows_written['deliveries']:,}")
+    print(f"  Inventory Records: {len(df_inventory):,}")
+    print(f"  Promotions: {len(df_promotions):,}")
+    print("\nKey Statistics:")
+    print(f"  Date Range: {START_DATE.date()} to {END_DATE.date()}")
+    print(f"  Total GMV: €{summary['gmv']:,.2f}")
+    print(f"  Average Order Value: €{summary['gmv'] / max(summary['delivered'], 1):.2f}")
+    print(f"  Order Completion Rate: {summary['delivered'] / max(num_orders, 1) * 100:.1f}%")
+    print(f"  Active Shops: {df_shops['is_active'].sum()}")
+    print(f"  Product Categories: {df_products['category'].nunique()}")
+    print(f"\nAll CSV files saved to: {output_dir.resolve()}")
 
-df_promotions = pd.DataFrame(promotions)
-print(f"   Created {len(df_promotions)} promotions")
-
-# Save all datasets to CSV
-print("\n8. Saving datasets to CSV files...")
-output_dir = '.'
-
-df_shops.to_csv(f'{output_dir}/local_shops.csv', index=False)
-df_products.to_csv(f'{output_dir}/products.csv', index=False)
-df_customers.to_csv(f'{output_dir}/customers.csv', index=False)
-df_orders.to_csv(f'{output_dir}/orders.csv', index=False)
-df_order_items.to_csv(f'{output_dir}/order_items.csv', index=False)
-df_deliveries.to_csv(f'{output_dir}/deliveries.csv', index=False)
-df_inventory.to_csv(f'{output_dir}/inventory.csv', index=False)
-df_promotions.to_csv(f'{output_dir}/promotions.csv', index=False)
-
-print("\n" + "=" * 60)
-print("Dataset Generation Complete!")
-print("=" * 60)
-print("\nDataset Summary:")
-print(f"  Local Shops: {len(df_shops):,}")
-print(f"  Products: {len(df_products):,}")
-print(f"  Customers: {len(df_customers):,}")
-print(f"  Orders: {len(df_orders):,}")
-print(f"  Order Items: {len(df_order_items):,}")
-print(f"  Deliveries: {len(df_deliveries):,}")
-print(f"  Inventory Records: {len(df_inventory):,}")
-print(f"  Promotions: {len(df_promotions):,}")
-print("\nKey Statistics:")
-print(f"  Date Range: {START_DATE.date()} to {END_DATE.date()}")
-print(f"  Total GMV: €{df_orders[df_orders['status']=='Delivered']['total_amount'].sum():,.2f}")
-print(f"  Average Order Value: €{df_orders[df_orders['status']=='Delivered']['total_amount'].mean():.2f}")
-print(f"  Order Completion Rate: {(df_orders['status']=='Delivered').sum()/len(df_orders)*100:.1f}%")
-print(f"  Active Shops: {df_shops['is_active'].sum()}")
-print(f"  Product Categories: {df_products['category'].nunique()}")
-print("\nAll CSV files saved to: /home/ubuntu/quickshop-analytics/data/")
+if __name__ == "__main__":
+    main()
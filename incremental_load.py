@@ -0,0 +1,89 @@
+"""
+QuickShop Analytics - Incremental Load Helpers
+Watermark bookkeeping shared by the SQLite and MySQL loaders
+"""
+
+import pandas as pd
+import csv
+import os
+
+# Fact tables are append-only and watermarked on order_id; everything else is upserted
+FACT_TABLES = ['orders', 'order_items', 'deliveries']
+PRIMARY_KEYS = {
+    'local_shops': 'shop_id',
+    'products': 'product_id',
+    'customers': 'customer_id',
+    'orders': 'order_id',
+    'order_items': 'order_item_id',
+    'deliveries': 'delivery_id',
+    'inventory': 'inventory_id',
+    'promotions': 'promotion_id'
+}
+# Maintained from orders by the loader, never overwritten from customers.csv on upsert
+CUSTOMER_AGGREGATES = ['total_orders', 'total_spent', 'last_order_date']
+
+WATERMARK_DDL = """
+CREATE TABLE IF NOT EXISTS load_watermarks (
+    table_name VARCHAR(64) PRIMARY KEY,
+    high_water_mark BIGINT NOT NULL,
+    max_order_date VARCHAR(19),
+    csv_offset BIGINT NOT NULL DEFAULT 0,
+    updated_at VARCHAR(19) NOT NULL
+)
+"""
+
+def get_watermark(cursor, table_name, placeholder='?'):
+    """Return (high_water_mark, csv_offset) for a table, (0, 0) if it was never loaded"""
+    cursor.execute(f"SELECT high_water_mark, csv_offset FROM load_watermarks WHERE table_name = {placeholder}",
+                   (table_name,))
+    row = cursor.fetchone()
+    return (int(row[0]), int(row[1])) if row else (0, 0)
+
+def set_watermark(cursor, table_name, high_water_mark, max_order_date, csv_offset, placeholder='?'):
+    """Record a table's high-water mark (portable delete + insert)"""
+    cursor.execute(f"DELETE FROM load_watermarks WHERE table_name = {placeholder}", (table_name,))
+    cursor.execute(
+        f"INSERT INTO load_watermarks (table_name, high_water_mark, max_order_date, csv_offset, updated_at) "
+        f"VALUES ({', '.join([placeholder] * 5)})",
+        (table_name, int(high_water_mark), max_order_date, int(csv_offset),
+         pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')))
+
+def row_before(f, offset, names, window=65536):
+    """The CSV row that ends at byte offset, as {column: text}, or None when offset is not a row boundary"""
+    start = max(offset - window, 0)
+    f.seek(start)
+    tail = f.read(offset - start)
+    if not tail.endswith(b'\n'):
+        return None
+    line_start = tail.rfind(b'\n', 0, len(tail) - 1) + 1
+    if line_start == 0 and start > 0:
+        return None
+    values = next(csv.reader([tail[line_start:].decode('utf-8', errors='replace')]), [])
+    return dict(zip(names, values)) if len(values) == len(names) else None
+
+def iter_csv_delta(csv_path, offset, chunk_size, key='order_id', watermark=None):
+    """Yield DataFrame chunks for the rows stored after byte offset of an append-only CSV
+
+    The stored offset is only trusted when the row ending there still carries the
+    watermark key, i.e. the file was appended to since the last load. Otherwise
+    (the file was rewritten or regenerated) the whole file is read, so callers must
+    still filter rows against their watermark.
+    """
+    with open(csv_path, 'rb') as f:
+        names = next(csv.reader([f.readline().decode('utf-8')]))
+        header_end = f.tell()
+        if offset > header_end and offset <= os.path.getsize(csv_path):
+            row = row_before(f, offset, names)
+            if row is None or (watermark is not None and row.get(key) != str(watermark)):
+                offset = header_end
+        else:
+            offset = header_end
+        f.seek(offset)
+        for chunk in pd.read_csv(f, names=names, header=None, chunksize=chunk_size):
+            yield chunk
+
+def null_safe_rows(chunk):
+    """Rows of a chunk as tuples of Python values with NaN replaced by None"""
+    columns = [chunk[column].astype(object).where(chunk[column].notna(), None).tolist()
+               for column in chunk.columns]
+    return list(zip(*columns))
@@ -0,0 +1,154 @@
+"""
+QuickShop Analytics - KPI Service Load Test
+Keep-alive HTTP clients across processes against kpi_service.py, reporting throughput and latency
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+from multiprocessing import Pool
+import numpy as np
+
+from kpi_service import VIEWS, HOST, PORT, DB_PATH
+
+CONNECTIONS = 32  # per process
+PROCESSES = 2
+DURATION = 10.0
+REVALIDATE = 0.5  # share of requests that send If-None-Match with the last ETag seen
+SEED = 42
+
+def request_mix(base_url):
+    """Dashboard-like URLs: default pages, later pages and trailing date windows"""
+    with urllib.request.urlopen(f"{base_url}/kpi/daily_metrics?limit=1") as response:
+        latest = json.loads(response.read())['rows'][0][0]
+    last_day = np.datetime64(str(latest)[:10])
+    paths = [f'/kpi/{name}' for name in VIEWS]
+    paths += [f'/kpi/{name}?limit=50&offset={offset}' for name in ['shop_performance', 'product_performance']
+              for offset in [0, 50, 100]]
+    for name in ['daily_metrics', 'delivery_performance']:
+        for days in [7, 30, 90, 365]:
+            paths.append(f'/kpi/{name}?date_from={last_day - days + 1}&date_to={last_day}&limit=1000')
+    return paths
+
+async def read_response(reader):
+    """(status, headers, body) of one HTTP/1.1 response"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(':')
+        if name:
+            headers[name.strip().lower()] = value.strip()
+    body = await reader.readexactly(int(headers.get('content-length', 0)))
+    return status, headers, body
+
+async def client(host, port, paths, deadline, revalidate, rng, latencies, statuses):
+    """One keep-alive connection issuing requests back to back until the deadline"""
+    reader, writer = await asyncio.open_connection(host, port)
+    etags = {}
+    try:
+        while time.perf_counter() < deadline:
+            path = paths[rng.integers(len(paths))]
+            request = f"GET {path} HTTP/1.1\r\nHost: {host}\r\n"
+            if path in etags and rng.random() < revalidate:
+                request += f"If-None-Match: {etags[path]}\r\n"
+            start = time.perf_counter()
+            writer.write((request + "\r\n").encode('latin-1'))
+            status, headers, _ = await read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+            if 'etag' in headers:
+                etags[path] = headers['etag']
+    finally:
+        writer.close()
+
+async def run_clients(host, port, paths, connections, duration, revalidate, seed):
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+    rng = np.random.default_rng(seed)
+    await asyncio.gather(*[client(host, port, paths, deadline, revalidate, np.random.default_rng(rng.integers(2 ** 32)),
+                                  latencies, statuses) for _ in range(connections)])
+    return np.array(latencies), statuses
+
+def worker(task):
+    """Run one process's share of the connections; returns (latencies, status counts)"""
+    host, port, paths, connections, duration, revalidate, seed = task
+    return asyncio.run(run_clients(host, port, paths, connections, duration, revalidate, seed))
+
+def wait_for_service(base_url, timeout=60.0):
+    """Poll /health until the service answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"{base_url}/health", timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Load test the KPI service')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--connections', type=int, default=CONNECTIONS, help='keep-alive connections per process')
+    parser.add_argument('--processes', type=int, default=PROCESSES)
+    parser.add_argument('--duration', type=float, default=DURATION)
+    parser.add_argument('--revalidate', type=float, default=REVALIDATE,
+                        help='share of requests sent with If-None-Match')
+    parser.add_argument('--spawn', action='store_true', help='start kpi_service.py for the duration of the test')
+    parser.add_argument('--db-path', default=DB_PATH, help='database for --spawn')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - KPI Service Load Test")
+    print("=" * 60)
+    base_url = f"http://{args.host}:{args.port}"
+    service = None
+    if args.spawn:
+        service = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                 'kpi_service.py'),
+                                    '--db-path', args.db_path, '--host', args.host, '--port', str(args.port)])
+    try:
+        if not wait_for_service(base_url):
+            print(f"  ✗ No KPI service answering at {base_url}")
+            return
+        paths = request_mix(base_url)
+        print(f"\n{args.processes} processes x {args.connections} connections, {len(paths)} URLs, "
+              f"{args.duration:.0f}s, {args.revalidate:.0%} revalidating")
+        tasks = [(args.host, args.port, paths, args.connections, args.duration, args.revalidate, SEED + i)
+                 for i in range(args.processes)]
+        start = time.perf_counter()
+        with Pool(args.processes) as pool:
+            results = pool.map(worker, tasks)
+        elapsed = time.perf_counter() - start
+        latencies = np.concatenate([latencies for latencies, _ in results]) * 1000
+        statuses = {}
+        for _, counts in results:
+            for status, count in counts.items():
+                statuses[status] = statuses.get(status, 0) + count
+        p50, p99, p999 = np.percentile(latencies, [50, 99, 99.9])
+        print(f"  ✓ {len(latencies):,} requests in {elapsed:.1f}s: {len(latencies) / elapsed:,.0f} req/s")
+        print(f"  Client latency: p50 {p50:.2f} ms, p99 {p99:.2f} ms, p99.9 {p999:.2f} ms")
+        print(f"  Status codes: {', '.join(f'{status} x {count:,}' for status, count in sorted(statuses.items()))}")
+        with urllib.request.urlopen(f"{base_url}/stats") as response:
+            stats = json.loads(response.read())
+        print(f"  Service latency: p50 {stats['p50_ms']:.3f} ms, p99 {stats['p99_ms']:.3f} ms "
+              f"({stats['rendered']:,} responses rendered, {stats['precomputed']:,} served precomputed)")
+    finally:
+        if service:
+            # SIGINT lets the service print its own latency summary on the way out
+            service.send_signal(signal.SIGINT)
+            service.wait()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+"""
+QuickShop Analytics - KPI Service
+Asyncio HTTP service for the dashboard views, served from responses precomputed after each load
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import urlsplit, parse_qsl
+import numpy as np
+
+from db_pool import ConnectionPool
+from query_cache import QueryCache
+
+DB_PATH = 'quickshop.db'
+HOST = '127.0.0.1'
+PORT = 8080
+POOL_SIZE = 4
+REFRESH_SECONDS = 1.0  # how often data_versions is polled for finished loads
+REPORT_SECONDS = 10.0
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+MAX_RESPONSES = 4096  # rendered responses kept per data version, LRU beyond that
+LATENCY_WINDOW = 100_000  # most recent requests behind the reported percentiles
+
+# Endpoint -> ordering and optional date column for date_from / date_to filters
+VIEWS = {
+    'daily_metrics': {'order_by': 'date DESC', 'date_column': 'date'},
+    'shop_performance': {'order_by': 'shop_id', 'date_column': None},
+    'product_performance': {'order_by': 'product_id', 'date_column': None},
+    'delivery_performance': {'order_by': 'date DESC', 'date_column': 'date'},
+    'customer_segments_summary': {'order_by': 'customer_segment', 'date_column': None}
+}
+STATUS_TEXT = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+               405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+class BadRequest(Exception):
+    pass
+
+def json_value(value):
+    """Plain JSON-able value for a database value (MySQL returns Decimal and date objects)"""
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+def sqlite_reader(db_path):
+    """Connection factory for pooled read-only SQLite connections"""
+    def connect():
+        return sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=False)
+    return connect
+
+def mysql_reader():
+    """Connection factory for pooled read-only MySQL connections"""
+    from load_data_mysql import create_connection
+
+    def connect():
+        conn = create_connection()
+        if conn is None:
+            raise RuntimeError("could not connect to MySQL")
+        # Autocommit, so every poll sees the loads committed since the last one
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute("SET SESSION TRANSACTION READ ONLY")
+        cursor.close()
+        return conn
+    return connect
+
+class ViewSnapshot:
+    """All rows of one view at one data version, with the dates used for filtering"""
+
+    def __init__(self, name, tag, columns, rows):
+        self.name = name
+        self.tag = tag
+        self.columns = columns
+        self.rows = [[json_value(value) for value in row] for row in rows]
+        date_column = VIEWS[name]['date_column']
+        self.dates = None
+        if date_column:
+            index = columns.index(date_column)
+            self.dates = [str(row[index])[:10] for row in self.rows]
+
+    def select(self, date_from=None, date_to=None):
+        """Rows within [date_from, date_to], in view order"""
+        if date_from is None and date_to is None:
+            return self.rows
+        if self.dates is None:
+            raise BadRequest(f"{self.name} has no date column to filter on")
+        low, high = date_from or '0000-00-00', date_to or '9999-99-99'
+        return [row for row, day in zip(self.rows, self.dates) if low <= day <= high]
+
+def parse_query(query):
+    """(date_from, date_to, limit, offset) from a query string"""
+    params = dict(parse_qsl(query, keep_blank_values=True))
+    unknown = set(params) - {'date_from', 'date_to', 'limit', 'offset'}
+    if unknown:
+        raise BadRequest(f"unknown parameter(s): {', '.join(sorted(unknown))}")
+    for name in ['date_from', 'date_to']:
+        if name in params:
+            try:
+                params[name] = date.fromisoformat(params[name]).isoformat()
+            except ValueError:
+                raise BadRequest(f"{name} must be YYYY-MM-DD")
+    try:
+        limit = int(params.get('limit', DEFAULT_LIMIT))
+        offset = int(params.get('offset', 0))
+    except ValueError:
+        raise BadRequest("limit and offset must be integers")
+    if not 0 < limit <= MAX_LIMIT or offset < 0:
+        raise BadRequest(f"limit must be 1-{MAX_LIMIT} and offset non-negative")
+    return params.get('date_from'), params.get('date_to'), limit, offset
+
+class KpiService:
+    """View snapshots, rendered responses and latency counters behind the HTTP handler
+
+    Views are read through a pool of read-only connections whenever the
+    data_versions of their base tables move (every loader bumps them), and the
+    default page of each view is rendered right away. Other pages and date ranges
+    are rendered on first request and kept until the next version. ETags are
+    derived from the data version and the normalized parameters, so a client
+    revalidating with If-None-Match gets a bodyless 304 until the next load.
+    A full SQLite reload replaces the database file: the monitor reconnects to the
+    new file, and the pool and view dependencies are rebuilt with it.
+    """
+
+    def __init__(self, connect, pool_size=POOL_SIZE):
+        self.connect = connect
+        self.pool_size = pool_size
+        self.pool = ConnectionPool(connect, pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size)
+        # Version polling and view dependencies (views expanded to base tables) on a dedicated connection
+        self.monitor = QueryCache(connect(), max_entries=0, connect=connect)
+        self.reconnects = 0
+        self.dependencies = self.view_dependencies()
+        self.snapshots = {}
+        self.responses = OrderedDict()
+        self.latencies = np.zeros(LATENCY_WINDOW)
+        self.requests = 0
+        self.counters = {'precomputed': 0, 'rendered': 0, 'not_modified': 0, 'errors': 0, 'refreshes': 0,
+                         'reopens': 0}
+
+    def view_dependencies(self):
+        return {name: self.monitor.dependencies(f"SELECT * FROM {name}") for name in VIEWS}
+
+    def reopen(self):
+        """Point the pool and view dependencies at the database file the monitor reconnected to"""
+        self.pool.close()
+        self.pool = ConnectionPool(self.connect, self.pool_size)
+        self.dependencies = self.view_dependencies()
+        self.reconnects = self.monitor.counters['reconnects']
+        self.counters['reopens'] += 1
+
+    def read_view(self, name):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT * FROM {name} ORDER BY {VIEWS[name]['order_by']}")
+            columns = [d[0] for d in cursor.description]
+            rows = cursor.fetchall()
+            cursor.close()
+        return columns, rows
+
+    def version_tags(self):
+        """{view: tag} from the current data versions of each view's base tables
+
+        None while a reload is still building the database (no data_versions yet)
+        and there are snapshots to keep serving.
+        """
+        versions = self.monitor.versions()
+        if versions is None:
+            if self.snapshots:
+                return None
+            versions = {}
+        if self.monitor.counters['reconnects'] != self.reconnects:
+            # Only once the new file has versions, so its views are all in place
+            self.reopen()
+        return {name: hashlib.sha1(repr([(t, versions.get(t, 0)) for t in tables]).encode()).hexdigest()[:16]
+                for name, tables in self.dependencies.items()}
+
+    async def refresh(self):
+        """Reload views whose base tables changed; returns the names reloaded"""
+        loop = asyncio.get_running_loop()
+        tags = await loop.run_in_executor(self.executor, self.version_tags)
+        if tags is None:
+            return []
+        stale = [name for name, tag in tags.items()
+                 if name not in self.snapshots or self.snapshots[name].tag != tag]
+        if not stale:
+            return []
+        results = await asyncio.gather(*[loop.run_in_executor(self.executor, self.read_view, name)
+                                         for name in stale])
+        for name, (columns, rows) in zip(stale, results):
+            self.snapshots[name] = ViewSnapshot(name, tags[name], columns, rows)
+            for key in [key for key in self.responses if key[0] == name]:
+                del self.responses[key]
+            self.response(name, '')
+        self.counters['refreshes'] += 1
+        return stale
+
+    def response(self, name, query):
+        """(ETag, body) of a view request, rendered once per data version"""
+        key = (name, query)
+        entry = self.responses.get(key)
+        if entry is not None:
+            self.responses.move_to_end(key)
+            self.counters['precomputed'] += 1
+            return entry
+        snapshot = self.snapshots[name]
+        date_from, date_to, limit, offset = parse_query(query)
+        rows = snapshot.select(date_from, date_to)
+        body = json.dumps({'view': name, 'total': len(rows), 'offset': offset, 'limit': limit,
+                           'columns': snapshot.columns, 'rows': rows[offset:offset + limit]},
+                          separators=(',', ':')).encode()
+        etag = '"' + hashlib.sha1(f"{snapshot.tag}|{name}|{query}".encode()).hexdigest()[:20] + '"'
+        self.responses[key] = (etag, body)
+        self.counters['rendered'] += 1
+        while len(self.responses) > MAX_RESPONSES:
+            self.responses.popitem(last=False)
+        return etag, body
+
+    def record(self, seconds):
+        self.latencies[self.requests % LATENCY_WINDOW] = seconds
+        self.requests += 1
+
+    def stats(self):
+        """Request counters and latency percentiles (ms) over the recent window"""
+        window = self.latencies[:min(self.requests, LATENCY_WINDOW)] * 1000
+        p50, p99, p999 = np.percentile(window, [50, 99, 99.9]) if len(window) else (0.0, 0.0, 0.0)
+        return dict(self.counters, requests=self.requests, p50_ms=round(float(p50), 3),
+                    p99_ms=round(float(p99), 3), p999_ms=round(float(p999), 3),
+                    cached_responses=len(self.responses),
+                    versions={name: snapshot.tag for name, snapshot in self.snapshots.items()})
+
+    def route(self, method, target, headers):
+        """(status, extra headers, body) for one request"""
+        if method != 'GET':
+            return 405, {'Allow': 'GET'}, b''
+        url = urlsplit(target)
+        # Normalized parameter order, so equivalent URLs share a rendered response and ETag
+        query = '&'.join(sorted(url.query.split('&'))) if url.query else ''
+        if url.path == '/health':
+            return 200, {}, b'{"status":"ok"}'
+        if url.path == '/stats':
+            return 200, {'Cache-Control': 'no-store'}, json.dumps(self.stats()).encode()
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or parts[0] != 'kpi' or parts[1] not in VIEWS:
+            return 404, {}, json.dumps({'error': f"unknown endpoint {url.path}",
+                                        'endpoints': [f'/kpi/{name}' for name in VIEWS]}).encode()
+        if parts[1] not in self.snapshots:
+            return 503, {'Retry-After': '1'}, b'{"error":"views are still loading"}'
+        try:
+            etag, body = self.response(parts[1], query)
+        except BadRequest as e:
+            return 400, {}, json.dumps({'error': str(e)}).encode()
+        if headers.get('if-none-match') == etag:
+            self.counters['not_modified'] += 1
+            return 304, {'ETag': etag}, b''
+        return 200, {'ETag': etag, 'Cache-Control': 'no-cache'}, body
+
+    async def handle(self, reader, writer):
+        """Serve HTTP/1.1 requests on one keep-alive connection"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    break
+                start = time.perf_counter()
+                lines = head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = lines[0].split(' ', 2)
+                except ValueError:
+                    writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\nConnection: close\r\n\r\n')
+                    break
+                headers = {}
+                for line in lines[1:]:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                status, extra, body = self.route(method, target, headers)
+                if status >= 400:
+                    self.counters['errors'] += 1
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+                response = [f"{version} {status} {STATUS_TEXT[status]}",
+                            f"Content-Length: {len(body)}",
+                            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+                if body:
+                    response.append("Content-Type: application/json")
+                response += [f"{name}: {value}" for name, value in extra.items()]
+                writer.write(('\r\n'.join(response) + '\r\n\r\n').encode('latin-1') + body)
+                await writer.drain()
+                self.record(time.perf_counter() - start)
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    def close(self):
+        self.executor.shutdown()
+        self.pool.close()
+        self.monitor.conn.close()
+
+async def poll_versions(service, interval=REFRESH_SECONDS):
+    """Re-read views after loads, as data_versions changes"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            start = time.perf_counter()
+            reloaded = await service.refresh()
+            if reloaded:
+                print(f"  ✓ Precomputed {', '.join(reloaded)} after a load ({time.perf_counter() - start:.2f}s)")
+        except Exception as e:
+            print(f"  ✗ Refresh failed: {e}")
+
+async def report_latency(service, interval=REPORT_SECONDS):
+    """Print the service's own request rate and latency percentiles"""
+    last = 0
+    while True:
+        await asyncio.sleep(interval)
+        stats = service.stats()
+        if stats['requests'] > last:
+            print(f"  {(stats['requests'] - last) / interval:,.0f} req/s, p50 {stats['p50_ms']:.2f} ms, "
+                  f"p99 {stats['p99_ms']:.2f} ms, {stats['not_modified']:,} not modified")
+        last = stats['requests']
+
+async def serve(args):
+    connect = mysql_reader() if args.mysql else sqlite_reader(args.db_path)
+    service = KpiService(connect, args.pool_size)
+    start = time.perf_counter()
+    await service.refresh()
+    print(f"  ✓ Precomputed {len(service.snapshots)} views in {time.perf_counter() - start:.2f}s")
+    server = await asyncio.start_server(service.handle, args.host, args.port, backlog=1024)
+    print(f"  ✓ Serving on http://{args.host}:{args.port}/kpi/<view> "
+          f"({', '.join(VIEWS)}), /stats, /health")
+    tasks = [asyncio.create_task(poll_versions(service, args.refresh_seconds)),
+             asyncio.create_task(report_latency(service))]
+    try:
+        async with server:
+            if args.duration:
+                await asyncio.sleep(args.duration)
+            else:
+                await server.serve_forever()
+    finally:
+        for task in tasks:
+            task.cancel()
+        stats = service.stats()
+        print(f"\n  Served {stats['requests']:,} requests: p50 {stats['p50_ms']:.2f} ms, "
+              f"p99 {stats['p99_ms']:.2f} ms, p99.9 {stats['p999_ms']:.2f} ms")
+        service.close()
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Serve the dashboard views over HTTP')
+    parser.add_argument('--db-path', default=DB_PATH, help='SQLite database')
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL database from load_data_mysql.py')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--pool-size', type=int, default=POOL_SIZE, help='pooled read-only connections')
+    parser.add_argument('--refresh-seconds', type=float, default=REFRESH_SECONDS,
+                        help='data_versions polling interval')
+    parser.add_argument('--duration', type=float, default=0, help='stop after this many seconds (0 = run forever)')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - KPI Service")
+    print("=" * 60)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
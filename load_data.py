@@ -5,32 +5,26 @@ Loads CSV data into SQLite database
 
 import sqlite3
 import pandas as pd
+import argparse
+import time
+import sys
 import os
+import re
+
+from summary_tables import install_summaries, refresh_summaries, summaries_installed
+from columnar_cache import source_files, is_fresh, open_table
+from query_cache import bump_versions, QueryCache, cache_path
+from data_validation import ChunkValidator, QUARANTINE_DIR
+from load_verification import LoadFingerprint, verify_load
+from partitioning import is_partitioned, partition_fact_tables, index_partitions, insert_partitioned
+from incremental_load import (FACT_TABLES, PRIMARY_KEYS, CUSTOMER_AGGREGATES, WATERMARK_DDL,
+                              get_watermark, set_watermark, iter_csv_delta)
 
 # Configuration
 DB_PATH = 'quickshop.db'
 SCHEMA_PATH = 'schema.sql'
 DATA_DIR = '../data'
-
-print("QuickShop Analytics - Database Loader")
-print("=" * 60)
-
-# Remove existing database if it exists
-if os.path.exists(DB_PATH):
-    os.remove(DB_PATH)
-    print(f"Removed existing database: {DB_PATH}")
-
-# Create database connection
-conn = sqlite3.connect(DB_PATH)
-cursor = conn.cursor()
-print(f"\nCreated new database: {DB_PATH}")
-
-# Execute schema
-print("\nExecuting schema...")
-with open(SCHEMA_PATH, 'r') as f:
-    schema_sql = f.read()
-    cursor.executescript(schema_sql)
-print("Schema created successfully")
+BULK_CHUNK_SIZE = 200_000
 
 # Load data from CSV files
 tables = {
@@ -44,31 +38,20 @@ tables = {
     'promotions': 'promotions.csv'
 }
 
-print("\nLoading data into tables...")
-for table_name, csv_file in tables.items():
-    csv_path = os.path.join(DATA_DIR, csv_file)
-    df = pd.read_csv(csv_path)
-    df.to_sql(table_name, conn, if_exists='append', index=False)
-    print(f"  ✓ Loaded {len(df):,} rows into {table_name}")
-
-# Verify data
-print("\nVerifying database...")
-cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
-tables_in_db = cursor.fetchall()
-print(f"  Tables created: {len(tables_in_db)}")
-
-cursor.execute("SELECT name FROM sqlite_master WHERE type='view' ORDER BY name")
-views_in_db = cursor.fetchall()
-print(f"  Views created: {len(views_in_db)}")
-
-cursor.execute("SELECT name FROM sqlite_master WHERE type='index' ORDER BY name")
-indexes_in_db = cursor.fetchall()
-print(f"  Indexes created: {len(indexes_in_db)}")
-
-# Display sample statistics
-print("\n" + "=" * 60)
-print("Database Statistics")
-print("=" * 60)
+# Load-time settings: no rollback journal, no fsync, large page cache. Safe because a
+# failed bulk load is simply rerun against a fresh database file.
+BULK_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = OFF",
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -262144",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA locking_mode = EXCLUSIVE",
+]
+POST_LOAD_PRAGMAS = [
+    "PRAGMA journal_mode = DELETE",
+    "PRAGMA synchronous = FULL",
+    "PRAGMA locking_mode = NORMAL",
+]
 
 stats_queries = [
     ("Total Orders", "SELECT COUNT(*) FROM orders"),
@@ -80,16 +63,371 @@ stats_queries = [
     ("Order Completion Rate (%)", "SELECT ROUND(CAST(SUM(CASE WHEN status = 'Delivered' THEN 1 ELSE 0 END) AS REAL) / COUNT(*) * 100, 2) FROM orders"),
 ]
 
-for stat_name, query in stats_queries:
-    cursor.execute(query)
-    result = cursor.fetchone()[0]
-    print(f"  {stat_name}: {result:,}" if isinstance(result, int) else f"  {stat_name}: {result}")
+def split_schema(schema_sql):
+    """Split a schema script into (statements, CREATE INDEX statements)"""
+    statements, indexes = [], []
+    pending = ''
+    for line in schema_sql.splitlines(keepends=True):
+        if not pending and (not line.strip() or line.lstrip().startswith('--')):
+            continue
+        pending += line
+        if sqlite3.complete_statement(pending):
+            target = indexes if pending.lstrip().upper().startswith('CREATE INDEX') else statements
+            target.append(pending.strip())
+            pending = ''
+    return statements, indexes
+
+def load_table(conn, table_name, csv_path, validator=None, fingerprint=None):
+    """Load a whole CSV into a table with pandas"""
+    df = pd.read_csv(csv_path)
+    if validator:
+        df = validator.validate(table_name, df)
+    if fingerprint:
+        fingerprint.add(table_name, df)
+    if table_name in FACT_TABLES and is_partitioned(conn, table_name):
+        with conn:
+            return insert_partitioned(conn, table_name, df)
+    df.to_sql(table_name, conn, if_exists='append', index=False)
+    return len(df)
+
+def bulk_load_table(conn, table_name, csv_path, chunk_size=BULK_CHUNK_SIZE, cache_dir=None, validator=None,
+                    fingerprint=None):
+    """Stream a CSV into a table in chunks through executemany, one transaction per table
+
+    Chunks are parsed by the pandas C reader and bound as typed Python values
+    (column.tolist() zipped into rows), which avoids both per-row DataFrame access
+    and SQLite re-parsing numeric text. NaN binds as NULL. When cache_dir holds an
+    up-to-date columnar copy of the table, rows come from its memory-mapped columns
+    instead and no CSV is parsed. A validator filters each chunk before it is bound,
+    and a fingerprint records what was bound for verify_load. Partitioned fact
+    tables are written partition by partition, indexes left for index_partitions().
+    """
+    total_rows = 0
+    partitioned = table_name in FACT_TABLES and is_partitioned(conn, table_name)
+    with conn:
+        for columns, rows in iter_table_rows(table_name, csv_path, chunk_size, cache_dir, validator, fingerprint):
+            if partitioned:
+                chunk = pd.DataFrame.from_records(list(rows), columns=columns)
+                total_rows += insert_partitioned(conn, table_name, chunk, indexes=False)
+                continue
+            placeholders = ', '.join(['?'] * len(columns))
+            insert_sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders})"
+            cursor = conn.executemany(insert_sql, rows)
+            total_rows += cursor.rowcount
+    return total_rows
+
+def iter_table_rows(table_name, csv_path, chunk_size, cache_dir=None, validator=None, fingerprint=None):
+    """Yield (column names, row tuples) per chunk from the columnar cache or the CSV"""
+    if cache_dir:
+        _, size, mtime = source_files(os.path.dirname(csv_path))[table_name]
+        if is_fresh(os.path.join(cache_dir, table_name), size, mtime):
+            for columns, rows in open_table(cache_dir, table_name).iter_rows(chunk_size):
+                if validator or fingerprint:
+                    chunk = pd.DataFrame.from_records(list(rows), columns=columns)
+                    chunk = validator.validate(table_name, chunk) if validator else chunk
+                    if fingerprint:
+                        fingerprint.add(table_name, chunk)
+                    rows = zip(*[chunk[column].tolist() for column in columns])
+                yield columns, rows
+            return
+        print(f"  ! Columnar cache for {table_name} is missing or stale, reading the CSV")
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        if validator:
+            chunk = validator.validate(table_name, chunk)
+        if fingerprint:
+            fingerprint.add(table_name, chunk)
+        yield list(chunk.columns), zip(*[chunk[column].tolist() for column in chunk.columns])
+
+def load_fact_delta(conn, table_name, csv_path, chunk_size, affected_customers, validator=None, fingerprint=None):
+    """Append only rows past the table's order_id watermark, reading the CSV from the last offset
+
+    Runs inside the caller's transaction, so the rows and the new watermark commit together.
+    """
+    cursor = conn.cursor()
+    watermark, offset = get_watermark(cursor, table_name)
+    if fingerprint:
+        fingerprint.restrict(table_name, 'order_id', watermark)
+    end_offset = os.path.getsize(csv_path)
+    high_water_mark = watermark
+    total_rows = 0
+    partitioned = is_partitioned(conn, table_name)
+    for chunk in iter_csv_delta(csv_path, offset, chunk_size, watermark=watermark):
+        chunk = chunk[chunk['order_id'] > watermark]
+        if validator:
+            chunk = validator.validate(table_name, chunk)
+        if fingerprint:
+            fingerprint.add(table_name, chunk)
+        if chunk.empty:
+            continue
+        if partitioned:
+            insert_partitioned(conn, table_name, chunk)
+        else:
+            placeholders = ', '.join(['?'] * len(chunk.columns))
+            conn.executemany(f"INSERT INTO {table_name} ({', '.join(chunk.columns)}) VALUES ({placeholders})",
+                             zip(*[chunk[column].tolist() for column in chunk.columns]))
+        total_rows += len(chunk)
+        high_water_mark = max(high_water_mark, int(chunk['order_id'].max()))
+        if table_name == 'orders':
+            affected_customers.update(chunk['customer_id'].unique().tolist())
+    max_order_date = cursor.execute("SELECT MAX(order_date) FROM orders").fetchone()[0] \
+        if table_name == 'orders' else None
+    set_watermark(cursor, table_name, high_water_mark, max_order_date, end_offset)
+    return total_rows
+
+def upsert_dimension(conn, table_name, csv_path, chunk_size, validator=None, fingerprint=None):
+    """Insert new and update changed dimension rows keyed on the primary key"""
+    key = PRIMARY_KEYS[table_name]
+    total_rows = 0
+    for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+        if validator:
+            chunk = validator.validate(table_name, chunk, upsert=True)
+        if fingerprint:
+            fingerprint.add(table_name, chunk)
+        columns = list(chunk.columns)
+        updates = [c for c in columns if c != key
+                   and not (table_name == 'customers' and c in CUSTOMER_AGGREGATES)]
+        placeholders = ', '.join(['?'] * len(columns))
+        conn.executemany(
+            f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON CONFLICT({key}) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in updates)} "
+            f"WHERE {' OR '.join(f'{c} IS NOT excluded.{c}' for c in updates)}",
+            zip(*[chunk[column].tolist() for column in columns]))
+        total_rows += len(chunk)
+    return total_rows
+
+def refresh_customer_aggregates(conn, customer_ids):
+    """Recompute total_orders, total_spent and last_order_date for the given customers only"""
+    if not customer_ids:
+        return 0
+    conn.execute("CREATE TEMP TABLE IF NOT EXISTS affected_customers (customer_id INTEGER PRIMARY KEY)")
+    conn.execute("DELETE FROM temp.affected_customers")
+    conn.executemany("INSERT INTO temp.affected_customers VALUES (?)", ((c,) for c in customer_ids))
+    conn.execute("""
+        UPDATE customers SET
+            total_orders = (SELECT COUNT(*) FROM orders o
+                            WHERE o.customer_id = customers.customer_id AND o.status = 'Delivered'),
+            total_spent = (SELECT ROUND(COALESCE(SUM(o.total_amount), 0), 2) FROM orders o
+                           WHERE o.customer_id = customers.customer_id AND o.status = 'Delivered'),
+            last_order_date = (SELECT MAX(o.order_date) FROM orders o
+                               WHERE o.customer_id = customers.customer_id AND o.status = 'Delivered')
+        WHERE customer_id IN (SELECT customer_id FROM temp.affected_customers)
+    """)
+    return len(customer_ids)
+
+def incremental_load(conn, data_dir, chunk_size, validator=None, fingerprint=None):
+    """Load only new fact rows past each watermark and upsert the dimensions"""
+    conn.execute(WATERMARK_DDL)
+    if validator:
+        validator.attach_database(conn)
+    affected_customers = set()
+    total_rows = 0
+    # One transaction: a failure part-way leaves every table at its previous watermark
+    with conn:
+        for table_name, csv_file in tables.items():
+            csv_path = os.path.join(data_dir, csv_file)
+            table_start = time.perf_counter()
+            if table_name in FACT_TABLES:
+                rows = load_fact_delta(conn, table_name, csv_path, chunk_size, affected_customers, validator,
+                                       fingerprint)
+                action = 'Appended'
+            else:
+                rows = upsert_dimension(conn, table_name, csv_path, chunk_size, validator, fingerprint)
+                action = 'Upserted'
+            total_rows += rows
+            print(f"  ✓ {action} {rows:,} rows into {table_name} ({time.perf_counter() - table_start:.2f}s)")
+        refreshed = refresh_customer_aggregates(conn, affected_customers)
+        print(f"  ✓ Refreshed aggregates for {refreshed:,} affected customers")
+        bump_versions(conn.cursor(), list(tables))
+    return total_rows
+
+def refresh_summary_tables(conn, rebuild=False):
+    """Install the summary tables if needed and fold in orders since the last refresh"""
+    refresh_start = time.perf_counter()
+    install_summaries(conn)
+    result = refresh_summaries(conn, rebuild=rebuild)
+    print(f"  ✓ Refreshed summary tables: {result['orders']:,} orders, {result['dates']:,} dates "
+          f"in {time.perf_counter() - refresh_start:.2f}s")
+
+def print_database_summary(cursor, db_path, statistics=True):
+    """Print object counts and, unless a load verification replaces them, sample statistics"""
+    print("\nVerifying database...")
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")
+    tables_in_db = cursor.fetchall()
+    print(f"  Tables created: {len(tables_in_db)}")
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='view' ORDER BY name")
+    views_in_db = cursor.fetchall()
+    print(f"  Views created: {len(views_in_db)}")
+
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='index' ORDER BY name")
+    indexes_in_db = cursor.fetchall()
+    print(f"  Indexes created: {len(indexes_in_db)}")
+    if not statistics:
+        return
+
+    # Display sample statistics
+    print("\n" + "=" * 60)
+    print("Database Statistics")
+    print("=" * 60)
+
+    cache = QueryCache(cursor.connection, persist_path=cache_path(db_path))
+    for stat_name, query in stats_queries:
+        result = cache.fetch(query)[0][0]
+        print(f"  {stat_name}: {result:,}" if isinstance(result, int) else f"  {stat_name}: {result}")
+    cache.save()
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Load the QuickShop CSV files into SQLite')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--schema', default=SCHEMA_PATH)
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--bulk', action='store_true',
+                        help='stream CSVs in chunks with load-time PRAGMAs and build indexes after loading')
+    parser.add_argument('--chunk-size', type=int, default=BULK_CHUNK_SIZE,
+                        help='rows per executemany batch in bulk and incremental mode')
+    parser.add_argument('--cache-dir',
+                        help='in bulk mode, read tables from this columnar cache (see columnar_cache.py)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keep the database; append facts past the order_id watermark, upsert dimensions')
+    parser.add_argument('--refresh-summaries', action='store_true',
+                        help='install the materialized summary tables behind the dashboard views '
+                             '(later loads keep them refreshed)')
+    parser.add_argument('--validate', action='store_true',
+                        help='check every chunk while loading; rejected rows go to the quarantine directory')
+    parser.add_argument('--quarantine-dir', default=QUARANTINE_DIR)
+    parser.add_argument('--partition-by-month', action='store_true',
+                        help='store orders, order_items and deliveries as monthly partitions behind union views')
+    parser.add_argument('--verify', action='store_true',
+                        help='fingerprint the CSVs while loading and check them against one scan per table')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Database Loader")
+    print("=" * 60)
+    validator = ChunkValidator(args.quarantine_dir) if args.validate else None
+    fingerprint = None
+    if args.verify:
+        # Incremental loads recompute the customer aggregates, so they no longer match customers.csv
+        fingerprint = LoadFingerprint(skip_columns={'customers': CUSTOMER_AGGREGATES} if args.incremental else None)
+
+    if args.incremental and os.path.exists(args.db_path):
+        conn = sqlite3.connect(args.db_path)
+        cursor = conn.cursor()
+        print(f"\nIncremental load into existing database: {args.db_path}")
+        load_start = time.perf_counter()
+        total_rows = incremental_load(conn, args.data_dir, args.chunk_size, validator, fingerprint)
+        elapsed = time.perf_counter() - load_start
+        print(f"\n  Loaded {total_rows:,} rows in {elapsed:.2f}s")
+        if validator:
+            validator.print_summary()
+        # Once installed, the dashboard views read only the summary tables, so every load refreshes them
+        if args.refresh_summaries or summaries_installed(conn):
+            refresh_summary_tables(conn)
+        print_database_summary(cursor, args.db_path, statistics=not fingerprint)
+        verified = verify_load(conn, fingerprint) if fingerprint else True
+        conn.close()
+        if not verified:
+            sys.exit(1)
+        return
+
+    # Remove existing database if it exists, carrying its summary tables over to the new one
+    refresh = args.refresh_summaries
+    if os.path.exists(args.db_path):
+        previous = sqlite3.connect(args.db_path)
+        refresh = refresh or summaries_installed(previous)
+        previous.close()
+        os.remove(args.db_path)
+        print(f"Removed existing database: {args.db_path}")
+
+    # Create database connection
+    conn = sqlite3.connect(args.db_path)
+    cursor = conn.cursor()
+    print(f"\nCreated new database: {args.db_path}")
+
+    # Execute schema
+    print("\nExecuting schema...")
+    with open(args.schema, 'r') as f:
+        schema_sql = f.read()
+    if args.bulk:
+        for pragma in BULK_LOAD_PRAGMAS:
+            cursor.execute(pragma)
+        # Secondary indexes are built once after the data is in, not maintained per insert
+        schema_statements, index_statements = split_schema(schema_sql)
+        cursor.executescript(';\n'.join(schema_statements) + ';')
+        if args.partition_by_month:
+            # Partitions get their own indexes from index_partitions()
+            index_statements = [statement for statement in index_statements
+                                if not re.search(rf"\bON\s+({'|'.join(FACT_TABLES)})\s*\(", statement)]
+    else:
+        cursor.executescript(schema_sql)
+    if args.partition_by_month:
+        partition_fact_tables(conn, indexes=not args.bulk)
+    print("Schema created successfully" + (" (fact tables partitioned by month)" if args.partition_by_month else ''))
+
+    print("\nLoading data into tables...")
+    load_start = time.perf_counter()
+    total_rows = 0
+    for table_name, csv_file in tables.items():
+        csv_path = os.path.join(args.data_dir, csv_file)
+        table_start = time.perf_counter()
+        if args.bulk:
+            rows = bulk_load_table(conn, table_name, csv_path, args.chunk_size, args.cache_dir, validator,
+                                   fingerprint)
+        else:
+            rows = load_table(conn, table_name, csv_path, validator, fingerprint)
+        total_rows += rows
+        elapsed = time.perf_counter() - table_start
+        print(f"  ✓ Loaded {rows:,} rows into {table_name} ({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+
+    if args.bulk:
+        print("\nBuilding indexes...")
+        index_start = time.perf_counter()
+        with conn:
+            for statement in index_statements:
+                cursor.execute(statement)
+            if args.partition_by_month:
+                index_partitions(conn)
+        cursor.execute("ANALYZE")
+        for pragma in POST_LOAD_PRAGMAS:
+            cursor.execute(pragma)
+        print(f"  ✓ Built {len(index_statements)} indexes in {time.perf_counter() - index_start:.2f}s")
+
+    elapsed = time.perf_counter() - load_start
+    print(f"\n  Loaded {total_rows:,} rows in {elapsed:.2f}s ({total_rows / max(elapsed, 1e-9):,.0f} rows/s)")
+    if validator:
+        validator.print_summary()
+
+    # Record watermarks so later --incremental runs only pick up new rows
+    with conn:
+        cursor.execute(WATERMARK_DDL)
+        for table_name in FACT_TABLES:
+            csv_path = os.path.join(args.data_dir, tables[table_name])
+            high_water_mark = cursor.execute(f"SELECT COALESCE(MAX(order_id), 0) FROM {table_name}").fetchone()[0]
+            max_order_date = cursor.execute("SELECT MAX(order_date) FROM orders").fetchone()[0] \
+                if table_name == 'orders' else None
+            set_watermark(cursor, table_name, high_water_mark, max_order_date, os.path.getsize(csv_path))
+        # Invalidates any cached query results (see query_cache.py)
+        bump_versions(cursor, list(tables))
+
+    if refresh:
+        refresh_summary_tables(conn, rebuild=True)
+
+    print_database_summary(cursor, args.db_path, statistics=not fingerprint)
+    verified = verify_load(conn, fingerprint) if fingerprint else True
+
+    # Commit and close
+    conn.commit()
+    conn.close()
+    if not verified:
+        sys.exit(1)
 
-# Commit and close
-conn.commit()
-conn.close()
+    print("\n" + "=" * 60)
+    print("Database created and loaded successfully!")
+    print(f"Database location: {args.db_path}")
+    print("=" * 60)
 
-print("\n" + "=" * 60)
-print("Database created and loaded successfully!")
-print(f"Database location: {DB_PATH}")
-print("=" * 60)
+if __name__ == "__main__":
+    main()
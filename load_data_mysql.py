@@ -5,23 +5,45 @@ Loads CSV data into MySQL database
 """
 
 import mysql.connector
-from mysql.connector import Error
+from mysql.connector import Error, pooling
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
+import argparse
+import time
+import csv
 import os
+import re
+import sys
 from pathlib import Path
 
-# Database configuration
+from incremental_load import (FACT_TABLES, PRIMARY_KEYS, CUSTOMER_AGGREGATES, WATERMARK_DDL,
+                              get_watermark, set_watermark, iter_csv_delta, null_safe_rows)
+from summary_tables import MYSQL, install_summaries, refresh_summaries, summaries_installed
+from query_cache import bump_versions, QueryCache, CACHE_PATH
+from data_validation import ChunkValidator, QUARANTINE_DIR
+from load_verification import LoadFingerprint, verify_load
+from partitioning import (create_mysql_partitioned_tables, csv_months, mysql_is_partitioned,
+                          mysql_split_overflow)
+
+# Database configuration (QUICKSHOP_MYSQL_* environment variables override, e.g. for a
+# throwaway MySQL/MariaDB container)
 DB_CONFIG = {
-    'host': 'localhost',
-    'port': 3306,
-    'user': 'root', 
-    'password': 'Houseofgod12!',
-    'database': 'quickshop'
+    'host': os.environ.get('QUICKSHOP_MYSQL_HOST', 'localhost'),
+    'port': int(os.environ.get('QUICKSHOP_MYSQL_PORT', 3306)),
+    'user': os.environ.get('QUICKSHOP_MYSQL_USER', 'root'),
+    'password': os.environ.get('QUICKSHOP_MYSQL_PASSWORD', 'Houseofgod12!'),
+    'database': os.environ.get('QUICKSHOP_MYSQL_DATABASE', 'quickshop')
 }
 
 # Paths
 BASE_DIR = Path(__file__).parent.parent
-DATA_DIR = BASE_DIR / 'data'
+DATA_DIR = Path(os.environ.get('QUICKSHOP_DATA_DIR', BASE_DIR / 'data'))
+SCHEMA_PATH = Path(__file__).parent / 'schema_mysql_fixed.sql'
+
+# Fast path settings
+FAST_BATCH_ROWS = 50_000
+FAST_COMMIT_ROWS = 1_000_000
+LOCAL_INFILE_ERRORS = {1148, 2068, 3948}  # LOAD DATA LOCAL disabled on client or server
 
 def create_connection():
     """Create MySQL database connection"""
@@ -34,13 +56,18 @@ def create_connection():
         print(f"✗ Error connecting to MySQL: {e}")
         return None
 
-def load_csv_to_table(connection, csv_file, table_name, chunk_size=1000):
+def load_csv_to_table(connection, csv_file, table_name, chunk_size=1000, validator=None, fingerprint=None):
     """Load CSV file into MySQL table"""
     try:
         print(f"\nLoading {csv_file} into {table_name}...")
         
         # Read CSV
         df = pd.read_csv(DATA_DIR / csv_file)
+        if validator:
+            # Bad rows are quarantined here instead of failing (and rolling back) their chunk
+            df = validator.validate(table_name, df)
+        if fingerprint:
+            fingerprint.add(table_name, df)
         
         # Replace NaN with None (NULL in MySQL)
         df = df.where(pd.notnull(df), None)
@@ -77,11 +104,290 @@ def load_csv_to_table(connection, csv_file, table_name, chunk_size=1000):
         print(f"  ✗ Unexpected error: {e}")
         connection.rollback()
         return False
+    finally:
+        # Chunks are committed as they go, so even a failed load has changed the table
+        bump_table_versions(connection, [table_name])
+
+def bump_table_versions(connection, tables):
+    """Invalidate cached query results over these tables (see query_cache.py)"""
+    cursor = connection.cursor()
+    bump_versions(cursor, tables, '%s')
+    connection.commit()
+    cursor.close()
+
+def parse_fk_dependencies(schema_path=SCHEMA_PATH):
+    """Map each table in the schema to the set of tables its foreign keys reference"""
+    schema_sql = Path(schema_path).read_text()
+    dependencies = {}
+    for match in re.finditer(r'CREATE TABLE (\w+) \((.*?)\) ENGINE', schema_sql, re.S):
+        table, body = match.groups()
+        dependencies[table] = set(re.findall(r'REFERENCES (\w+)\(', body)) - {table}
+    return dependencies
+
+def dependency_levels(tables, dependencies):
+    """Group tables into levels; every table only references tables in earlier levels"""
+    remaining = set(tables)
+    levels = []
+    while remaining:
+        level = sorted(t for t in remaining if not (dependencies.get(t, set()) & remaining))
+        if not level:
+            raise ValueError(f"Circular foreign key dependencies between: {sorted(remaining)}")
+        levels.append(level)
+        remaining -= set(level)
+    return levels
+
+def load_data_infile(cursor, csv_path, table_name):
+    """Load a CSV with LOAD DATA LOCAL INFILE, mapping '' to NULL and True/False to 1/0"""
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        columns = next(csv.reader(f))
+    variables = ', '.join(f'@v{i}' for i in range(len(columns)))
+    assignments = ', '.join(
+        f"{column} = CASE @v{i} WHEN '' THEN NULL WHEN 'True' THEN 1 WHEN 'False' THEN 0 ELSE @v{i} END"
+        for i, column in enumerate(columns))
+    cursor.execute(f"""
+        LOAD DATA LOCAL INFILE '{Path(csv_path).resolve().as_posix()}'
+        INTO TABLE {table_name}
+        CHARACTER SET utf8mb4
+        FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"'
+        LINES TERMINATED BY '\\n'
+        IGNORE 1 LINES
+        ({variables})
+        SET {assignments}
+    """)
+    return cursor.rowcount
+
+def load_multirow_insert(connection, cursor, csv_path, table_name,
+                         batch_rows=FAST_BATCH_ROWS, commit_rows=FAST_COMMIT_ROWS, validator=None,
+                         fingerprint=None):
+    """Load a CSV with large multi-row INSERT batches, committing every commit_rows rows"""
+    total_rows = 0
+    uncommitted = 0
+    for chunk in pd.read_csv(csv_path, chunksize=batch_rows):
+        if validator:
+            chunk = validator.validate(table_name, chunk)
+        if fingerprint:
+            fingerprint.add(table_name, chunk)
+        columns = ', '.join(chunk.columns)
+        placeholders = ', '.join(['%s'] * len(chunk.columns))
+        # executemany rewrites a plain INSERT ... VALUES into one multi-row statement
+        values = [chunk[column].astype(object).where(chunk[column].notna(), None).tolist()
+                  for column in chunk.columns]
+        cursor.executemany(f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})",
+                           list(zip(*values)))
+        total_rows += len(chunk)
+        uncommitted += len(chunk)
+        if uncommitted >= commit_rows:
+            connection.commit()
+            uncommitted = 0
+    return total_rows
+
+def fast_load_table(connection, csv_file, table_name, use_local_infile=True, validator=None, fingerprint=None):
+    """Load one table with unique/FK checks off, via LOAD DATA or multi-row INSERTs
+
+    LOAD DATA hands the whole file to the server, so validated loads always use
+    multi-row INSERTs, and a fingerprint of a LOAD DATA table reads the CSV itself.
+    """
+    cursor = connection.cursor()
+    csv_path = DATA_DIR / csv_file
+    start = time.perf_counter()
+    try:
+        cursor.execute("SET SESSION unique_checks = 0")
+        cursor.execute("SET SESSION foreign_key_checks = 0")
+        method = 'LOAD DATA'
+        rows = None
+        if use_local_infile and not validator:
+            try:
+                rows = load_data_infile(cursor, csv_path, table_name)
+                if fingerprint:
+                    fingerprint.add_csv(table_name, csv_path)
+            except Error as e:
+                if e.errno not in LOCAL_INFILE_ERRORS:
+                    raise
+                print(f"  ! LOAD DATA LOCAL unavailable for {table_name} ({e.msg}), using multi-row INSERT")
+        if rows is None:
+            method = 'multi-row INSERT'
+            rows = load_multirow_insert(connection, cursor, csv_path, table_name, validator=validator,
+                                        fingerprint=fingerprint)
+        connection.commit()
+        elapsed = time.perf_counter() - start
+        print(f"  ✓ Loaded {rows:,} rows into {table_name} via {method} "
+              f"({rows / max(elapsed, 1e-9):,.0f} rows/s)")
+        return True
+    except Error as e:
+        print(f"  ✗ Error loading {csv_file}: {e}")
+        connection.rollback()
+        return False
+    finally:
+        cursor.execute("SET SESSION unique_checks = 1")
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+        cursor.close()
+        bump_table_versions(connection, [table_name])
+
+def fast_load_tables(load_order, workers=4, use_local_infile=True, validator=None, fingerprint=None):
+    """Load tables level by level along the FK graph, tables within a level in parallel"""
+    levels = dependency_levels([table for _, table in load_order], parse_fk_dependencies())
+    csv_by_table = {table: csv_file for csv_file, table in load_order}
+    pool = pooling.MySQLConnectionPool(pool_name='quickshop_fast_load',
+                                       pool_size=max(1, min(workers, 32)),
+                                       allow_local_infile=use_local_infile,
+                                       **DB_CONFIG)
+
+    def load(table):
+        connection = pool.get_connection()
+        try:
+            return fast_load_table(connection, csv_by_table[table], table, use_local_infile, validator, fingerprint)
+        finally:
+            connection.close()
+
+    success_count = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for depth, level in enumerate(levels):
+            print(f"\nLevel {depth}: {', '.join(level)}")
+            success_count += sum(executor.map(load, level))
+    return success_count
+
+def load_fact_delta(connection, csv_file, table_name, affected_customers, chunk_size=FAST_BATCH_ROWS,
+                    validator=None, fingerprint=None):
+    """Append only rows past the table's order_id watermark, reading the CSV from the last offset
+
+    Leaves committing to the caller, so the rows and the new watermark commit together.
+    """
+    cursor = connection.cursor()
+    csv_path = DATA_DIR / csv_file
+    watermark, offset = get_watermark(cursor, table_name, '%s')
+    if fingerprint:
+        fingerprint.restrict(table_name, 'order_id', watermark)
+    end_offset = os.path.getsize(csv_path)
+    high_water_mark = watermark
+    total_rows = 0
+    for chunk in iter_csv_delta(csv_path, offset, chunk_size, watermark=watermark):
+        chunk = chunk[chunk['order_id'] > watermark]
+        if validator:
+            chunk = validator.validate(table_name, chunk)
+        if fingerprint:
+            fingerprint.add(table_name, chunk)
+        if chunk.empty:
+            continue
+        placeholders = ', '.join(['%s'] * len(chunk.columns))
+        cursor.executemany(f"INSERT INTO {table_name} ({', '.join(chunk.columns)}) VALUES ({placeholders})",
+                           null_safe_rows(chunk))
+        total_rows += len(chunk)
+        high_water_mark = max(high_water_mark, int(chunk['order_id'].max()))
+        if table_name == 'orders':
+            affected_customers.update(chunk['customer_id'].unique().tolist())
+    max_order_date = None
+    if table_name == 'orders':
+        cursor.execute("SELECT MAX(order_date) FROM orders")
+        max_order_date = str(cursor.fetchone()[0])
+    set_watermark(cursor, table_name, high_water_mark, max_order_date, end_offset, '%s')
+    cursor.close()
+    return total_rows
+
+def upsert_dimension(connection, csv_file, table_name, chunk_size=FAST_BATCH_ROWS, validator=None,
+                     fingerprint=None):
+    """Insert new and update changed dimension rows keyed on the primary key"""
+    cursor = connection.cursor()
+    key = PRIMARY_KEYS[table_name]
+    total_rows = 0
+    for chunk in pd.read_csv(DATA_DIR / csv_file, chunksize=chunk_size):
+        if validator:
+            chunk = validator.validate(table_name, chunk, upsert=True)
+        if fingerprint:
+            fingerprint.add(table_name, chunk)
+        columns = list(chunk.columns)
+        updates = [c for c in columns if c != key
+                   and not (table_name == 'customers' and c in CUSTOMER_AGGREGATES)]
+        placeholders = ', '.join(['%s'] * len(columns))
+        cursor.executemany(
+            f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) "
+            f"ON DUPLICATE KEY UPDATE {', '.join(f'{c} = VALUES({c})' for c in updates)}",
+            null_safe_rows(chunk))
+        total_rows += len(chunk)
+    cursor.close()
+    return total_rows
+
+def refresh_customer_aggregates(connection, customer_ids):
+    """Recompute total_orders, total_spent and last_order_date for the given customers only"""
+    if not customer_ids:
+        return 0
+    cursor = connection.cursor()
+    cursor.execute("CREATE TEMPORARY TABLE IF NOT EXISTS affected_customers (customer_id INT PRIMARY KEY)")
+    cursor.execute("DELETE FROM affected_customers")
+    cursor.executemany("INSERT INTO affected_customers VALUES (%s)", [(c,) for c in customer_ids])
+    cursor.execute("""
+        UPDATE customers c
+        JOIN (
+            SELECT a.customer_id,
+                   COUNT(o.order_id) AS total_orders,
+                   ROUND(COALESCE(SUM(o.total_amount), 0), 2) AS total_spent,
+                   MAX(o.order_date) AS last_order_date
+            FROM affected_customers a
+            LEFT JOIN orders o ON o.customer_id = a.customer_id AND o.status = 'Delivered'
+            GROUP BY a.customer_id
+        ) agg ON agg.customer_id = c.customer_id
+        SET c.total_orders = agg.total_orders,
+            c.total_spent = agg.total_spent,
+            c.last_order_date = agg.last_order_date
+    """)
+    cursor.close()
+    return len(customer_ids)
+
+def incremental_load_tables(connection, load_order, validator=None, fingerprint=None):
+    """Load only new fact rows past each watermark and upsert the dimensions"""
+    cursor = connection.cursor()
+    cursor.execute(WATERMARK_DDL)
+    if validator:
+        validator.attach_database(connection, '%s')
+    cursor.close()
+    affected_customers = set()
+    success_count = 0
+    # One transaction: a failure part-way leaves every table at its previous watermark
+    try:
+        for csv_file, table_name in load_order:
+            if table_name in FACT_TABLES:
+                rows = load_fact_delta(connection, csv_file, table_name, affected_customers, validator=validator,
+                                       fingerprint=fingerprint)
+                print(f"  ✓ Appended {rows:,} new rows into {table_name}")
+            else:
+                rows = upsert_dimension(connection, csv_file, table_name, validator=validator,
+                                        fingerprint=fingerprint)
+                print(f"  ✓ Upserted {rows:,} rows into {table_name}")
+            success_count += 1
+        refreshed = refresh_customer_aggregates(connection, affected_customers)
+        connection.commit()
+    except Error as e:
+        print(f"  ✗ Error loading {csv_file}: {e}")
+        print("  ✗ Rolled back the incremental load; no table was changed")
+        connection.rollback()
+        return 0
+    print(f"  ✓ Refreshed aggregates for {refreshed:,} affected customers")
+    bump_table_versions(connection, [table_name for _, table_name in load_order])
+    return success_count
+
+def record_watermarks(connection, load_order):
+    """Record fact table watermarks after a full load so later runs can be incremental"""
+    csv_by_table = {table: csv_file for csv_file, table in load_order}
+    cursor = connection.cursor()
+    cursor.execute(WATERMARK_DDL)
+    for table_name in FACT_TABLES:
+        cursor.execute(f"SELECT COALESCE(MAX(order_id), 0) FROM {table_name}")
+        high_water_mark = cursor.fetchone()[0]
+        max_order_date = None
+        if table_name == 'orders':
+            cursor.execute("SELECT MAX(order_date) FROM orders")
+            max_order_date = str(cursor.fetchone()[0])
+        set_watermark(cursor, table_name, high_water_mark, max_order_date,
+                      os.path.getsize(DATA_DIR / csv_by_table[table_name]), '%s')
+    connection.commit()
+    cursor.close()
 
 def verify_data(connection):
-    """Verify loaded data with sample queries"""
+    """Verify loaded data with sample queries, answered from the query cache when the data has not changed"""
     try:
-        cursor = connection.cursor()
+        cache = QueryCache(connection, persist_path=CACHE_PATH)
+
+        def value(sql):
+            return cache.fetch(sql)[0][0]
         
         print("\n" + "="*60)
         print("DATA VERIFICATION")
@@ -93,76 +399,96 @@ def verify_data(connection):
         
         print("\nTable Row Counts:")
         for table in tables:
-            cursor.execute(f"SELECT COUNT(*) FROM {table}")
-            count = cursor.fetchone()[0]
+            count = value(f"SELECT COUNT(*) FROM {table}")
             print(f"  {table:20s}: {count:>8,} rows")
         
         # Sample business metrics
         print("\nBusiness Metrics:")
         
         # Total GMV
-        cursor.execute("""
+        gmv = value("""
             SELECT SUM(total_amount) as total_gmv
             FROM orders
             WHERE status = 'Delivered'
         """)
-        gmv = cursor.fetchone()[0]
         print(f"  Total GMV: €{gmv:,.2f}")
         
         # Total orders
-        cursor.execute("SELECT COUNT(*) FROM orders WHERE status = 'Delivered'")
-        orders = cursor.fetchone()[0]
+        orders = value("SELECT COUNT(*) FROM orders WHERE status = 'Delivered'")
         print(f"  Delivered Orders: {orders:,}")
         
         # Average order value
-        cursor.execute("""
+        aov = value("""
             SELECT AVG(total_amount) as aov
             FROM orders
             WHERE status = 'Delivered'
         """)
-        aov = cursor.fetchone()[0]
         print(f"  Average Order Value: €{aov:.2f}")
         
         # Completion rate
-        cursor.execute("""
+        completion = value("""
             SELECT 
                 COUNT(CASE WHEN status = 'Delivered' THEN 1 END) * 100.0 / COUNT(*) as completion_rate
             FROM orders
         """)
-        completion = cursor.fetchone()[0]
         print(f"  Order Completion Rate: {completion:.1f}%")
         
         # Active customers (skip if column doesn't exist)
         try:
-            cursor.execute("SELECT COUNT(*) FROM customers WHERE total_orders > 0")
-            active_customers = cursor.fetchone()[0]
+            active_customers = value("SELECT COUNT(*) FROM customers WHERE total_orders > 0")
             print(f"  Active Customers: {active_customers:,}")
         except:
             pass
         
         # Active shops
-        cursor.execute("SELECT COUNT(*) FROM local_shops WHERE is_active = 1")
-        active_shops = cursor.fetchone()[0]
+        active_shops = value("SELECT COUNT(*) FROM local_shops WHERE is_active = 1")
         print(f"  Active Shops: {active_shops:,}")
         
         # Date range
-        cursor.execute("""
+        first_date, last_date = cache.fetch("""
             SELECT 
                 MIN(DATE(order_date)) as first_order,
                 MAX(DATE(order_date)) as last_order
             FROM orders
-        """)
-        first_date, last_date = cursor.fetchone()
+        """)[0]
         print(f"  Date Range: {first_date} to {last_date}")
         
+        stats = cache.stats()
+        cache.save()
+        print(f"\n  Query cache: {stats['hits']} hits, {stats['misses']} misses")
         print("\n✓ Data verification complete!")
-        cursor.close()
         
     except Error as e:
         print(f"\n✗ Error during verification: {e}")
 
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Load the QuickShop CSV files into MySQL')
+    parser.add_argument('--fast', action='store_true',
+                        help='LOAD DATA LOCAL INFILE with checks off, parallel along the FK graph')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='parallel table loads (and pooled connections) in fast mode')
+    parser.add_argument('--no-local-infile', action='store_true',
+                        help='fast mode without LOAD DATA; use large multi-row INSERTs')
+    parser.add_argument('--incremental', action='store_true',
+                        help='append facts past the order_id watermark and upsert dimensions')
+    parser.add_argument('--refresh-summaries', action='store_true',
+                        help='install the materialized summary tables behind the dashboard views '
+                             '(later loads keep them refreshed)')
+    parser.add_argument('--validate', action='store_true',
+                        help='check every chunk while loading; rejected rows go to the quarantine directory')
+    parser.add_argument('--quarantine-dir', default=QUARANTINE_DIR)
+    parser.add_argument('--partition-by-month', action='store_true',
+                        help='recreate orders, order_items and deliveries RANGE-partitioned by order month '
+                             '(full loads only)')
+    parser.add_argument('--verify', action='store_true',
+                        help='fingerprint the CSVs while loading and check them against one scan per table '
+                             '(replaces the sample verification queries)')
+    return parser.parse_args()
+
 def main():
     """Main execution function"""
+    args = parse_args()
     print("="*60)
     print("QuickShop Analytics - MySQL Data Loader")
     print("="*60)
@@ -206,6 +532,7 @@ def main():
         print("  4. Run the schema: mysql -u root -p quickshop < schema_mysql.sql")
         return
     
+    verified = True
     try:
         # Load data in order (respecting foreign key constraints)
         load_order = [
@@ -223,15 +550,50 @@ def main():
         print("LOADING DATA")
         print("="*60)
         
-        success_count = 0
-        for csv_file, table_name in load_order:
-            if load_csv_to_table(connection, csv_file, table_name):
-                success_count += 1
+        validator = ChunkValidator(args.quarantine_dir) if args.validate else None
+        fingerprint = None
+        if args.verify:
+            # Incremental loads recompute the customer aggregates, so they no longer match customers.csv
+            fingerprint = LoadFingerprint(skip_columns={'customers': CUSTOMER_AGGREGATES} if args.incremental
+                                          else None)
+        if args.partition_by_month and not args.incremental:
+            months = csv_months(DATA_DIR / 'orders.csv')
+            create_mysql_partitioned_tables(connection, months)
+            print(f"  ✓ Recreated fact tables with {len(months)} monthly partitions")
+        load_start = time.perf_counter()
+        if args.incremental:
+            success_count = incremental_load_tables(connection, load_order, validator, fingerprint)
+            if mysql_is_partitioned(connection):
+                added = mysql_split_overflow(connection)
+                if added:
+                    print(f"  ✓ Split {len(added)} new month(s) out of the overflow partition")
+        elif args.fast:
+            success_count = fast_load_tables(load_order, args.workers, not args.no_local_infile, validator,
+                                             fingerprint)
+        else:
+            success_count = 0
+            for csv_file, table_name in load_order:
+                if load_csv_to_table(connection, csv_file, table_name, validator=validator, fingerprint=fingerprint):
+                    success_count += 1
+        if validator:
+            validator.print_summary()
+        if not args.incremental and success_count == len(load_order):
+            record_watermarks(connection, load_order)
+        # Once installed, the dashboard views read only the summary tables, so every load refreshes them.
+        # A full load replaces the fact tables, so every partition is recomputed
+        if args.refresh_summaries or summaries_installed(connection):
+            install_summaries(connection, MYSQL)
+            result = refresh_summaries(connection, MYSQL, rebuild=not args.incremental)
+            print(f"  ✓ Refreshed summary tables: {result['orders']:,} orders, {result['dates']:,} dates")
+        print(f"\n  Load time: {time.perf_counter() - load_start:.2f}s")
         
         print(f"\n✓ Successfully loaded {success_count}/{len(load_order)} tables")
         
         # Verify data
-        verify_data(connection)
+        if fingerprint:
+            verified = verify_load(connection, fingerprint, 'mysql')
+        else:
+            verify_data(connection)
         
         print("\n" + "="*60)
         print("NEXT STEPS")
@@ -254,6 +616,8 @@ def main():
         if connection and connection.is_connected():
             connection.close()
             print("\n✓ MySQL connection closed")
+    if not verified:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
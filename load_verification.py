@@ -0,0 +1,258 @@
+"""
+QuickShop Analytics - Load Verification
+Order-independent per-chunk fingerprints of the CSVs, checked against one scan per table
+"""
+
+import argparse
+import os
+import sys
+import time
+import zlib
+import sqlite3
+import numpy as np
+import pandas as pd
+
+from incremental_load import PRIMARY_KEYS
+
+DB_PATH = 'quickshop.db'
+DATA_DIR = '../data'
+CHUNK_SIZE = 200_000
+CHUNK_KEYS = 100_000  # primary key range covered by one fingerprint bucket
+
+# Column -> kind. Decimals are fingerprinted as integers scaled by 10^scale, so a
+# REAL in SQLite, a DECIMAL in MySQL and a float parsed from the CSV agree exactly.
+TABLE_COLUMNS = {
+    'local_shops': [('shop_id', 'int'), ('shop_name', 'text'), ('shop_type', 'text'), ('city', 'text'),
+                    ('district', 'text'), ('partnership_start_date', 'text'), ('commission_rate', 'dec2'),
+                    ('avg_preparation_time_minutes', 'int'), ('is_active', 'bool')],
+    'products': [('product_id', 'int'), ('product_name', 'text'), ('category', 'text'), ('subcategory', 'text'),
+                 ('base_price', 'dec2'), ('unit', 'text')],
+    'customers': [('customer_id', 'int'), ('registration_date', 'text'), ('city', 'text'),
+                  ('customer_segment', 'text'), ('total_orders', 'int'), ('total_spent', 'dec2'),
+                  ('last_order_date', 'text')],
+    'orders': [('order_id', 'int'), ('customer_id', 'int'), ('shop_id', 'int'), ('order_date', 'text'),
+               ('status', 'text'), ('subtotal', 'dec2'), ('discount', 'dec2'), ('delivery_fee', 'dec2'),
+               ('total_amount', 'dec2'), ('payment_method', 'text')],
+    'order_items': [('order_item_id', 'int'), ('order_id', 'int'), ('product_id', 'int'), ('quantity', 'int'),
+                    ('unit_price', 'dec2'), ('total_price', 'dec2')],
+    'deliveries': [('delivery_id', 'int'), ('order_id', 'int'), ('preparation_time_minutes', 'int'),
+                   ('delivery_time_minutes', 'int'), ('total_time_minutes', 'int'), ('delivery_rating', 'dec1')],
+    'inventory': [('inventory_id', 'int'), ('shop_id', 'int'), ('product_id', 'int'), ('stock_level', 'int'),
+                  ('reorder_point', 'int'), ('last_restocked', 'text'), ('is_available', 'bool')],
+    'promotions': [('promotion_id', 'int'), ('promotion_name', 'text'), ('promotion_type', 'text'),
+                   ('discount_value', 'dec2'), ('start_date', 'text'), ('end_date', 'text'),
+                   ('min_order_value', 'dec2'), ('total_uses', 'int'), ('total_revenue_impact', 'dec2')]
+}
+SCALES = {'int': 0, 'bool': 0, 'dec1': 1, 'dec2': 2}
+# Column totals reported alongside the row count and content hash
+SUM_COLUMNS = {
+    'orders': ['total_amount'],
+    'order_items': ['quantity'],
+    'inventory': ['stock_level']
+}
+
+SQL = {
+    'sqlite': {
+        'scaled': 'CAST(ROUND({column} * {factor}) AS INTEGER)',
+        'row_hash': lambda parts: 'crc32(' + " || '|' || ".join(parts) + ')',
+        'bucket': '{key} / {width}'
+    },
+    'mysql': {
+        'scaled': 'CAST(ROUND({column} * {factor}) AS SIGNED)',
+        'row_hash': lambda parts: f"CRC32(CONCAT_WS('|', {', '.join(parts)}))",
+        'bucket': '{key} DIV {width}'
+    }
+}
+
+def table_columns(table, skip_columns=()):
+    """Fingerprinted (column, kind) pairs of a table"""
+    return [(column, kind) for column, kind in TABLE_COLUMNS[table] if column not in skip_columns]
+
+def crc32(text):
+    """CRC-32 of a string's UTF-8 bytes, as MySQL's CRC32() computes it"""
+    return zlib.crc32(text.encode('utf-8'))
+
+def canonical_text(series, kind):
+    """Render a CSV column the way fingerprint_sql renders the stored values; NULL is ''"""
+    if kind == 'text':
+        return series.astype(object).where(series.notna(), '').astype(str)
+    if kind == 'bool':
+        values = series.astype(str).str.lower().map({'true': 1, '1': 1, 'false': 0, '0': 0})
+    else:
+        values = np.rint(pd.to_numeric(series, errors='coerce') * 10 ** SCALES[kind])
+    return values.astype('Int64').astype(str).where(values.notna(), '')
+
+def scaled_values(series, kind):
+    """Integer column values scaled by the kind's decimal places, as summed on both sides"""
+    return np.rint(pd.to_numeric(series, errors='coerce') * 10 ** SCALES[kind]).fillna(0).astype(np.int64)
+
+def chunk_fingerprint(table, chunk, width=CHUNK_KEYS, skip_columns=()):
+    """Per-bucket rows, summed row CRCs and column totals of one chunk"""
+    columns = table_columns(table, skip_columns)
+    kinds = dict(columns)
+    texts = [canonical_text(chunk[column], kind) for column, kind in columns]
+    rows = texts[0].str.cat(texts[1:], sep='|')
+    key = pd.to_numeric(chunk[PRIMARY_KEYS[table]], errors='coerce').fillna(-1).astype(np.int64)
+    frame = pd.DataFrame({
+        'bucket': (key // width).to_numpy(),
+        'row_count': 1,
+        'hash': np.fromiter((crc32(row) for row in rows), dtype=np.int64, count=len(rows))
+    })
+    for column in SUM_COLUMNS.get(table, []):
+        frame[f'sum_{column}'] = scaled_values(chunk[column], kinds[column]).to_numpy()
+    return frame.groupby('bucket').sum()
+
+def fingerprint_sql(table, dialect='sqlite', width=CHUNK_KEYS, scope=None, skip_columns=()):
+    """One GROUP BY query computing every bucket's fingerprint in a single scan of the table"""
+    sql = SQL[dialect]
+    columns = table_columns(table, skip_columns)
+    kinds = dict(columns)
+
+    def scaled(column):
+        return sql['scaled'].format(column=column, factor=10 ** SCALES[kinds[column]])
+
+    parts = [f"COALESCE({column if kind == 'text' else scaled(column)}, '')" for column, kind in columns]
+    sums = ''.join(f", SUM({scaled(column)}) AS sum_{column}" for column in SUM_COLUMNS.get(table, []))
+    where = f"WHERE {scope[0]} > {int(scope[1])}" if scope else ''
+    return (f"SELECT {sql['bucket'].format(key=PRIMARY_KEYS[table], width=width)} AS bucket, "
+            f"COUNT(*) AS row_count, SUM({sql['row_hash'](parts)}) AS hash{sums} "
+            f"FROM {table} {where} GROUP BY bucket")
+
+class LoadFingerprint:
+    """Fingerprints of the rows a loader hands to the database, accumulated chunk by chunk
+
+    Loaders call add() on each chunk after validation, so quarantined rows are
+    expected to be missing from the database. restrict() limits the database side
+    to rows past a watermark, for incremental loads that only read the CSV delta.
+    """
+
+    def __init__(self, width=CHUNK_KEYS, skip_columns=None):
+        self.width = width
+        self.skip_columns = skip_columns or {}
+        self.parts = {}
+        self.scopes = {}
+        self.elapsed = 0.0
+
+    def add(self, table, chunk):
+        start = time.perf_counter()
+        parts = self.parts.setdefault(table, [])
+        if len(chunk):
+            parts.append(chunk_fingerprint(table, chunk, self.width, self.skip_columns.get(table, ())))
+        self.elapsed += time.perf_counter() - start
+
+    def add_csv(self, table, csv_path, chunk_size=CHUNK_SIZE):
+        """Fingerprint a CSV the loader never parsed itself (e.g. one sent with LOAD DATA)"""
+        for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+            self.add(table, chunk)
+
+    def restrict(self, table, column, lower):
+        """Compare only database rows with column > lower"""
+        self.scopes[table] = (column, lower)
+
+    def source(self, table):
+        parts = self.parts.get(table, [])
+        if not parts:
+            return empty_fingerprint(table)
+        return pd.concat(parts).groupby(level=0).sum()
+
+def empty_fingerprint(table):
+    columns = ['row_count', 'hash'] + [f'sum_{column}' for column in SUM_COLUMNS.get(table, [])]
+    return pd.DataFrame(columns=columns, index=pd.Index([], name='bucket'), dtype=np.int64)
+
+def database_fingerprint(conn, table, dialect='sqlite', width=CHUNK_KEYS, scope=None, skip_columns=()):
+    """Per-bucket fingerprint of a loaded table"""
+    if dialect == 'sqlite':
+        conn.create_function('crc32', 1, crc32, deterministic=True)
+    cursor = conn.cursor()
+    cursor.execute(fingerprint_sql(table, dialect, width, scope, skip_columns))
+    columns = [d[0] for d in cursor.description]
+    rows = [[int(value) for value in row] for row in cursor.fetchall()]
+    cursor.close()
+    if not rows:
+        return empty_fingerprint(table)
+    return pd.DataFrame(rows, columns=columns).set_index('bucket')
+
+def compare_fingerprints(table, source, loaded, width=CHUNK_KEYS):
+    """[(key range, differences)] for every bucket whose fingerprints disagree"""
+    source, loaded = source.align(loaded, join='outer', fill_value=0)
+    mismatches = []
+    key = PRIMARY_KEYS[table]
+    for bucket in source.index[(source != loaded).any(axis=1)]:
+        low = max(int(bucket), 0) * width
+        differences = []
+        for column in source.columns:
+            expected, actual = int(source.at[bucket, column]), int(loaded.at[bucket, column])
+            if expected != actual:
+                if column == 'hash':
+                    differences.append('content hash')
+                elif column == 'row_count':
+                    differences.append(f"rows csv {expected:,} / db {actual:,}")
+                else:
+                    name = column[len('sum_'):]
+                    scale = SCALES[dict(TABLE_COLUMNS[table])[name]]
+                    differences.append(f"{name} csv {expected / 10 ** scale:,.{scale}f} "
+                                       f"/ db {actual / 10 ** scale:,.{scale}f}")
+        label = f"{key} {low:,}-{low + width - 1:,}" if bucket >= 0 else f"{key} missing"
+        mismatches.append((label, differences))
+    return mismatches
+
+def verify_load(conn, fingerprint, dialect='sqlite', tables=None):
+    """Check every fingerprinted table against one consolidated scan; True when all match"""
+    print("\n" + "=" * 60)
+    print("Load Verification")
+    print("=" * 60)
+    start = time.perf_counter()
+    passed = True
+    for table in tables or [t for t in TABLE_COLUMNS if t in fingerprint.parts or t in fingerprint.scopes]:
+        source = fingerprint.source(table)
+        loaded = database_fingerprint(conn, table, dialect, fingerprint.width, fingerprint.scopes.get(table),
+                                      fingerprint.skip_columns.get(table, ()))
+        mismatches = compare_fingerprints(table, source, loaded, fingerprint.width)
+        totals = source.sum()
+        kinds = dict(TABLE_COLUMNS[table])
+        sums = ''.join(f", {column} {totals[f'sum_{column}'] / 10 ** SCALES[kinds[column]]:,.{SCALES[kinds[column]]}f}"
+                       for column in SUM_COLUMNS.get(table, []))
+        marker = '✓' if not mismatches else '✗'
+        print(f"  {marker} {table}: {int(totals['row_count']):,} rows{sums}")
+        for label, differences in mismatches[:10]:
+            print(f"      {label}: {', '.join(differences)}")
+        if len(mismatches) > 10:
+            print(f"      ... {len(mismatches) - 10} more mismatched ranges")
+        passed = passed and not mismatches
+    print(f"  {'✓ Load verified' if passed else '✗ Load verification FAILED'} "
+          f"(source {fingerprint.elapsed:.2f}s, database {time.perf_counter() - start:.2f}s)")
+    return passed
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Check a loaded database against the CSV files')
+    parser.add_argument('--db-path', default=DB_PATH, help='SQLite database')
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL database from load_data_mysql.py')
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--chunk-keys', type=int, default=CHUNK_KEYS,
+                        help='primary key range per fingerprint bucket')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Load Verification")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn, dialect = create_connection(), 'mysql'
+        if conn is None:
+            return
+    else:
+        conn, dialect = sqlite3.connect(args.db_path), 'sqlite'
+
+    fingerprint = LoadFingerprint(args.chunk_keys)
+    for table in TABLE_COLUMNS:
+        fingerprint.add_csv(table, os.path.join(args.data_dir, f'{table}.csv'), args.chunk_size)
+    passed = verify_load(conn, fingerprint, dialect)
+    conn.close()
+    sys.exit(0 if passed else 1)
+
+if __name__ == "__main__":
+    main()
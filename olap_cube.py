@@ -0,0 +1,420 @@
+"""
+QuickShop Analytics - OLAP Cube
+Pre-aggregated orders / order_items cube with roll-up, slice, drill-down and moving averages
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import date
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from cohort_retention import dictionary_codes
+from summary_tables import date_ranges
+
+DB_PATH = 'quickshop.db'
+STATE_PATH = 'olap_cube.npz'
+DENSE_GROUPS = 1 << 22  # group with a bincount when the grouping has at most this many cells
+
+# Cells are (day, shop, status, payment_method[, category]); order measures cannot be split
+# by category, since an order's items can span several categories
+ORDER_MEASURES = ['orders', 'delivered_orders', 'total_amount', 'gmv', 'subtotal', 'discount', 'delivery_fee']
+ITEM_MEASURES = ['units', 'item_revenue', 'order_lines']
+COUNT_MEASURES = {'orders', 'delivered_orders', 'units', 'order_lines'}
+DERIVED_MEASURES = {  # measure -> (numerator, denominator)
+    'aov': ('gmv', 'delivered_orders'),
+    'avg_discount': ('discount', 'orders'),
+    'avg_item_price': ('item_revenue', 'units')
+}
+LEVELS = ['date', 'week', 'month', 'year', 'shop_id', 'district', 'city', 'shop_type',
+          'status', 'payment_method', 'category']
+HIERARCHIES = [['year', 'month', 'week', 'date'], ['city', 'district', 'shop_id']]
+
+ORDERS_SQL = """
+    SELECT DATE(order_date), shop_id, status, payment_method,
+        COUNT(*),
+        SUM(CASE WHEN status = 'Delivered' THEN 1 ELSE 0 END),
+        SUM(total_amount),
+        SUM(CASE WHEN status = 'Delivered' THEN total_amount ELSE 0 END),
+        SUM(subtotal),
+        SUM(discount),
+        SUM(delivery_fee)
+    FROM orders
+    WHERE order_date >= {p} AND order_date < {p}
+    GROUP BY DATE(order_date), shop_id, status, payment_method"""
+ITEMS_SQL = """
+    SELECT DATE(o.order_date), o.shop_id, o.status, o.payment_method, p.category,
+        SUM(oi.quantity),
+        SUM(oi.total_price),
+        COUNT(*)
+    FROM orders o
+    JOIN order_items oi ON oi.order_id = o.order_id
+    JOIN products p ON p.product_id = oi.product_id
+    WHERE o.order_date >= {p} AND o.order_date < {p}
+    GROUP BY DATE(o.order_date), o.shop_id, o.status, o.payment_method, p.category"""
+
+def to_days(values):
+    """Dates (strings or date objects) as days since the epoch"""
+    return pd.to_datetime(pd.Series(values).astype(str)).to_numpy('datetime64[D]').astype(np.int64)
+
+class Cube:
+    """Additive measures aggregated over dictionary-encoded dimension codes
+
+    Facts are held per cell as flat arrays ('orders' and 'items' grains). Shop
+    attributes (city, district, shop_type) and the coarser date levels are
+    derived from the shop_id and day codes at query time. A refresh drops and
+    recomputes only the dates touched by orders loaded since the last one.
+    """
+
+    def __init__(self):
+        self.facts = {
+            'orders': {'day': np.zeros(0, dtype=np.int32), 'shop': np.zeros(0, dtype=np.int32),
+                       'status': np.zeros(0, dtype=np.int16), 'payment_method': np.zeros(0, dtype=np.int16),
+                       **{m: np.zeros(0) for m in ORDER_MEASURES}},
+            'items': {'day': np.zeros(0, dtype=np.int32), 'shop': np.zeros(0, dtype=np.int32),
+                      'status': np.zeros(0, dtype=np.int16), 'payment_method': np.zeros(0, dtype=np.int16),
+                      'category': np.zeros(0, dtype=np.int16), **{m: np.zeros(0) for m in ITEM_MEASURES}}
+        }
+        self.dictionaries = {'status': [], 'payment_method': [], 'category': [],
+                             'city': [], 'district': [], 'shop_type': []}
+        self.shop_attributes = {name: np.zeros(0, dtype=np.int32) for name in ['city', 'district', 'shop_type']}
+        self.last_order_id = 0
+        self._codes = {}
+
+    def load_shops(self, conn):
+        """Refresh the shop_id -> city / district / shop_type lookup"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT shop_id, city, district, shop_type FROM local_shops")
+        shops = pd.DataFrame(cursor.fetchall(), columns=['shop_id', 'city', 'district', 'shop_type'])
+        cursor.close()
+        size = int(shops['shop_id'].max()) + 1 if len(shops) else 0
+        for name in ['city', 'district', 'shop_type']:
+            lookup = np.full(size, -1, dtype=np.int32)
+            lookup[shops['shop_id'].to_numpy()] = dictionary_codes(shops[name], self.dictionaries[name])
+            self.shop_attributes[name] = lookup
+
+    def replace_days(self, grain, days, cells):
+        """Swap the cells of the given days for freshly aggregated ones"""
+        facts = self.facts[grain]
+        keep = ~np.isin(facts['day'], days)
+        for column, values in facts.items():
+            facts[column] = np.concatenate([values[keep], cells[column].astype(values.dtype)])
+        self._codes = {}
+
+    def refresh_from_db(self, conn, placeholder='?'):
+        """Recompute every date with orders past last_order_id; returns the number of dates refreshed"""
+        self.load_shops(conn)
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+        high = int(cursor.fetchone()[0])
+        cursor.execute(f"SELECT DISTINCT DATE(order_date) FROM orders WHERE order_id > {placeholder} "
+                       f"AND order_id <= {placeholder}", (self.last_order_id, high))
+        touched = sorted(day if isinstance(day, date) else date.fromisoformat(str(day))
+                         for (day,) in cursor.fetchall())
+        for first, last in date_ranges(touched):
+            bounds = (first.isoformat(), (last + pd.Timedelta(days=1)).isoformat())
+            days = np.arange(to_days([first])[0], to_days([last])[0] + 1)
+            cursor.execute(ORDERS_SQL.format(p=placeholder), bounds)
+            rows = pd.DataFrame(cursor.fetchall(), columns=['day', 'shop', 'status', 'payment_method']
+                                + ORDER_MEASURES)
+            self.replace_days('orders', days, self.encode(rows))
+            cursor.execute(ITEMS_SQL.format(p=placeholder), bounds)
+            rows = pd.DataFrame(cursor.fetchall(), columns=['day', 'shop', 'status', 'payment_method', 'category']
+                                + ITEM_MEASURES)
+            self.replace_days('items', days, self.encode(rows))
+        cursor.close()
+        self.last_order_id = high
+        return len(touched)
+
+    def encode(self, rows):
+        """Dictionary-encode an aggregated result set into fact columns"""
+        cells = {'day': to_days(rows['day']) if len(rows) else np.zeros(0, dtype=np.int64),
+                 'shop': rows['shop'].to_numpy(np.int64)}
+        for name in ['status', 'payment_method', 'category']:
+            if name in rows:
+                cells[name] = dictionary_codes(rows[name], self.dictionaries[name]) if len(rows) \
+                    else np.zeros(0, dtype=np.int32)
+        for measure in ORDER_MEASURES + ITEM_MEASURES:
+            if measure in rows:
+                cells[measure] = rows[measure].to_numpy(np.float64)
+        return cells
+
+    def codes(self, grain, level):
+        """(codes per cell, labels) of a dimension level for one fact grain"""
+        if (grain, level) not in self._codes:
+            facts = self.facts[grain]
+            day = facts['day'].astype(np.int64)
+            if level in ('date', 'week', 'month', 'year'):
+                if level == 'date':
+                    units = day
+                elif level == 'week':
+                    units = (day + 3) // 7  # weeks starting on Monday (day 0 was a Thursday)
+                else:
+                    units = day.astype('datetime64[D]').astype(f'datetime64[{level[0].upper()}]').astype(np.int64)
+                low = int(units.min()) if len(units) else 0
+                size = int(units.max()) - low + 1 if len(units) else 0
+                span = np.arange(low, low + size)
+                if level == 'date':
+                    labels = span.astype('datetime64[D]').astype(str)
+                elif level == 'week':
+                    labels = (span * 7 - 3).astype('datetime64[D]').astype(str)
+                else:
+                    labels = span.astype(f'datetime64[{level[0].upper()}]').astype(str)
+                self._codes[grain, level] = (units - low, labels.tolist())
+            elif level == 'shop_id':
+                shops = np.unique(facts['shop'])
+                self._codes[grain, level] = (np.searchsorted(shops, facts['shop']), shops.tolist())
+            elif level in self.shop_attributes:
+                lookup = self.shop_attributes[level]
+                shop = facts['shop']
+                known = shop < len(lookup)
+                codes = np.full(len(shop), len(self.dictionaries[level]))  # unknown shops -> 'Unknown'
+                codes[known] = np.where(lookup[shop[known]] >= 0, lookup[shop[known]], codes[known])
+                self._codes[grain, level] = (codes, self.dictionaries[level] + ['Unknown'])
+            elif level in facts:
+                self._codes[grain, level] = (facts[level].astype(np.int64), list(self.dictionaries[level]))
+            else:
+                raise ValueError(f"{grain} facts have no {level} dimension")
+        return self._codes[grain, level]
+
+    def aggregate(self, grain, by, where, measures):
+        """Sum measures of one fact grain grouped by the given levels, over cells matching where"""
+        facts = self.facts[grain]
+        mask = np.ones(len(facts['day']), dtype=bool)
+        for level, values in where.items():
+            codes, labels = self.codes(grain, level)
+            wanted = {str(v) for v in (values if isinstance(values, (list, tuple, set)) else [values])}
+            mask &= np.isin(codes, [code for code, label in enumerate(labels) if str(label) in wanted])
+        group = np.zeros(int(mask.sum()), dtype=np.int64)
+        sizes = []
+        for level in by:
+            codes, labels = self.codes(grain, level)
+            group = group * len(labels) + codes[mask]
+            sizes.append(len(labels))
+        cells = int(np.prod(sizes, dtype=np.float64)) if sizes else 1
+        if cells <= DENSE_GROUPS:
+            counts = np.bincount(group, minlength=cells)
+            present = np.flatnonzero(counts)
+            sums = {m: np.bincount(group, weights=facts[m][mask], minlength=cells)[present] for m in measures}
+        else:
+            present, inverse = np.unique(group, return_inverse=True)
+            sums = {m: np.bincount(inverse, weights=facts[m][mask], minlength=len(present)) for m in measures}
+        result = {}
+        remainder = present
+        for level, size in reversed(list(zip(by, sizes))):
+            remainder, code = np.divmod(remainder, size)
+            result[level] = np.asarray(self.codes(grain, level)[1], dtype=object)[code]
+        frame = pd.DataFrame({level: result[level] for level in by})
+        for measure in measures:
+            frame[measure] = np.rint(sums[measure]).astype(np.int64) if measure in COUNT_MEASURES else sums[measure]
+        return frame
+
+    def query(self, measures, by=(), where=None):
+        """Measures (additive or derived) grouped by levels; where maps level -> label or labels"""
+        by, where = list(by), dict(where or {})
+        unknown = [level for level in by + list(where) if level not in LEVELS]
+        if unknown:
+            raise ValueError(f"Unknown dimension levels: {unknown}")
+        needed = []
+        for measure in measures:
+            for base in DERIVED_MEASURES.get(measure, (measure,)):
+                if base not in ORDER_MEASURES + ITEM_MEASURES:
+                    raise ValueError(f"Unknown measure: {base}")
+                if base not in needed:
+                    needed.append(base)
+        frames = []
+        for grain, grain_measures in [('orders', ORDER_MEASURES), ('items', ITEM_MEASURES)]:
+            wanted = [m for m in needed if m in grain_measures]
+            if wanted:
+                if grain == 'orders' and 'category' in by + list(where):
+                    raise ValueError(f"{wanted} are order measures and cannot be split by category")
+                frames.append(self.aggregate(grain, by, where, wanted))
+        frame = frames[0]
+        for other in frames[1:]:
+            frame = frame.merge(other, on=by, how='outer').fillna(0) if by else pd.concat([frame, other], axis=1)
+        for measure in measures:
+            if measure in DERIVED_MEASURES:
+                numerator, denominator = DERIVED_MEASURES[measure]
+                frame[measure] = frame[numerator] / frame[denominator].replace(0, np.nan)
+        return frame.sort_values(by).reset_index(drop=True)[by + list(measures)] if by \
+            else frame[list(measures)]
+
+    def view(self, by=(), **where):
+        """Start a drill-down / roll-up session"""
+        return CubeView(self, tuple(by), where)
+
+    def save(self, path):
+        """Persist facts, dictionaries and the order watermark"""
+        arrays = {f'{grain}__{column}': values for grain, facts in self.facts.items()
+                  for column, values in facts.items()}
+        arrays.update({f'dictionary__{name}': np.array(values, dtype=str) for name, values in self.dictionaries.items()})
+        arrays.update({f'shop__{name}': values for name, values in self.shop_attributes.items()})
+        np.savez(path, last_order_id=self.last_order_id, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        """Restore a cube written by save()"""
+        state = np.load(path)
+        cube = cls()
+        for grain, facts in cube.facts.items():
+            for column in facts:
+                facts[column] = state[f'{grain}__{column}']
+        cube.dictionaries = {name: state[f'dictionary__{name}'].tolist() for name in cube.dictionaries}
+        cube.shop_attributes = {name: state[f'shop__{name}'] for name in cube.shop_attributes}
+        cube.last_order_id = int(state['last_order_id'])
+        return cube
+
+class CubeView:
+    """A grouping plus filters over a cube; each operation returns a new view"""
+
+    def __init__(self, cube, by, where):
+        self.cube = cube
+        self.by = by
+        self.where = where
+
+    def slice(self, **where):
+        """Restrict to the given labels (a label or a list of labels per level)"""
+        return CubeView(self.cube, self.by, {**self.where, **where})
+
+    def drill_down(self, level):
+        """Group by a finer level, replacing a coarser level of the same hierarchy"""
+        for hierarchy in HIERARCHIES:
+            if level in hierarchy:
+                by = tuple(level if l in hierarchy and hierarchy.index(l) < hierarchy.index(level) else l
+                           for l in self.by)
+                return CubeView(self.cube, by if level in by else by + (level,), self.where)
+        return CubeView(self.cube, self.by if level in self.by else self.by + (level,), self.where)
+
+    def roll_up(self, level):
+        """Stop grouping by a level, climbing to its parent in the hierarchy when there is one"""
+        for hierarchy in HIERARCHIES:
+            if level in hierarchy and hierarchy.index(level) > 0:
+                parent = hierarchy[hierarchy.index(level) - 1]
+                if parent not in self.by:
+                    return CubeView(self.cube, tuple(parent if l == level else l for l in self.by), self.where)
+        return CubeView(self.cube, tuple(l for l in self.by if l != level), self.where)
+
+    def result(self, measures=('gmv',)):
+        """Measures over the view's grouping"""
+        return self.cube.query(measures, self.by, self.where)
+
+    def moving_average(self, measure='gmv', days=7):
+        """Trailing moving average of an additive measure per date, with empty days counted as 0"""
+        if measure in DERIVED_MEASURES:
+            raise ValueError(f"{measure} is a ratio; average its numerator and denominator instead")
+        by = tuple(l for l in self.by if l not in ('week', 'month', 'year', 'date'))
+        frame = self.cube.query([measure], ('date',) + by, self.where)
+        if frame.empty:
+            return frame.assign(**{f'{measure}_ma{days}': []})
+        day = to_days(frame['date'])
+        first = int(day.min())
+        span = int(day.max()) - first + 1
+        groups = frame.groupby(list(by), sort=True).ngroup().to_numpy() if by else np.zeros(len(frame), dtype=np.int64)
+        keys = frame.drop_duplicates(list(by)).sort_values(list(by))[list(by)] if by else pd.DataFrame(index=[0])
+        dense = np.zeros((len(keys), span))
+        dense[groups, day - first] = frame[measure].to_numpy()
+        cumulative = np.cumsum(dense, axis=1)
+        windowed = cumulative.copy()
+        windowed[:, days:] -= cumulative[:, :-days]
+        result = pd.DataFrame({
+            'date': np.tile(np.arange(first, first + span).astype('datetime64[D]').astype(str), len(keys)),
+            measure: dense.ravel(),
+            f'{measure}_ma{days}': (windowed / np.minimum(np.arange(1, span + 1), days)).ravel()
+        })
+        for level in by:
+            result.insert(0, level, np.repeat(keys[level].to_numpy(), span))
+        return result
+
+REFERENCE_SQL = {
+    'item_revenue by city x shop_type x category x week': (
+        ['city', 'shop_type', 'category', 'week'], ['item_revenue'], """
+        SELECT s.city, s.shop_type, p.category,
+            DATE(o.order_date, '-' || ((CAST(strftime('%w', o.order_date) AS INTEGER) + 6) % 7) || ' days') as week,
+            SUM(oi.total_price) as item_revenue
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.order_id
+        JOIN products p ON p.product_id = oi.product_id
+        JOIN local_shops s ON s.shop_id = o.shop_id
+        GROUP BY 1, 2, 3, 4"""),
+    'aov by payment_method x month': (
+        ['payment_method', 'month'], ['aov'], """
+        SELECT payment_method, strftime('%Y-%m', order_date) as month,
+            AVG(CASE WHEN status = 'Delivered' THEN total_amount ELSE NULL END) as aov
+        FROM orders
+        GROUP BY 1, 2"""),
+    'orders / discount / delivery_fee by district x status': (
+        ['district', 'status'], ['orders', 'discount', 'delivery_fee'], """
+        SELECT s.district, o.status, COUNT(*) as orders, SUM(o.discount) as discount,
+            SUM(o.delivery_fee) as delivery_fee
+        FROM orders o
+        JOIN local_shops s ON s.shop_id = o.shop_id
+        GROUP BY 1, 2""")
+}
+
+def check_against_sql(conn, cube):
+    """Compare cube queries with the equivalent multi-join GROUP BYs (SQLite); returns (name, rows, mismatches)"""
+    results = []
+    for name, (by, measures, sql) in REFERENCE_SQL.items():
+        expected = pd.read_sql_query(sql, conn)
+        actual = cube.query(measures, by)
+        merged = expected.astype({l: str for l in by}).merge(actual.astype({l: str for l in by}), on=by,
+                                                             how='outer', suffixes=('_sql', ''))
+        mismatched = np.zeros(len(merged), dtype=bool)
+        for measure in measures:
+            a, b = merged[f'{measure}_sql'].to_numpy(float), merged[measure].to_numpy(float)
+            mismatched |= ~np.isclose(a, b, rtol=1e-9, atol=0.005, equal_nan=True)
+        results.append((name, len(expected), int(mismatched.sum())))
+    return results
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Build the OLAP cube and run a query against it')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read from MySQL instead of SQLite')
+    parser.add_argument('--state', default=STATE_PATH, help='persisted cube, refreshed by date')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved cube')
+    parser.add_argument('--measures', default='gmv,orders,aov', help='comma-separated measures')
+    parser.add_argument('--by', default='city,month', help='comma-separated dimension levels')
+    parser.add_argument('--where', action='append', default=[], metavar='LEVEL=LABEL[,LABEL]')
+    parser.add_argument('--check', action='store_true', help='compare reference slices with SQL GROUP BYs')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - OLAP Cube")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+    else:
+        conn = sqlite3.connect(args.db_path)
+    cube = Cube.load(args.state) if Path(args.state).exists() and not args.rebuild else Cube()
+
+    start = time.perf_counter()
+    refreshed = cube.refresh_from_db(conn, placeholder='%s' if args.mysql else '?')
+    cube.save(args.state)
+    print(f"  ✓ Refreshed {refreshed:,} dates in {time.perf_counter() - start:.2f}s "
+          f"({len(cube.facts['orders']['day']):,} order cells, {len(cube.facts['items']['day']):,} item cells, "
+          f"through order {cube.last_order_id:,})")
+
+    where = {}
+    for condition in args.where:
+        level, _, labels = condition.partition('=')
+        where[level] = labels.split(',')
+    by = [level for level in args.by.split(',') if level]
+    start = time.perf_counter()
+    result = cube.query(args.measures.split(','), by, where)
+    print(f"  ✓ {len(result):,} rows in {(time.perf_counter() - start) * 1000:.1f} ms\n")
+    print(result.round(2).to_string(index=False, max_rows=40))
+
+    if args.check and not args.mysql:
+        print()
+        for name, rows, mismatches in check_against_sql(conn, cube):
+            print(f"  {'✓' if mismatches == 0 else '✗'} {name}: {rows:,} rows, {mismatches} mismatches")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
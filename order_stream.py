@@ -0,0 +1,370 @@
+"""
+QuickShop Analytics - Order Stream Simulator
+Asyncio order producer and micro-batching ingestion consumer with latency and throughput reporting
+"""
+
+import argparse
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+from db_pool import ConnectionPool
+from generate_dataset import generate_orders, draw_order_plan, zipf_sampler, END_DATE
+from incremental_load import FACT_TABLES, null_safe_rows
+from query_cache import bump_versions
+
+DB_PATH = 'quickshop.db'
+RATE = 200.0  # orders per second
+DURATION = 30.0  # seconds
+BURST_EVERY = 10.0  # seconds between bursts (0 = no bursts)
+BURST_SECONDS = 2.0
+BURST_FACTOR = 4.0
+BATCH_ROWS = 2000  # rows (orders + items + deliveries) per micro-batch
+MAX_DELAY_MS = 50.0  # a batch is flushed once its oldest event has waited this long
+GENERATE_BLOCK = 2000  # orders drawn per generate_orders call
+TICK = 0.005  # producer scheduling interval, seconds
+RAMP_STEP_SECONDS = 5.0
+RAMP_GROWTH = 1.5
+LATENCY_SLO_MS = 1000.0
+
+ORDER_COLUMNS = ['order_id', 'customer_id', 'shop_id', 'order_date', 'status', 'subtotal', 'discount',
+                 'delivery_fee', 'total_amount', 'payment_method']
+ITEM_COLUMNS = ['order_item_id', 'order_id', 'product_id', 'quantity', 'unit_price', 'total_price']
+DELIVERY_COLUMNS = ['delivery_id', 'order_id', 'preparation_time_minutes', 'delivery_time_minutes',
+                    'total_time_minutes', 'delivery_rating']
+
+def sqlite_connector(db_path):
+    """Connection factory for pooled SQLite writers"""
+    def connect():
+        conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        # WAL lets dashboards keep reading while the stream commits every few milliseconds
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+    return connect
+
+class OrderSource:
+    """Draws orders, items and deliveries from the generator's distributions, one order at a time
+
+    Dimensions and the next IDs come from the target database, so streamed rows
+    extend the loaded dataset. Orders are drawn in blocks and stamped with the
+    stream clock when they are emitted.
+    """
+
+    def __init__(self, conn, seed=42, customer_skew=0.0, shop_skew=0.0, product_skew=0.0):
+        cursor = conn.cursor()
+        cursor.execute("SELECT shop_id, avg_preparation_time_minutes FROM local_shops WHERE is_active = 1")
+        self.shops = pd.DataFrame(cursor.fetchall(), columns=['shop_id', 'avg_preparation_time_minutes'])
+        cursor.execute("SELECT product_id, base_price FROM products")
+        self.products = pd.DataFrame(cursor.fetchall(), columns=['product_id', 'base_price'])
+        self.products['base_price'] = self.products['base_price'].astype(np.float64)
+        cursor.execute("SELECT customer_id FROM customers")
+        self.customer_ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+        self.next_ids = {}
+        for table, key in [('orders', 'order_id'), ('order_items', 'order_item_id'), ('deliveries', 'delivery_id')]:
+            cursor.execute(f"SELECT COALESCE(MAX({key}), 0) FROM {table}")
+            self.next_ids[table] = int(cursor.fetchone()[0]) + 1
+        cursor.execute("SELECT MAX(order_date) FROM orders")
+        latest = cursor.fetchone()[0]
+        cursor.close()
+        self.clock_start = pd.Timestamp(str(latest)) if latest is not None else pd.Timestamp(END_DATE)
+        self.rng = np.random.default_rng(seed)
+        self.skew = {
+            'customer': zipf_sampler(len(self.customer_ids), customer_skew, self.rng),
+            'shop': zipf_sampler(len(self.shops), shop_skew, self.rng),
+            'product': zipf_sampler(len(self.products), product_skew, self.rng)
+        }
+        self.pending = []
+
+    def _refill(self):
+        status, num_items = draw_order_plan(self.rng, GENERATE_BLOCK)
+        first_order = self.next_ids['orders']
+        orders, items, deliveries = generate_orders(
+            self.rng, np.arange(first_order, first_order + GENERATE_BLOCK), status, num_items, self.customer_ids,
+            self.shops, self.products, self.next_ids['order_items'], self.next_ids['deliveries'], self.skew)
+        self.next_ids['orders'] += len(orders)
+        self.next_ids['order_items'] += len(items)
+        self.next_ids['deliveries'] += len(deliveries)
+        order_rows = null_safe_rows(orders[ORDER_COLUMNS])
+        item_rows = null_safe_rows(items[ITEM_COLUMNS])
+        delivery_rows = null_safe_rows(deliveries[DELIVERY_COLUMNS])
+        item_bounds = np.searchsorted(items['order_id'].to_numpy(), orders['order_id'].to_numpy(), side='right')
+        delivery_of = dict(zip(deliveries['order_id'].tolist(), delivery_rows))
+        start = 0
+        for row, stop in zip(order_rows, item_bounds.tolist()):
+            self.pending.append({'order': list(row), 'items': item_rows[start:stop],
+                                 'delivery': delivery_of.get(row[0])})
+            start = stop
+        self.pending.reverse()  # pop() hands them out in order_id order
+
+    def emit(self, elapsed_seconds, speedup):
+        """Next order, dated on the stream clock"""
+        if not self.pending:
+            self._refill()
+        event = self.pending.pop()
+        event['order'][3] = (self.clock_start + pd.Timedelta(seconds=elapsed_seconds * speedup)) \
+            .strftime('%Y-%m-%d %H:%M:%S')
+        event['rows'] = 1 + len(event['items']) + (event['delivery'] is not None)
+        return event
+
+def offered_rate(elapsed, args):
+    """Orders per second the producer should emit at a point in the run"""
+    if args.ramp:
+        return args.rate * args.ramp_growth ** int(elapsed // args.ramp_step_seconds)
+    if args.burst_every > 0 and elapsed % args.burst_every >= args.burst_every - args.burst_seconds:
+        return args.rate * args.burst_factor
+    return args.rate
+
+def write_batch(conn, events, placeholder='?'):
+    """Insert one micro-batch and fold its delivered orders into the customers aggregates, in one transaction"""
+    p = placeholder
+    cursor = conn.cursor()
+    cursor.executemany(f"INSERT INTO orders ({', '.join(ORDER_COLUMNS)}) "
+                       f"VALUES ({', '.join([p] * len(ORDER_COLUMNS))})",
+                       [tuple(e['order']) for e in events])
+    cursor.executemany(f"INSERT INTO order_items ({', '.join(ITEM_COLUMNS)}) "
+                       f"VALUES ({', '.join([p] * len(ITEM_COLUMNS))})",
+                       [item for e in events for item in e['items']])
+    cursor.executemany(f"INSERT INTO deliveries ({', '.join(DELIVERY_COLUMNS)}) "
+                       f"VALUES ({', '.join([p] * len(DELIVERY_COLUMNS))})",
+                       [e['delivery'] for e in events if e['delivery'] is not None])
+
+    # Same definition as the loaders' refresh: delivered orders only
+    deltas = {}
+    for e in events:
+        order = e['order']
+        if order[4] == 'Delivered':
+            count, spent, last = deltas.get(order[1], (0, 0.0, ''))
+            deltas[order[1]] = (count + 1, spent + order[8], max(last, order[3]))
+    cursor.executemany(f"""
+        UPDATE customers SET
+            total_orders = COALESCE(total_orders, 0) + {p},
+            total_spent = ROUND(COALESCE(total_spent, 0) + {p}, 2),
+            last_order_date = CASE WHEN last_order_date IS NULL OR last_order_date < {p}
+                                   THEN {p} ELSE last_order_date END
+        WHERE customer_id = {p}""",
+                       [(count, spent, last, last, customer) for customer, (count, spent, last) in deltas.items()])
+    bump_versions(cursor, FACT_TABLES + ['customers'], p)
+    conn.commit()
+    cursor.close()
+
+class StreamStats:
+    """Emission and commit counters plus per-order end-to-end latencies"""
+
+    def __init__(self):
+        self.emitted_orders = 0
+        self.emitted_rows = 0
+        self.committed_orders = 0
+        self.committed_rows = 0
+        self.batches = 0
+        self.max_backlog = 0
+        self.queued_rows = 0  # rows emitted but not yet taken into a batch
+        self.emitted_at = []  # seconds into the run, per committed order
+        self.latency = []  # seconds from emission to commit, per committed order
+
+    def percentiles(self, since=None, until=None):
+        """p50 / p95 / p99 / max latency in ms of orders emitted in [since, until)"""
+        emitted_at = np.asarray(self.emitted_at)
+        latency = np.asarray(self.latency)
+        mask = np.ones(len(latency), dtype=bool)
+        if since is not None:
+            mask &= emitted_at >= since
+        if until is not None:
+            mask &= emitted_at < until
+        if not mask.any():
+            return {'p50': np.nan, 'p95': np.nan, 'p99': np.nan, 'max': np.nan}
+        values = np.percentile(latency[mask] * 1000, [50, 95, 99, 100])
+        return dict(zip(['p50', 'p95', 'p99', 'max'], values))
+
+async def produce(events, source, args, stats, t0, done):
+    """Emit orders on schedule (Poisson per tick) until the run ends"""
+    loop = asyncio.get_running_loop()
+    rng = np.random.default_rng(args.seed + 1)
+    last = loop.time()
+    while not done.is_set():
+        await asyncio.sleep(TICK)
+        now = loop.time()
+        elapsed = now - t0
+        if elapsed >= args.duration:
+            break
+        for _ in range(rng.poisson(offered_rate(elapsed, args) * (now - last))):
+            event = source.emit(elapsed, args.speedup)
+            event['emitted'] = time.perf_counter()
+            event['at'] = elapsed
+            events.put_nowait(event)  # unbounded: a slow consumer shows up as backlog and latency
+            stats.emitted_orders += 1
+            stats.emitted_rows += event['rows']
+            stats.queued_rows += event['rows']
+        stats.max_backlog = max(stats.max_backlog, events.qsize())
+        last = now
+
+async def consume(events, pool, executor, args, stats, placeholder):
+    """Collect events into micro-batches by size and age and write each one on a pooled connection"""
+    loop = asyncio.get_running_loop()
+    max_delay = args.max_delay_ms / 1000
+    finished = False
+    while not finished:
+        event = await events.get()
+        if event is None:
+            break
+        batch, rows = [event], event['rows']
+        stats.queued_rows -= event['rows']
+        deadline = loop.time() + max_delay
+        while rows < args.batch_rows:
+            try:
+                event = events.get_nowait()
+            except asyncio.QueueEmpty:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(events.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if event is None:
+                finished = True
+                break
+            batch.append(event)
+            rows += event['rows']
+            stats.queued_rows -= event['rows']
+
+        def write():
+            with pool.connection() as conn:
+                write_batch(conn, batch, placeholder)
+        await loop.run_in_executor(executor, write)
+        committed = time.perf_counter()
+        stats.batches += 1
+        stats.committed_orders += len(batch)
+        stats.committed_rows += rows
+        stats.emitted_at.extend(e['at'] for e in batch)
+        stats.latency.extend(committed - e['emitted'] for e in batch)
+
+async def run_stream(args, pool, source, placeholder):
+    """Run producer and consumers until the duration has passed (or a ramp falls behind) and drain"""
+    loop = asyncio.get_running_loop()
+    events = asyncio.Queue()
+    stats = StreamStats()
+    done = asyncio.Event()
+    steps = []
+    executor = ThreadPoolExecutor(args.writers)
+    t0 = loop.time()
+    consumers = [asyncio.ensure_future(consume(events, pool, executor, args, stats, placeholder))
+                 for _ in range(args.writers)]
+    producer = asyncio.ensure_future(produce(events, source, args, stats, t0, done))
+
+    if args.ramp:
+        # Hold each rate for a step; stop after the first step the consumers could not keep up with
+        step = 0
+        while not producer.done():
+            step_start = stats.emitted_rows, stats.committed_rows
+            await asyncio.sleep(args.ramp_step_seconds)
+            offered = (stats.emitted_rows - step_start[0]) / args.ramp_step_seconds
+            committed = (stats.committed_rows - step_start[1]) / args.ramp_step_seconds
+            latency = stats.percentiles(since=step * args.ramp_step_seconds,
+                                        until=(step + 1) * args.ramp_step_seconds)
+            # Backlog in rows, the unit batch_rows counts in: at most one batch left waiting
+            kept_up = stats.queued_rows <= args.batch_rows and committed >= 0.95 * offered \
+                and not latency['p99'] > args.latency_slo_ms
+            steps.append({'orders_per_s': round(offered_rate(step * args.ramp_step_seconds, args), 1),
+                          'offered_events_per_s': round(offered), 'committed_events_per_s': round(committed),
+                          'backlog_orders': events.qsize(), 'backlog_rows': stats.queued_rows,
+                          'p99_ms': round(latency['p99'], 1), 'kept_up': kept_up})
+            step += 1
+            if not kept_up:
+                done.set()
+                break
+    await producer
+    for _ in consumers:
+        events.put_nowait(None)
+    await asyncio.gather(*consumers)
+    executor.shutdown()
+    stats.elapsed = loop.time() - t0
+    return stats, pd.DataFrame(steps)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Stream synthetic orders into the database in micro-batches')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='write to MySQL instead of SQLite')
+    parser.add_argument('--rate', type=float, default=RATE, help='orders per second')
+    parser.add_argument('--duration', type=float, default=DURATION, help='seconds to stream')
+    parser.add_argument('--burst-every', type=float, default=BURST_EVERY, help='seconds between bursts (0 = none)')
+    parser.add_argument('--burst-seconds', type=float, default=BURST_SECONDS)
+    parser.add_argument('--burst-factor', type=float, default=BURST_FACTOR, help='rate multiplier during a burst')
+    parser.add_argument('--speedup', type=float, default=1.0, help='stream-clock seconds per wall-clock second')
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS, help='rows per micro-batch')
+    parser.add_argument('--max-delay-ms', type=float, default=MAX_DELAY_MS, help='longest an event waits for a batch')
+    parser.add_argument('--writers', type=int, default=1,
+                        help='pooled connections / concurrent batches (SQLite serializes writers)')
+    parser.add_argument('--ramp', action='store_true',
+                        help='grow the rate step by step until ingestion falls behind (ignores bursts)')
+    parser.add_argument('--ramp-step-seconds', type=float, default=RAMP_STEP_SECONDS)
+    parser.add_argument('--ramp-growth', type=float, default=RAMP_GROWTH)
+    parser.add_argument('--latency-slo-ms', type=float, default=LATENCY_SLO_MS,
+                        help='p99 latency a ramp step may reach and still count as keeping up')
+    parser.add_argument('--customer-skew', type=float, default=0.0)
+    parser.add_argument('--shop-skew', type=float, default=0.0)
+    parser.add_argument('--product-skew', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=42)
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Order Stream")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        connect, placeholder = create_connection, '%s'
+    else:
+        connect, placeholder = sqlite_connector(args.db_path), '?'
+    pool = ConnectionPool(connect, args.writers)
+    with pool.connection() as conn:
+        source = OrderSource(conn, args.seed, args.customer_skew, args.shop_skew, args.product_skew)
+    mode = f"ramp from {args.rate:,.0f} orders/s x{args.ramp_growth} every {args.ramp_step_seconds:g}s" if args.ramp \
+        else f"{args.rate:,.0f} orders/s for {args.duration:g}s"
+    print(f"  Streaming {mode} from order {source.next_ids['orders']:,}, "
+          f"batches of {args.batch_rows:,} rows / {args.max_delay_ms:g} ms, {args.writers} writer(s)")
+
+    if args.ramp:
+        args.duration = float('inf')
+    stats, steps = asyncio.run(run_stream(args, pool, source, placeholder))
+
+    latency = stats.percentiles()
+    print(f"  ✓ Committed {stats.committed_orders:,} orders / {stats.committed_rows:,} rows "
+          f"in {stats.batches:,} batches over {stats.elapsed:.1f}s")
+    print(f"  ✓ Sustained {stats.committed_rows / stats.elapsed:,.0f} events/s "
+          f"(avg batch {stats.committed_rows / max(stats.batches, 1):,.0f} rows, max backlog {stats.max_backlog:,} orders)")
+    print(f"  ✓ End-to-end latency: p50 {latency['p50']:.1f} ms, p95 {latency['p95']:.1f} ms, "
+          f"p99 {latency['p99']:.1f} ms, max {latency['max']:.1f} ms")
+    if len(steps):
+        print("\nRamp steps:")
+        print(steps.to_string(index=False))
+        held = steps[steps['kept_up']]
+        if len(held):
+            best = held.iloc[-1]
+            print(f"\n  ✓ Highest rate held: {best['orders_per_s']:,.0f} orders/s "
+                  f"({best['committed_events_per_s']:,} events/s)")
+        else:
+            print("\n  ✗ Fell behind at the starting rate; lower --rate")
+
+    with pool.connection() as conn:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SELECT 1 FROM mv_refresh_state")
+            cursor.fetchall()
+            installed = True
+        except Exception:
+            installed = False
+        cursor.close()
+        if installed:
+            from summary_tables import refresh_summaries, SQLITE, MYSQL
+            result = refresh_summaries(conn, MYSQL if args.mysql else SQLITE)
+            print(f"  ✓ Refreshed summary tables with {result['orders']:,} streamed orders")
+    pool.close()
+
+if __name__ == "__main__":
+    main()
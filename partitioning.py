@@ -0,0 +1,569 @@
+"""
+QuickShop Analytics - Fact Table Partitioning
+Monthly partitions of orders, order_items and deliveries: union views in SQLite, RANGE COLUMNS in MySQL
+"""
+
+import argparse
+import re
+import sqlite3
+import time
+import pandas as pd
+
+from incremental_load import FACT_TABLES
+from query_cache import bump_versions
+from summary_tables import SQLITE, MYSQL, retract_orders
+
+DB_PATH = 'quickshop.db'
+OVERFLOW = 'pmax'
+# Children carry their order's order_date, so date filters prune them without the join to orders
+PARTITION_SCHEMA = {
+    'orders': [('order_id', 'INTEGER PRIMARY KEY'), ('customer_id', 'INTEGER NOT NULL'),
+               ('shop_id', 'INTEGER NOT NULL'), ('order_date', 'DATETIME NOT NULL'), ('status', 'TEXT NOT NULL'),
+               ('subtotal', 'DECIMAL(10,2) NOT NULL'), ('discount', 'DECIMAL(10,2) DEFAULT 0.00'),
+               ('delivery_fee', 'DECIMAL(10,2) NOT NULL'), ('total_amount', 'DECIMAL(10,2) NOT NULL'),
+               ('payment_method', 'TEXT NOT NULL')],
+    'order_items': [('order_item_id', 'INTEGER PRIMARY KEY'), ('order_id', 'INTEGER NOT NULL'),
+                    ('product_id', 'INTEGER NOT NULL'), ('quantity', 'INTEGER NOT NULL'),
+                    ('unit_price', 'DECIMAL(10,2) NOT NULL'), ('total_price', 'DECIMAL(10,2) NOT NULL'),
+                    ('order_date', 'DATETIME')],
+    'deliveries': [('delivery_id', 'INTEGER PRIMARY KEY'), ('order_id', 'INTEGER NOT NULL UNIQUE'),
+                   ('preparation_time_minutes', 'INTEGER NOT NULL'), ('delivery_time_minutes', 'INTEGER NOT NULL'),
+                   ('total_time_minutes', 'INTEGER NOT NULL'), ('delivery_rating', 'DECIMAL(2,1)'),
+                   ('order_date', 'DATETIME')]
+}
+# Keys unique across the whole fact table, as the plain tables' PRIMARY KEY / UNIQUE constraints keep them.
+# Each fact table has a <table>_keys table holding them for every month; archived and dropped months keep theirs.
+KEY_COLUMNS = {
+    'orders': ['order_id'],
+    'order_items': ['order_item_id'],
+    'deliveries': ['delivery_id', 'order_id']
+}
+PARTITION_INDEXES = {
+    'orders': ['customer_id', 'shop_id', 'order_date', 'status'],
+    'order_items': ['order_id', 'product_id', 'order_date'],
+    'deliveries': ['order_date']
+}
+CATALOG_DDL = """
+CREATE TABLE IF NOT EXISTS fact_partitions (
+    month VARCHAR(7) PRIMARY KEY,
+    lower_bound VARCHAR(19) NOT NULL,
+    upper_bound VARCHAR(19) NOT NULL
+)
+"""
+
+# MySQL: every unique key must contain the partitioning column, and partitioned
+# tables cannot take part in foreign keys
+MYSQL_PARTITIONED_DDL = {
+    'orders': """CREATE TABLE orders (
+        order_id INT NOT NULL,
+        customer_id INT NOT NULL,
+        shop_id INT NOT NULL,
+        order_date DATETIME NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        subtotal DECIMAL(10,2) NOT NULL,
+        discount DECIMAL(10,2) DEFAULT 0.00,
+        delivery_fee DECIMAL(10,2) NOT NULL,
+        total_amount DECIMAL(10,2) NOT NULL,
+        payment_method VARCHAR(30) NOT NULL,
+        PRIMARY KEY (order_id, order_date),
+        INDEX idx_customer (customer_id),
+        INDEX idx_shop (shop_id),
+        INDEX idx_order_date (order_date),
+        INDEX idx_status (status)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+    'order_items': """CREATE TABLE order_items (
+        order_item_id INT NOT NULL,
+        order_id INT NOT NULL,
+        product_id INT NOT NULL,
+        quantity INT NOT NULL,
+        unit_price DECIMAL(10,2) NOT NULL,
+        total_price DECIMAL(10,2) NOT NULL,
+        order_date DATETIME NOT NULL DEFAULT '1000-01-01 00:00:00',
+        PRIMARY KEY (order_item_id, order_date),
+        INDEX idx_order (order_id),
+        INDEX idx_product (product_id),
+        INDEX idx_order_date (order_date)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci""",
+    'deliveries': """CREATE TABLE deliveries (
+        delivery_id INT NOT NULL,
+        order_id INT NOT NULL,
+        preparation_time_minutes INT NOT NULL,
+        delivery_time_minutes INT NOT NULL,
+        total_time_minutes INT NOT NULL,
+        delivery_rating DECIMAL(2,1),
+        order_date DATETIME NOT NULL DEFAULT '1000-01-01 00:00:00',
+        PRIMARY KEY (delivery_id, order_date),
+        UNIQUE KEY uq_order (order_id, order_date),
+        INDEX idx_rating (delivery_rating),
+        INDEX idx_order_date (order_date)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci"""
+}
+# Writers that only know the CSV columns leave the sentinel default; the order's date replaces it
+MYSQL_ORDER_DATE_TRIGGER = """
+CREATE TRIGGER {table}_order_date BEFORE INSERT ON {table} FOR EACH ROW
+SET NEW.order_date = IF(NEW.order_date = '1000-01-01 00:00:00',
+                        COALESCE((SELECT order_date FROM orders WHERE order_id = NEW.order_id LIMIT 1),
+                                 NEW.order_date),
+                        NEW.order_date)
+"""
+
+# The partitioned primary keys include order_date, so per-table key tables keep the ids unique across months
+MYSQL_KEY_TRIGGERS = """
+CREATE TRIGGER {table}_keys_insert AFTER INSERT ON {table} FOR EACH ROW
+INSERT INTO {keys} ({columns}) VALUES ({values});
+CREATE TRIGGER {table}_keys_delete AFTER DELETE ON {table} FOR EACH ROW
+DELETE FROM {keys} WHERE {first} = OLD.{first}
+"""
+
+def month_bounds(month):
+    """[lower, upper) order_date bounds of a 'YYYY-MM' month"""
+    year, number = int(month[:4]), int(month[5:7])
+    return f'{month}-01', f'{year + number // 12:04d}-{number % 12 + 1:02d}-01'
+
+def months_between(first, last):
+    """Every 'YYYY-MM' month from first to last"""
+    return pd.period_range(first, last, freq='M').strftime('%Y-%m').tolist()
+
+def partition_name(table, month):
+    return f'{table}_p{month.replace("-", "")}'
+
+# --- SQLite: one table per month behind a UNION ALL view named after the fact table ---
+
+def is_partitioned(conn, table='orders'):
+    """True when the fact table is a union view over monthly partitions"""
+    row = conn.execute("SELECT type FROM sqlite_master WHERE name = ?", (table,)).fetchone()
+    return row is not None and row[0] == 'view'
+
+def partition_months(conn):
+    """Months with their own partition, oldest first"""
+    return [row[0] for row in conn.execute("SELECT month FROM fact_partitions ORDER BY month")]
+
+def key_table(table):
+    return f'{table}_keys'
+
+def create_key_table(conn, table):
+    first, *rest = KEY_COLUMNS[table]
+    columns = [f'{first} INTEGER PRIMARY KEY'] + [f'{column} INTEGER NOT NULL UNIQUE' for column in rest]
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {key_table(table)} ({', '.join(columns)})")
+
+def track_keys(conn, table, name):
+    """Triggers mirroring a partition's keys into the fact table's key table
+
+    A key already held by any other month then fails the insert with the same
+    IntegrityError the plain table would raise, whichever writer inserts it.
+    """
+    columns = KEY_COLUMNS[table]
+    keys, first = key_table(table), columns[0]
+    insert = f"INSERT INTO {keys} ({', '.join(columns)}) VALUES ({', '.join(f'NEW.{c}' for c in columns)});"
+    delete = f"DELETE FROM {keys} WHERE {first} = OLD.{first};"
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_keys_insert AFTER INSERT ON {name} BEGIN {insert} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_keys_delete AFTER DELETE ON {name} BEGIN {delete} END")
+    conn.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_keys_update AFTER UPDATE OF {', '.join(columns)} ON {name} "
+                 f"BEGIN {delete} {insert} END")
+
+def untrack_keys(conn, name):
+    for event in ['insert', 'delete', 'update']:
+        conn.execute(f"DROP TRIGGER IF EXISTS {name}_keys_{event}")
+
+def create_partition(conn, table, name, indexes=True):
+    columns = ', '.join(f'{column} {definition}' for column, definition in PARTITION_SCHEMA[table])
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {name} ({columns})")
+    create_key_table(conn, table)
+    track_keys(conn, table, name)
+    if indexes:
+        index_partition(conn, table, name)
+
+def add_key_tables(conn):
+    """Give a database partitioned before the key tables existed its key tables; returns the tables added
+
+    Fails with an IntegrityError if a key is already repeated across months.
+    """
+    added = []
+    for table in FACT_TABLES:
+        if conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (key_table(table),)).fetchone():
+            continue
+        create_key_table(conn, table)
+        columns = ', '.join(KEY_COLUMNS[table])
+        conn.execute(f"INSERT INTO {key_table(table)} ({columns}) SELECT {columns} FROM {table}")
+        for name in [partition_name(table, month) for month in partition_months(conn)] + [f'{table}_{OVERFLOW}']:
+            track_keys(conn, table, name)
+        added.append(table)
+    return added
+
+def index_partition(conn, table, name):
+    for column in PARTITION_INDEXES[table]:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{name}_{column} ON {name}({column})")
+
+def index_partitions(conn):
+    """Build the secondary indexes of every partition (deferred during bulk loads)"""
+    for table in FACT_TABLES:
+        for name in [partition_name(table, month) for month in partition_months(conn)] + [f'{table}_{OVERFLOW}']:
+            index_partition(conn, table, name)
+
+def rebuild_routing(conn, table):
+    """Recreate the union view over a fact table's partitions and the triggers routing inserts into them
+
+    Loaders insert into the partitions directly; the INSTEAD OF triggers are for
+    every other writer. Children without an order_date take it from their order.
+    Rows for months without a partition land in the overflow table until
+    split_overflow() gives them one.
+    """
+    columns = [column for column, _ in PARTITION_SCHEMA[table]]
+    months = partition_months(conn)
+    names = [partition_name(table, month) for month in months] + [f'{table}_{OVERFLOW}']
+    conn.execute(f"DROP VIEW IF EXISTS {table}")  # drops its triggers too
+    conn.execute(f"CREATE VIEW {table} AS " +
+                 ' UNION ALL '.join(f"SELECT {', '.join(columns)} FROM {name}" for name in names))
+
+    def insert(name, order_date):
+        values = ', '.join(order_date if column == 'order_date' else f'NEW.{column}' for column in columns)
+        return f"BEGIN INSERT INTO {name} ({', '.join(columns)}) VALUES ({values}); END"
+
+    for month, name in zip(months, names):
+        if table == 'orders':
+            when = f"substr(NEW.order_date, 1, 7) = '{month}'"
+            order_date = 'NEW.order_date'
+        else:
+            parent = partition_name('orders', month)
+            when = (f"COALESCE(substr(NEW.order_date, 1, 7) = '{month}', "
+                    f"EXISTS (SELECT 1 FROM {parent} WHERE order_id = NEW.order_id))")
+            order_date = f"COALESCE(NEW.order_date, (SELECT order_date FROM {parent} WHERE order_id = NEW.order_id))"
+        conn.execute(f"CREATE TRIGGER {name}_route INSTEAD OF INSERT ON {table} WHEN {when} "
+                     + insert(name, order_date))
+    order_date = 'NEW.order_date' if table == 'orders' else \
+        "COALESCE(NEW.order_date, (SELECT order_date FROM orders WHERE order_id = NEW.order_id))"
+    conn.execute(f"CREATE TRIGGER {table}_{OVERFLOW}_route INSTEAD OF INSERT ON {table} "
+                 f"WHEN COALESCE(substr({order_date}, 1, 7), '') NOT IN (SELECT month FROM fact_partitions) "
+                 + insert(f'{table}_{OVERFLOW}', order_date))
+
+def ensure_months(conn, months, indexes=True):
+    """Give each month its own partition in every fact table; returns the months added
+
+    Rows of a new month already sitting in the overflow tables move into it.
+    """
+    new = sorted(set(months) - set(partition_months(conn)))
+    for month in new:
+        lower, upper = month_bounds(month)
+        for table in FACT_TABLES:
+            name, overflow = partition_name(table, month), f'{table}_{OVERFLOW}'
+            create_partition(conn, table, name, indexes)
+            columns = ', '.join(column for column, _ in PARTITION_SCHEMA[table])
+            # Staged so the rows release their keys before the new partition claims them
+            conn.execute(f"CREATE TEMP TABLE moving AS SELECT {columns} FROM {overflow} "
+                         f"WHERE order_date >= ? AND order_date < ?", (lower, upper))
+            conn.execute(f"DELETE FROM {overflow} WHERE order_date >= ? AND order_date < ?", (lower, upper))
+            conn.execute(f"INSERT INTO {name} ({columns}) SELECT {columns} FROM temp.moving")
+            conn.execute("DROP TABLE temp.moving")
+        conn.execute("INSERT INTO fact_partitions (month, lower_bound, upper_bound) VALUES (?, ?, ?)",
+                     (month, lower, upper))
+    if new:
+        for table in FACT_TABLES:
+            rebuild_routing(conn, table)
+    return new
+
+def order_dates(conn, order_ids):
+    """order_date for each order_id (NaN for unknown orders), from one key-range read of orders"""
+    order_ids = pd.Series(order_ids).astype('int64')
+    rows = conn.execute("SELECT order_id, order_date FROM orders WHERE order_id BETWEEN ? AND ?",
+                        (int(order_ids.min()), int(order_ids.max()))).fetchall()
+    lookup = pd.Series([row[1] for row in rows], index=[row[0] for row in rows], dtype=object)
+    return lookup.reindex(order_ids.to_numpy()).to_numpy()
+
+def insert_partitioned(conn, table, chunk, indexes=True):
+    """Insert a loader chunk straight into its monthly partitions; returns the rows inserted"""
+    if len(chunk) == 0:
+        return 0
+    if 'order_date' not in chunk:
+        chunk = chunk.assign(order_date=order_dates(conn, chunk['order_id']))
+    columns = [column for column, _ in PARTITION_SCHEMA[table]]
+    months = chunk['order_date'].astype(str).str[:7].where(chunk['order_date'].notna(), '')
+    ensure_months(conn, [month for month in months.unique() if month], indexes)
+    placeholders = ', '.join(['?'] * len(columns))
+    for month, rows in chunk.groupby(months.to_numpy(), sort=False):
+        name = partition_name(table, month) if month else f'{table}_{OVERFLOW}'
+        conn.executemany(f"INSERT INTO {name} ({', '.join(columns)}) VALUES ({placeholders})",
+                         zip(*[rows[column].tolist() for column in columns]))
+    return len(chunk)
+
+def partition_fact_tables(conn, indexes=True):
+    """Replace the plain fact tables with monthly partitions, moving any rows they hold"""
+    if is_partitioned(conn):
+        with conn:
+            add_key_tables(conn)
+        return 0
+    with conn:
+        conn.execute(CATALOG_DDL)
+        for table in FACT_TABLES:
+            create_partition(conn, table, f'{table}_{OVERFLOW}', indexes)
+        months = [row[0] for row in conn.execute(
+            "SELECT DISTINCT substr(order_date, 1, 7) FROM orders WHERE order_date IS NOT NULL")]
+        moved = 0
+        for month in sorted(months):
+            lower, upper = month_bounds(month)
+            for table in FACT_TABLES:
+                create_partition(conn, table, partition_name(table, month), indexes)
+            conn.execute("INSERT INTO fact_partitions (month, lower_bound, upper_bound) VALUES (?, ?, ?)",
+                         (month, lower, upper))
+            moved += copy_month(conn, month, lower, upper)
+        # Children whose order is missing keep a NULL order_date in the overflow tables
+        for table in ['order_items', 'deliveries']:
+            columns = ', '.join(f'c.{column}' for column, _ in PARTITION_SCHEMA[table] if column != 'order_date')
+            conn.execute(f"INSERT INTO {table}_{OVERFLOW} SELECT {columns}, NULL FROM {table} c "
+                         f"WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.order_id = c.order_id)")
+        for table in reversed(FACT_TABLES):
+            conn.execute(f"DROP TABLE {table}")
+        for table in FACT_TABLES:
+            rebuild_routing(conn, table)
+        bump_versions(conn.cursor(), FACT_TABLES)
+    return moved
+
+def copy_month(conn, month, lower, upper):
+    """Copy one month of the plain fact tables into its partitions, children joined to their order's date"""
+    orders_columns = ', '.join(column for column, _ in PARTITION_SCHEMA['orders'])
+    cursor = conn.execute(f"INSERT INTO {partition_name('orders', month)} SELECT {orders_columns} FROM orders "
+                          f"WHERE order_date >= ? AND order_date < ?", (lower, upper))
+    moved = cursor.rowcount
+    for table in ['order_items', 'deliveries']:
+        columns = ', '.join(f'c.{column}' for column, _ in PARTITION_SCHEMA[table] if column != 'order_date')
+        cursor = conn.execute(f"INSERT INTO {partition_name(table, month)} SELECT {columns}, o.order_date "
+                              f"FROM {partition_name('orders', month)} o JOIN {table} c ON c.order_id = o.order_id")
+        moved += cursor.rowcount
+    return moved
+
+def split_overflow(conn):
+    """Give months that only exist in the overflow tables (e.g. streamed orders) their own partitions"""
+    with conn:
+        months = [row[0] for row in conn.execute(
+            f"SELECT DISTINCT substr(order_date, 1, 7) FROM orders_{OVERFLOW} WHERE order_date IS NOT NULL")]
+        added = ensure_months(conn, months)
+        if added:
+            bump_versions(conn.cursor(), FACT_TABLES)
+    return added
+
+def archive_month(conn, month, drop=False):
+    """Detach a month from the fact views in O(1): rename its partitions to <table>_archive_p<YYYYMM>, or drop them
+
+    The month's orders are first taken out of the summary tables, in the same transaction.
+    Its keys stay in the key tables, so they are not handed out again.
+    """
+    if month not in partition_months(conn):
+        raise ValueError(f"no partition for {month}")
+    with conn:
+        retract_orders(conn, SQLITE, *month_bounds(month))
+        conn.execute("DELETE FROM fact_partitions WHERE month = ?", (month,))
+        for table in FACT_TABLES:
+            rebuild_routing(conn, table)
+        for table in FACT_TABLES:
+            name = partition_name(table, month)
+            if drop:
+                conn.execute(f"DROP TABLE {name}")
+            else:
+                untrack_keys(conn, name)
+                conn.execute(f"ALTER TABLE {name} RENAME TO {table}_archive_p{month.replace('-', '')}")
+        bump_versions(conn.cursor(), FACT_TABLES)
+
+def range_source(conn, table, low, high, alias=None):
+    """FROM-clause source covering only the partitions that overlap [low, high] (dates, inclusive)"""
+    columns = ', '.join(column for column, _ in PARTITION_SCHEMA[table])
+    months = [month for month in partition_months(conn) if low[:7] <= month <= high[:7]]
+    names = [partition_name(table, month) for month in months] + [f'{table}_{OVERFLOW}']
+    return '(' + ' UNION ALL '.join(f"SELECT {columns} FROM {name}" for name in names) + f') AS {alias or table}'
+
+def partition_summary(conn):
+    """(month, orders, order_items, deliveries) row counts per partition, overflow last"""
+    rows = []
+    for month in partition_months(conn) + [OVERFLOW]:
+        names = [partition_name(table, month) if month != OVERFLOW else f'{table}_{OVERFLOW}'
+                 for table in FACT_TABLES]
+        rows.append([month] + [conn.execute(f"SELECT COUNT(*) FROM {name}").fetchone()[0] for name in names])
+    return rows
+
+# --- MySQL: native RANGE COLUMNS partitioning on order_date ---
+
+def mysql_partition_clause(months):
+    """PARTITION BY clause with p0 for anything older, one partition per month and pmax"""
+    partitions = [f"PARTITION p0 VALUES LESS THAN ('{month_bounds(months[0])[0]}')"]
+    partitions += [f"PARTITION p{month.replace('-', '')} VALUES LESS THAN ('{month_bounds(month)[1]}')"
+                   for month in months]
+    partitions.append(f"PARTITION {OVERFLOW} VALUES LESS THAN (MAXVALUE)")
+    return "PARTITION BY RANGE COLUMNS(order_date) (\n    " + ',\n    '.join(partitions) + "\n)"
+
+def create_mysql_partitioned_tables(connection, months):
+    """Recreate the (empty) fact tables partitioned by month, for a full load"""
+    cursor = connection.cursor()
+    cursor.execute("SET SESSION foreign_key_checks = 0")
+    try:
+        for table in reversed(FACT_TABLES):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        for table in FACT_TABLES:
+            cursor.execute(MYSQL_PARTITIONED_DDL[table] + '\n' + mysql_partition_clause(months))
+            first, *rest = KEY_COLUMNS[table]
+            cursor.execute(f"DROP TABLE IF EXISTS {key_table(table)}")
+            cursor.execute(f"CREATE TABLE {key_table(table)} ({first} INT NOT NULL PRIMARY KEY"
+                           + ''.join(f", {column} INT NOT NULL UNIQUE" for column in rest) + ") ENGINE=InnoDB")
+            for statement in MYSQL_KEY_TRIGGERS.format(
+                    table=table, keys=key_table(table), first=first, columns=', '.join(KEY_COLUMNS[table]),
+                    values=', '.join(f'NEW.{column}' for column in KEY_COLUMNS[table])).split(';'):
+                cursor.execute(statement)
+        for table in ['order_items', 'deliveries']:
+            cursor.execute(MYSQL_ORDER_DATE_TRIGGER.format(table=table))
+    finally:
+        cursor.execute("SET SESSION foreign_key_checks = 1")
+    connection.commit()
+    cursor.close()
+
+def mysql_partition_months(cursor, table='orders'):
+    """Months with their own partition in a MySQL fact table, oldest first"""
+    cursor.execute("""
+        SELECT partition_name FROM information_schema.partitions
+        WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL
+        ORDER BY partition_ordinal_position
+    """, (table,))
+    names = [row[0] for row in cursor.fetchall()]
+    return [f'{name[1:5]}-{name[5:7]}' for name in names if re.fullmatch(r'p\d{6}', name)]
+
+def mysql_is_partitioned(connection, table='orders'):
+    cursor = connection.cursor()
+    partitioned = bool(mysql_partition_months(cursor, table))
+    cursor.close()
+    return partitioned
+
+def mysql_split_overflow(connection):
+    """Split new months out of pmax (REORGANIZE only moves the rows already in pmax)"""
+    cursor = connection.cursor()
+    existing = mysql_partition_months(cursor)
+    cursor.execute(f"SELECT DISTINCT DATE_FORMAT(order_date, '%Y-%m') FROM orders PARTITION ({OVERFLOW})")
+    found = [row[0] for row in cursor.fetchall()]
+    added = []
+    if existing and found:
+        added = months_between(month_bounds(existing[-1])[1], max(found))
+        partitions = [f"PARTITION p{month.replace('-', '')} VALUES LESS THAN ('{month_bounds(month)[1]}')"
+                      for month in added]
+        for table in FACT_TABLES:
+            cursor.execute(f"ALTER TABLE {table} REORGANIZE PARTITION {OVERFLOW} INTO "
+                           f"({', '.join(partitions)}, PARTITION {OVERFLOW} VALUES LESS THAN (MAXVALUE))")
+        bump_versions(cursor, FACT_TABLES, '%s')
+    connection.commit()
+    cursor.close()
+    return added
+
+def mysql_archive_month(connection, month, drop=False):
+    """Detach a month in O(1): EXCHANGE PARTITION into <table>_archive_p<YYYYMM> (unless dropping), then DROP PARTITION"""
+    # Before the DDL below, which commits implicitly
+    retract_orders(connection, MYSQL, *month_bounds(month))
+    connection.commit()
+    cursor = connection.cursor()
+    name = f"p{month.replace('-', '')}"
+    for table in FACT_TABLES:
+        if not drop:
+            archive = f'{table}_archive_{name}'
+            cursor.execute(f"CREATE TABLE {archive} LIKE {table}")
+            cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+            cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive}")
+        cursor.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+    bump_versions(cursor, FACT_TABLES, '%s')
+    connection.commit()
+    cursor.close()
+
+def csv_months(csv_path, chunk_size=1_000_000):
+    """Months spanned by the order_date column of orders.csv, contiguous from first to last"""
+    first, last = None, None
+    for chunk in pd.read_csv(csv_path, usecols=['order_date'], chunksize=chunk_size):
+        months = chunk['order_date'].dropna().str[:7]
+        if len(months):
+            first = min(first or months.min(), months.min())
+            last = max(last or months.max(), months.max())
+    return months_between(first, last) if first else []
+
+# Date-bounded daily aggregates; order_items is filtered on its own order_date, without the join
+RANGE_QUERIES = [
+    ('orders', """SELECT DATE(order_date) AS date, COUNT(*) AS orders, SUM(total_amount) AS gmv
+                  FROM {source} WHERE order_date >= ? AND order_date < ?
+                  GROUP BY DATE(order_date) ORDER BY date"""),
+    ('order_items', """SELECT DATE(order_date) AS date, SUM(quantity) AS units, SUM(total_price) AS revenue
+                       FROM {source} WHERE order_date >= ? AND order_date < ?
+                       GROUP BY DATE(order_date) ORDER BY date""")
+]
+
+def time_range_queries(conn, low, high):
+    """{label: (seconds, rows)} for the range queries through the full views and through pruned sources"""
+    timings = {}
+    for label, pruned in [('all partitions', False), ('pruned', True)]:
+        start = time.perf_counter()
+        rows = []
+        for table, sql in RANGE_QUERIES:
+            source = range_source(conn, table, low, high) if pruned else table
+            rows.append(conn.execute(sql.format(source=source), (low, high)).fetchall())
+        timings[label] = (time.perf_counter() - start, rows)
+    return timings
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Manage monthly partitions of the fact tables')
+    parser.add_argument('--db-path', default=DB_PATH, help='SQLite database')
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL database from load_data_mysql.py')
+    parser.add_argument('--partition', action='store_true',
+                        help='SQLite: convert the plain fact tables of an existing database into partitions')
+    parser.add_argument('--split-overflow', action='store_true',
+                        help='give months that only exist in the overflow partition their own partitions')
+    parser.add_argument('--archive', metavar='YYYY-MM', help='detach a month into <table>_archive_p<YYYYMM> tables')
+    parser.add_argument('--drop', metavar='YYYY-MM', help='drop a month')
+    parser.add_argument('--query-range', nargs=2, metavar=('FROM', 'TO'),
+                        help='SQLite: time a date-bounded aggregate with and without partition pruning')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Fact Table Partitioning")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        connection = create_connection()
+        if connection is None:
+            return
+        if args.split_overflow:
+            print(f"  ✓ Split out {len(mysql_split_overflow(connection))} new months")
+        for month, drop in [(args.archive, False), (args.drop, True)]:
+            if month:
+                mysql_archive_month(connection, month, drop)
+                print(f"  ✓ {'Dropped' if drop else 'Archived'} {month}")
+        cursor = connection.cursor()
+        months = mysql_partition_months(cursor)
+        cursor.close()
+        print(f"  {len(months)} monthly partitions" + (f": {months[0]} to {months[-1]}" if months else ''))
+        connection.close()
+        return
+
+    conn = sqlite3.connect(args.db_path)
+    if args.partition:
+        start = time.perf_counter()
+        moved = partition_fact_tables(conn)
+        print(f"  ✓ Partitioned the fact tables, {moved:,} rows moved in {time.perf_counter() - start:.2f}s")
+    if not is_partitioned(conn):
+        print("  ! The fact tables are not partitioned (use --partition or load with --partition-by-month)")
+        conn.close()
+        return
+    if args.split_overflow:
+        print(f"  ✓ Split out {len(split_overflow(conn))} new months")
+    for month, drop in [(args.archive, False), (args.drop, True)]:
+        if month:
+            start = time.perf_counter()
+            archive_month(conn, month, drop)
+            print(f"  ✓ {'Dropped' if drop else 'Archived'} {month} in {time.perf_counter() - start:.3f}s")
+    if args.query_range:
+        low, high = args.query_range
+        upper = (pd.Timestamp(high) + pd.Timedelta(days=1)).strftime('%Y-%m-%d')
+        timings = time_range_queries(conn, low, upper)
+        for label, (seconds, rows) in timings.items():
+            print(f"  {label}: {len(rows[0])} days in {seconds * 1000:.1f} ms")
+        same = timings['all partitions'][1] == timings['pruned'][1]
+        print(f"  {'✓' if same else '✗'} Pruned and unpruned results {'match' if same else 'differ'}")
+
+    print("\nPartitions (orders / order_items / deliveries):")
+    for month, orders, items, deliveries in partition_summary(conn):
+        print(f"  {month:8s} {orders:>10,} {items:>10,} {deliveries:>10,}")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""
+QuickShop Analytics - Promotion Attribution
+Interval-indexed sweep that links orders to promotions and measures real uses, cost and lift
+"""
+
+import argparse
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+
+from columnar_cache import open_table
+from query_cache import bump_versions
+
+DB_PATH = 'quickshop.db'
+OUTPUT_PATH = 'promotion_attribution.csv'
+ORDERS_PER_BLOCK = 1_000_000
+
+# An order is eligible for a promotion when start_date <= order_date <= end_date and
+# subtotal >= min_order_value. Promotions do not stack: an order uses the eligible
+# promotion worth the most to the customer (lowest promotion_id on ties), and only
+# when it is worth something. Incremental revenue compares eligible revenue in the
+# window with the same-length window just before it.
+
+def modeled_discount(promotion_type, value, subtotal, delivery_fee, cheapest_unit, units):
+    """What a promotion takes off an order under its terms"""
+    return np.select(
+        [promotion_type == 'Percentage Discount', promotion_type == 'Fixed Amount',
+         promotion_type == 'Free Delivery', promotion_type == 'BOGO'],
+        [np.round(subtotal * value / 100, 2), np.minimum(value, subtotal),
+         delivery_fee, np.where(units >= 2, cheapest_unit, 0.0)],
+        0.0)
+
+class PromotionIndex:
+    """Promotions cut into elementary time intervals, each with a fixed set of live promotions
+
+    Every promotion window and baseline window boundary is a cut point, so all
+    orders in one elementary interval see the same promotions. An order is
+    located with one searchsorted; the few promotions live there are padded
+    into a (intervals, max overlap) table for the best-offer choice, and window
+    totals are summed per (interval, min_order_value class) and folded back to
+    promotions at the end.
+    """
+
+    def __init__(self, promotions):
+        self.promotions = promotions.sort_values('promotion_id').reset_index(drop=True)
+        self.types = self.promotions['promotion_type'].to_numpy()
+        self.values = self.promotions['discount_value'].to_numpy(np.float64)
+        self.minimums = self.promotions['min_order_value'].fillna(0).to_numpy(np.float64)
+        self.starts = to_seconds(self.promotions['start_date'])
+        self.stops = to_seconds(self.promotions['end_date']) + 1  # end_date is inclusive
+        self.baseline_starts = 2 * self.starts - self.stops
+        self.cuts = np.unique(np.concatenate([self.starts, self.stops, self.baseline_starts]))
+        interval_starts = self.cuts[:-1]
+        live = (self.starts[None, :] <= interval_starts[:, None]) & (interval_starts[:, None] < self.stops[None, :])
+        self.in_baseline = ((self.baseline_starts[None, :] <= interval_starts[:, None])
+                            & (interval_starts[:, None] < self.starts[None, :]))
+        self.in_window = live
+        overlap = max(int(live.sum(axis=1).max()) if len(live) else 0, 1)
+        # Live promotions per interval in promotion_id order, padded with -1
+        ranked = np.where(live, np.arange(len(self.promotions))[None, :], len(self.promotions))
+        self.live = np.sort(ranked, axis=1)[:, :overlap]
+        self.live[self.live == len(self.promotions)] = -1
+        self.thresholds = np.unique(self.minimums)
+        self.promotion_class = np.searchsorted(self.thresholds, self.minimums)
+        shape = (len(interval_starts), len(self.thresholds) + 1)
+        self.interval_orders = np.zeros(shape, dtype=np.int64)
+        self.interval_revenue = np.zeros(shape)
+        self.uses = np.zeros(len(self.promotions), dtype=np.int64)
+        self.cost = np.zeros(len(self.promotions))
+        self.used_revenue = np.zeros(len(self.promotions))
+        self.first_order = None
+        self.orders = 0
+        self.needs_items = bool((self.types == 'BOGO').any())
+
+    def add_orders(self, order_seconds, subtotals, delivery_fees, total_amounts, cheapest_unit=None, units=None):
+        """Sweep a block of orders through the index"""
+        if len(order_seconds) == 0:
+            return
+        order_seconds = np.asarray(order_seconds, dtype=np.int64)
+        subtotals = np.asarray(subtotals, dtype=np.float64)
+        total_amounts = np.asarray(total_amounts, dtype=np.float64)
+        self.orders += len(order_seconds)
+        first = int(order_seconds.min())
+        self.first_order = first if self.first_order is None else min(self.first_order, first)
+
+        interval = np.searchsorted(self.cuts, order_seconds, side='right') - 1
+        inside = (interval >= 0) & (interval < len(self.cuts) - 1)
+        interval, subtotals, total_amounts = interval[inside], subtotals[inside], total_amounts[inside]
+        order_class = np.searchsorted(self.thresholds, subtotals, side='right')
+        cells = interval * self.interval_orders.shape[1] + order_class
+        size = self.interval_orders.size
+        self.interval_orders += np.bincount(cells, minlength=size).reshape(self.interval_orders.shape)
+        self.interval_revenue += np.bincount(cells, weights=total_amounts, minlength=size) \
+            .reshape(self.interval_revenue.shape)
+
+        # Best offer among the promotions live in each order's interval
+        candidates = self.live[interval]
+        valid = candidates >= 0
+        promotion = np.where(valid, candidates, 0)
+        cheapest_unit = np.zeros(len(interval)) if cheapest_unit is None else np.asarray(cheapest_unit)[inside]
+        units = np.zeros(len(interval)) if units is None else np.asarray(units)[inside]
+        discount = modeled_discount(self.types[promotion], self.values[promotion], subtotals[:, None],
+                                    np.asarray(delivery_fees, dtype=np.float64)[inside][:, None],
+                                    cheapest_unit[:, None], units[:, None])
+        discount = np.where(valid & (subtotals[:, None] >= self.minimums[promotion]), discount, 0.0)
+        best = np.argmax(discount, axis=1)  # first maximum = lowest promotion_id
+        rows = np.arange(len(interval))
+        best_discount = discount[rows, best]
+        used = best_discount > 0
+        chosen = promotion[rows, best][used]
+        self.uses += np.bincount(chosen, minlength=len(self.uses))
+        self.cost += np.bincount(chosen, weights=best_discount[used], minlength=len(self.uses))
+        self.used_revenue += np.bincount(chosen, weights=total_amounts[used], minlength=len(self.uses))
+
+    def window_totals(self, membership):
+        """(orders, revenue) per promotion over the intervals in membership, subtotal >= its minimum"""
+        # Column c of the reversed cumulative sum counts orders meeting thresholds[c - 1] or more
+        orders = np.cumsum(self.interval_orders[:, ::-1], axis=1)[:, ::-1]
+        revenue = np.cumsum(self.interval_revenue[:, ::-1], axis=1)[:, ::-1]
+        column = self.promotion_class + 1
+        return ((membership * orders[:, column]).sum(axis=0),
+                (membership * revenue[:, column]).sum(axis=0))
+
+    def results(self):
+        """Per-promotion eligibility, uses, discount cost and incremental revenue"""
+        eligible_orders, window_revenue = self.window_totals(self.in_window)
+        _, baseline_revenue = self.window_totals(self.in_baseline)
+        # Baselines reaching back before the first order would understate it
+        complete = self.baseline_starts >= (self.first_order if self.first_order is not None else 0)
+        incremental = np.where(complete, window_revenue - baseline_revenue, np.nan)
+        result = self.promotions[['promotion_id', 'promotion_name', 'promotion_type', 'discount_value',
+                                  'min_order_value', 'start_date', 'end_date']].copy()
+        result['eligible_orders'] = eligible_orders
+        result['uses'] = self.uses
+        result['discount_cost'] = np.round(self.cost, 2)
+        result['attributed_revenue'] = np.round(self.used_revenue, 2)
+        result['window_revenue'] = np.round(window_revenue, 2)
+        result['baseline_revenue'] = np.where(complete, np.round(baseline_revenue, 2), np.nan)
+        result['incremental_revenue'] = np.round(incremental, 2)
+        result['net_impact'] = np.round(incremental - self.cost, 2)
+        return result
+
+def to_seconds(values):
+    """Timestamps (strings or datetimes) as int64 seconds since the epoch"""
+    return pd.to_datetime(pd.Series(values)).to_numpy('datetime64[s]').view(np.int64)
+
+def load_promotions(conn):
+    """The promotions table as a DataFrame"""
+    cursor = conn.cursor()
+    cursor.execute("""SELECT promotion_id, promotion_name, promotion_type, discount_value,
+                             start_date, end_date, min_order_value FROM promotions""")
+    promotions = pd.DataFrame(cursor.fetchall(), columns=[d[0] for d in cursor.description])
+    cursor.close()
+    for column in ['discount_value', 'min_order_value']:
+        promotions[column] = pd.to_numeric(promotions[column])
+    return promotions
+
+def sweep_db(conn, index, orders_per_block=ORDERS_PER_BLOCK, placeholder='?'):
+    """Stream orders (and, for BOGO, per-order item summaries) through the index by order_id range"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MIN(order_id), 1), COALESCE(MAX(order_id), 0) FROM orders")
+    low, high = (int(v) for v in cursor.fetchone())
+    for first in range(low, high + 1, orders_per_block):
+        bounds = (first, min(first + orders_per_block - 1, high))
+        cursor.execute(f"""
+            SELECT order_id, order_date, subtotal, delivery_fee, total_amount FROM orders
+            WHERE order_id >= {placeholder} AND order_id <= {placeholder}""", bounds)
+        block = pd.DataFrame(cursor.fetchall(),
+                             columns=['order_id', 'order_date', 'subtotal', 'delivery_fee', 'total_amount'])
+        cheapest_unit = units = None
+        if index.needs_items:
+            cursor.execute(f"""
+                SELECT order_id, MIN(unit_price), SUM(quantity) FROM order_items
+                WHERE order_id >= {placeholder} AND order_id <= {placeholder}
+                GROUP BY order_id""", bounds)
+            items = pd.DataFrame(cursor.fetchall(), columns=['order_id', 'cheapest_unit', 'units'])
+            items = block[['order_id']].merge(items, on='order_id', how='left').fillna(0)
+            cheapest_unit = pd.to_numeric(items['cheapest_unit']).to_numpy(np.float64)
+            units = pd.to_numeric(items['units']).to_numpy(np.float64)
+        index.add_orders(to_seconds(block['order_date']), pd.to_numeric(block['subtotal']).to_numpy(np.float64),
+                         pd.to_numeric(block['delivery_fee']).to_numpy(np.float64),
+                         pd.to_numeric(block['total_amount']).to_numpy(np.float64), cheapest_unit, units)
+    cursor.close()
+
+def sweep_cache(cache_dir, index, orders_per_block=ORDERS_PER_BLOCK):
+    """Stream orders from the columnar cache; order_items are in order_id order, so item
+    summaries per order come from reduceat over contiguous runs"""
+    orders = open_table(cache_dir, 'orders')
+    items = open_table(cache_dir, 'order_items') if index.needs_items else None
+    item_orders = items.raw('order_id') if items else None
+    for start in range(0, orders.rows, orders_per_block):
+        stop = min(start + orders_per_block, orders.rows)
+        order_ids = orders.raw('order_id')[start:stop]
+        cheapest_unit = units = None
+        if items is not None:
+            lo, hi = np.searchsorted(item_orders, [order_ids[0], order_ids[-1] + 1])
+            block_orders = item_orders[lo:hi]
+            runs = np.flatnonzero(np.r_[True, block_orders[1:] != block_orders[:-1]]) if hi > lo else \
+                np.zeros(0, dtype=np.int64)
+            position = np.searchsorted(order_ids, block_orders[runs])
+            cheapest_unit, units = np.zeros(len(order_ids)), np.zeros(len(order_ids))
+            if len(runs):
+                cheapest_unit[position] = np.minimum.reduceat(
+                    items.raw('unit_price')[lo:hi].astype(np.float64), runs)
+                units[position] = np.add.reduceat(items.raw('quantity')[lo:hi].astype(np.int64), runs)
+        index.add_orders(orders.raw('order_date')[start:stop], orders.raw('subtotal')[start:stop],
+                         orders.raw('delivery_fee')[start:stop], orders.raw('total_amount')[start:stop],
+                         cheapest_unit, units)
+
+def check_against_sql(conn, result):
+    """Compare eligible orders and window revenue with the range join; returns mismatched ids"""
+    expected = pd.read_sql_query("""
+        SELECT p.promotion_id, COUNT(o.order_id) as eligible_orders,
+               COALESCE(SUM(o.total_amount), 0) as window_revenue
+        FROM promotions p
+        LEFT JOIN orders o
+            ON o.order_date BETWEEN p.start_date AND p.end_date
+           AND o.subtotal >= p.min_order_value
+        GROUP BY p.promotion_id""", conn)
+    merged = expected.merge(result, on='promotion_id', suffixes=('_sql', ''))
+    mismatched = (merged['eligible_orders_sql'] != merged['eligible_orders']) | \
+        ((merged['window_revenue_sql'] - merged['window_revenue']).abs() > 0.01)
+    return merged.loc[mismatched, 'promotion_id'].tolist()
+
+def write_back(conn, result, placeholder='?'):
+    """Replace the generated total_uses / total_revenue_impact with attributed values"""
+    cursor = conn.cursor()
+    rows = [(int(row.uses), None if pd.isna(row.incremental_revenue) else float(row.incremental_revenue),
+             int(row.promotion_id)) for row in result.itertuples()]
+    cursor.executemany(f"UPDATE promotions SET total_uses = {placeholder}, total_revenue_impact = {placeholder} "
+                       f"WHERE promotion_id = {placeholder}", rows)
+    bump_versions(cursor, ['promotions'], placeholder)
+    conn.commit()
+    cursor.close()
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Attribute orders to promotions with an interval sweep')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read from MySQL instead of SQLite')
+    parser.add_argument('--cache-dir', help='read orders from this columnar cache (promotions still from the db)')
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--write-back', action='store_true',
+                        help='store uses and incremental revenue in promotions.total_uses / total_revenue_impact')
+    parser.add_argument('--check', action='store_true', help='compare eligibility with the SQL range join')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Promotion Attribution")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+    else:
+        conn = sqlite3.connect(args.db_path)
+    placeholder = '%s' if args.mysql else '?'
+
+    index = PromotionIndex(load_promotions(conn))
+    print(f"  ✓ {len(index.promotions)} promotions -> {len(index.cuts) - 1} elementary intervals, "
+          f"at most {index.live.shape[1]} live at once")
+    start = time.perf_counter()
+    if args.cache_dir:
+        sweep_cache(args.cache_dir, index)
+    else:
+        sweep_db(conn, index, placeholder=placeholder)
+    seconds = time.perf_counter() - start
+    print(f"  ✓ Swept {index.orders:,} orders in {seconds:.2f}s ({index.orders / max(seconds, 1e-9):,.0f} orders/s)")
+
+    result = index.results()
+    result.to_csv(args.output, index=False)
+    print(f"  ✓ Saved to {args.output}")
+    print(f"\n  Uses: {result['uses'].sum():,}  Discount cost: {result['discount_cost'].sum():,.2f}  "
+          f"Incremental revenue: {result['incremental_revenue'].sum():,.2f}")
+    print(result[['promotion_id', 'promotion_type', 'eligible_orders', 'uses', 'discount_cost',
+                  'incremental_revenue', 'net_impact']].head(15).to_string(index=False))
+
+    if args.check:
+        if args.mysql:
+            print("\n  ! --check runs against SQLite only")
+        else:
+            mismatched = check_against_sql(conn, result)
+            print(f"\n  {'✓' if not mismatched else '✗'} Eligibility against the SQL range join: "
+                  f"{len(mismatched)} mismatched promotions {mismatched[:5] if mismatched else ''}")
+    if args.write_back:
+        write_back(conn, result, placeholder)
+        print("  ✓ promotions.total_uses and total_revenue_impact updated")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
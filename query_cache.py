@@ -0,0 +1,319 @@
+"""
+QuickShop Analytics - Query Result Cache
+LRU + TTL cache of query results keyed by SQL, parameters and per-table data versions
+"""
+
+import hashlib
+import os
+import pickle
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+from pathlib import Path
+import pandas as pd
+
+MAX_ENTRIES = 1024
+MAX_BYTES = 64 * 1024 * 1024
+TTL_SECONDS = 300
+CACHE_PATH = 'query_cache.pkl'  # MySQL runs; SQLite caches live next to their database (cache_path)
+
+DATA_VERSIONS_DDL = """
+CREATE TABLE IF NOT EXISTS data_versions (
+    table_name VARCHAR(64) PRIMARY KEY,
+    version BIGINT NOT NULL,
+    updated_at VARCHAR(19) NOT NULL
+)
+"""
+
+def bump_versions(cursor, tables, placeholder='?'):
+    """Give each table a new data version; call after every write that loaders make
+
+    Versions are max(previous + 1, time in ns), so a rebuilt database never
+    reuses a version that a persisted cache entry could still be keyed on.
+    """
+    cursor.execute(DATA_VERSIONS_DDL)
+    now = time.strftime('%Y-%m-%d %H:%M:%S')
+    for table in tables:
+        cursor.execute(f"SELECT version FROM data_versions WHERE table_name = {placeholder}", (table,))
+        row = cursor.fetchone()
+        version = max(int(row[0]) + 1 if row else 0, time.time_ns())
+        cursor.execute(f"DELETE FROM data_versions WHERE table_name = {placeholder}", (table,))
+        cursor.execute(f"INSERT INTO data_versions (table_name, version, updated_at) "
+                       f"VALUES ({placeholder}, {placeholder}, {placeholder})", (table, version, now))
+
+def cache_path(db_path):
+    """Persisted cache kept next to a SQLite database, shared by the loaders and sql_queries.py"""
+    db_path = Path(db_path)
+    return db_path.with_name(f'{db_path.stem}_query_cache.pkl')
+
+def file_identity(path):
+    """(device, inode) of a database file, or None when it does not exist
+
+    While a connection holds the old file open its inode cannot be reused, so a
+    different identity means the file was removed and recreated or replaced.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_dev, stat.st_ino
+
+def partition_parent(name):
+    """Table whose data version covers a table: a monthly fact partition is versioned
+    as its fact table (see partitioning.py), anything else under its own name"""
+    match = re.fullmatch(r'(orders|order_items|deliveries)_p(?:\d{6}|max)', name)
+    return match.group(1) if match else name
+
+def normalize_sql(sql):
+    """Strip comments, collapse whitespace and lowercase everything outside string literals"""
+    sql = re.sub(r'--[^\n]*', ' ', sql)
+    parts = re.split(r"('(?:[^']|'')*')", sql)
+    return ''.join(part if part.startswith("'") else re.sub(r'\s+', ' ', part.lower())
+                   for part in parts).strip().rstrip(';').strip()
+
+# Keywords that end a FROM list; ON / USING only end the current table reference
+FROM_LIST_END = {'where', 'group', 'order', 'having', 'limit', 'union', 'intersect', 'except', 'window',
+                 'select', 'set', 'values', 'returning'}
+SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|[a-z_][a-z0-9_$]*(?:\.[a-z_][a-z0-9_$]*)?|[(),]")
+
+def referenced_names(sql):
+    """Table or view names in every FROM list and JOIN
+
+    Walks the tokens with one frame per parenthesis level, so comma-separated
+    FROM lists (from orders o, customers c) yield every table, and a subquery's
+    SELECT list is not mistaken for one. MySQL stores view definitions with
+    backticked, schema-qualified names and parenthesized joins
+    (from ((`quickshop`.`orders` `o` join ...)), so quotes and schema prefixes
+    are dropped and a parenthesis in a table slot opens a nested FROM list.
+    """
+    sql = normalize_sql(sql).replace('`', '')
+    names = set()
+    frames = [{'from': False, 'expect': False}]  # in a FROM list / waiting for a table name
+    for token in SQL_TOKEN.findall(sql):
+        frame = frames[-1]
+        if token == '(':
+            frames.append({'from': frame['expect'], 'expect': frame['expect']})
+            frame['expect'] = False
+        elif token == ')':
+            if len(frames) > 1:
+                frames.pop()
+        elif token in ('from', 'join'):
+            frame['from'] = frame['expect'] = True
+        elif token == ',':
+            frame['expect'] = frame['from']
+        elif token in FROM_LIST_END:
+            frame['from'] = frame['expect'] = False
+        elif token in ('on', 'using'):
+            frame['expect'] = False
+        elif frame['expect'] and not token.startswith("'"):
+            names.add(token.split('.')[-1])
+            frame['expect'] = False
+    return names
+
+class QueryCache:
+    """Cache of query results in front of a SQLite or MySQL connection
+
+    A result is keyed by its normalized SQL, its parameters and the data versions of
+    every base table it reads (views are expanded), so a reload that bumps a
+    table's version makes every dependent entry unreachable. Entries are
+    evicted least-recently-used beyond max_entries or max_bytes, and expire
+    after ttl seconds. With persist_path the cache is reloaded on start and
+    written by save().
+
+    A full SQLite reload deletes and recreates the database file, which an open
+    connection never notices (it keeps reading the unlinked file). The file's
+    identity is checked with every version lookup and the cache reconnects, through
+    connect if given, when the file has been replaced.
+    """
+
+    def __init__(self, conn, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL_SECONDS,
+                 persist_path=None, placeholder=None, connect=None):
+        self.conn = conn
+        self.is_sqlite = isinstance(conn, sqlite3.Connection)
+        self.db_path = None
+        if self.is_sqlite:
+            # Empty for in-memory and temporary databases, which cannot be replaced
+            self.db_path = conn.execute("PRAGMA database_list").fetchone()[2] or None
+        self.connect = connect or (lambda: sqlite3.connect(self.db_path))
+        self._identity = file_identity(self.db_path) if self.db_path else None
+        self._owns_conn = False
+        self.placeholder = placeholder or ('?' if self.is_sqlite else '%s')
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.entries = OrderedDict()  # key -> (columns, rows, size, expires_at)
+        self.total_bytes = 0
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0, 'uncacheable': 0,
+                         'reconnects': 0}
+        self._normalized = {}
+        self._dependencies = {}
+        self._versions = None
+        self._snapshot = None
+        if persist_path and os.path.exists(persist_path):
+            self._load()
+
+    def _query(self, sql, params=()):
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        columns = [d[0] for d in cursor.description] if cursor.description else []
+        rows = tuple(tuple(row) for row in cursor.fetchall())
+        cursor.close()
+        return columns, rows
+
+    def _view_definition(self, name):
+        if self.is_sqlite:
+            _, rows = self._query("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = ?", (name,))
+        else:
+            _, rows = self._query("SELECT view_definition FROM information_schema.views "
+                                  "WHERE table_schema = DATABASE() AND table_name = %s", (name,))
+        return rows[0][0] if rows else None
+
+    def dependencies(self, sql):
+        """Base tables a query reads, following views"""
+        if sql not in self._dependencies:
+            tables, pending, seen = set(), list(referenced_names(sql)), set()
+            while pending:
+                name = pending.pop()
+                if name in seen:
+                    continue
+                seen.add(name)
+                definition = self._view_definition(name)
+                if definition:
+                    pending.extend(referenced_names(definition))
+                else:
+                    tables.add(partition_parent(name))
+            self._dependencies[sql] = tuple(sorted(tables))
+        return self._dependencies[sql]
+
+    def reconnect(self):
+        """Open a new connection to the database file; cached view expansions are dropped"""
+        if self._owns_conn:
+            self.conn.close()
+        self.conn = self.connect()
+        self._owns_conn = True
+        self._identity = file_identity(self.db_path)
+        self._dependencies = {}
+        self._versions = None
+        self._snapshot = None
+        self.counters['reconnects'] += 1
+
+    def versions(self):
+        """Current {table: version}, or None when the database has no data_versions table
+
+        On SQLite the table is re-read only when PRAGMA data_version (commits by other
+        connections) or total_changes (writes through this one) has moved, after
+        reconnecting if the database file was replaced.
+        """
+        if self.db_path:
+            identity = file_identity(self.db_path)
+            if identity is None:
+                # Between a reload's remove and create: nothing is safe to serve from the cache
+                return None
+            if identity != self._identity:
+                self.reconnect()
+        if self.is_sqlite:
+            snapshot = (self.conn.execute("PRAGMA data_version").fetchone()[0], self.conn.total_changes)
+            if snapshot == self._snapshot:
+                return self._versions
+            self._snapshot = snapshot
+        try:
+            _, rows = self._query("SELECT table_name, version FROM data_versions")
+            self._versions = dict(rows)
+        except Exception:
+            if not self.is_sqlite:
+                self.conn.rollback()
+            self._versions = None
+        return self._versions
+
+    def cache_key(self, sql, params):
+        """Hash of normalized SQL, parameters and dependent table versions"""
+        versions = self.versions()
+        if versions is None:
+            return None
+        normalized = self._normalized.get(sql)
+        if normalized is None:
+            normalized = self._normalized[sql] = normalize_sql(sql)
+        dependency_versions = tuple((t, versions.get(t, 0)) for t in self.dependencies(normalized))
+        return hashlib.sha1(repr((normalized, tuple(params), dependency_versions)).encode()).hexdigest()
+
+    def fetch_with_columns(self, sql, params=()):
+        """(column names, rows) from the cache, or from the database on a miss"""
+        key = self.cache_key(sql, params)
+        if key is None:
+            self.counters['uncacheable'] += 1
+            return self._query(sql, params)
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[3] is None or entry[3] > time.time():
+                self.entries.move_to_end(key)
+                self.counters['hits'] += 1
+                return entry[0], entry[1]
+            self._remove(key)
+            self.counters['expirations'] += 1
+        self.counters['misses'] += 1
+        columns, rows = self._query(sql, params)
+        self._store(key, columns, rows)
+        return columns, rows
+
+    def fetch(self, sql, params=()):
+        """Rows (a tuple of tuples) for a query"""
+        return self.fetch_with_columns(sql, params)[1]
+
+    def fetch_frame(self, sql, params=()):
+        """Result as a DataFrame"""
+        columns, rows = self.fetch_with_columns(sql, params)
+        return pd.DataFrame(list(rows), columns=columns)
+
+    def _store(self, key, columns, rows):
+        size = len(pickle.dumps((columns, rows), protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        expires_at = time.time() + self.ttl if self.ttl else None
+        self.entries[key] = (columns, rows, size, expires_at)
+        self.total_bytes += size
+        self._trim()
+
+    def _trim(self):
+        while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            self._remove(next(iter(self.entries)))
+            self.counters['evictions'] += 1
+
+    def _remove(self, key):
+        self.total_bytes -= self.entries.pop(key)[2]
+
+    def clear(self):
+        """Drop every entry"""
+        self.entries.clear()
+        self.total_bytes = 0
+
+    def stats(self):
+        """Counters plus current size"""
+        lookups = self.counters['hits'] + self.counters['misses']
+        return dict(self.counters, entries=len(self.entries), bytes=self.total_bytes,
+                    hit_rate=self.counters['hits'] / lookups if lookups else 0.0)
+
+    def save(self):
+        """Write unexpired entries to persist_path"""
+        if not self.persist_path:
+            return
+        now = time.time()
+        live = [(key, entry) for key, entry in self.entries.items() if entry[3] is None or entry[3] > now]
+        tmp_path = f"{self.persist_path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(live, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.persist_path)
+
+    def _load(self):
+        try:
+            with open(self.persist_path, 'rb') as f:
+                live = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return
+        now = time.time()
+        for key, entry in live:
+            if entry[3] is None or entry[3] > now:
+                self.entries[key] = entry
+                self.total_bytes += entry[2]
+        self._trim()
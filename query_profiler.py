@@ -0,0 +1,303 @@
+"""
+QuickShop Analytics - Query Profiler & Index Advisor
+Explains and times each analytics query, flags scans and temp B-trees, and measures suggested indexes
+"""
+
+import argparse
+import json
+import re
+import sqlite3
+import time
+
+from sql_queries import parse_queries
+
+DB_PATH = 'quickshop.db'
+REPEATS = 3
+MIN_TABLE_ROWS = 10_000  # scans of smaller tables are not worth an index
+MAX_INDEX_COLUMNS = 6
+RECOMMEND_SPEEDUP = 1.2  # measured speedup at which a suggestion is recommended
+OUTPUT_PATH = 'query_profile.json'
+
+CLAUSE_END = r'(?=\b(?:LEFT|RIGHT|INNER|CROSS|JOIN|WHERE|GROUP|ORDER|HAVING|LIMIT|UNION)\b|;|\)|$)'
+NOT_ALIASES = {'ON', 'WHERE', 'LEFT', 'RIGHT', 'INNER', 'CROSS', 'JOIN', 'GROUP', 'ORDER', 'HAVING',
+               'LIMIT', 'UNION', 'AS'}
+LITERAL = r"(?:'[^']*'|-?\d+(?:\.\d+)?)"
+
+class SQLiteTarget:
+    """Plan, timing and index DDL for SQLite"""
+    name = 'sqlite'
+    examined_unit = 'VM steps'
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path)
+
+    def columns(self, table):
+        return [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def row_count(self, table):
+        return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def existing_indexes(self, table):
+        indexes = []
+        for _, index_name, *_ in self.conn.execute(f"PRAGMA index_list({table})").fetchall():
+            indexes.append([row[2] for row in self.conn.execute(f"PRAGMA index_info({index_name})")])
+        return indexes
+
+    def explain(self, sql, aliases):
+        """EXPLAIN QUERY PLAN -> (plan lines, full scans, non-covering index lookups, temp B-trees)"""
+        plan = [row[3] for row in self.conn.execute(f"EXPLAIN QUERY PLAN {sql}")]
+        scans, lookups, temp_btrees = [], [], 0
+        for detail in plan:
+            match = re.match(r'(SCAN|SEARCH) (\w+)', detail)
+            if match and 'COVERING INDEX' not in detail:
+                table = aliases.get(match.group(2), match.group(2))
+                if match.group(1) == 'SCAN':
+                    scans.append(table)
+                elif 'USING INDEX' in detail:
+                    lookups.append(table)
+            if 'TEMP B-TREE' in detail:
+                temp_btrees += 1
+        return plan, scans, lookups, temp_btrees
+
+    def run(self, sql):
+        """Execute once; returns (seconds, result rows, VM steps as a proxy for rows examined)"""
+        steps = [0]
+
+        def count_steps():
+            steps[0] += 1000
+            return 0
+        self.conn.set_progress_handler(count_steps, 1000)
+        start = time.perf_counter()
+        rows = len(self.conn.execute(sql).fetchall())
+        seconds = time.perf_counter() - start
+        self.conn.set_progress_handler(None, 0)
+        return seconds, rows, steps[0]
+
+    def create_index(self, index_name, table, columns):
+        self.conn.execute(f"CREATE INDEX {index_name} ON {table} ({', '.join(columns)})")
+        self.conn.execute(f"ANALYZE {index_name}")
+
+    def drop_index(self, index_name, table):
+        self.conn.execute(f"DROP INDEX {index_name}")
+
+class MySQLTarget:
+    """Plan, timing and index DDL for MySQL 8.0.18+ (EXPLAIN ANALYZE)"""
+    name = 'mysql'
+    examined_unit = 'rows examined'
+
+    def __init__(self):
+        from load_data_mysql import create_connection
+        self.conn = create_connection()
+
+    def _query(self, sql, params=()):
+        cursor = self.conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def columns(self, table):
+        return [row[0] for row in self._query(
+            "SELECT column_name FROM information_schema.columns WHERE table_schema = DATABASE() "
+            "AND table_name = %s ORDER BY ordinal_position", (table,))]
+
+    def row_count(self, table):
+        return self._query(f"SELECT COUNT(*) FROM {table}")[0][0]
+
+    def existing_indexes(self, table):
+        indexes = {}
+        for index_name, column in self._query(
+                "SELECT index_name, column_name FROM information_schema.statistics WHERE table_schema = DATABASE() "
+                "AND table_name = %s ORDER BY index_name, seq_in_index", (table,)):
+            indexes.setdefault(index_name, []).append(column)
+        return list(indexes.values())
+
+    def explain(self, sql, aliases):
+        """EXPLAIN ANALYZE -> (plan lines, full scans, non-covering index lookups, temporary tables)"""
+        plan = self._query(f"EXPLAIN ANALYZE {sql.rstrip(';')}")[0][0].splitlines()
+        scans, lookups, temp_btrees = [], [], 0
+        for line in plan:
+            match = re.search(r'Table scan on (\w+)', line)
+            if match and '<temporary>' not in line:
+                scans.append(aliases.get(match.group(1), match.group(1)))
+            match = re.search(r'Index (?:lookup|range scan) on (\w+)', line)
+            if match and 'Covering' not in line:
+                lookups.append(aliases.get(match.group(1), match.group(1)))
+            if 'temporary' in line.lower():
+                temp_btrees += 1
+        return [line.strip() for line in plan], scans, lookups, temp_btrees
+
+    def run(self, sql):
+        """Execute once; returns (seconds, result rows, rows examined from the session handler counters)"""
+        self._query("FLUSH STATUS")
+        start = time.perf_counter()
+        rows = len(self._query(sql))
+        seconds = time.perf_counter() - start
+        handlers = dict(self._query("SHOW SESSION STATUS LIKE 'Handler_read%'"))
+        examined = sum(int(value) for key, value in handlers.items() if key != 'Handler_read_key')
+        return seconds, rows, examined
+
+    def create_index(self, index_name, table, columns):
+        self._query(f"CREATE INDEX {index_name} ON {table} ({', '.join(columns)})")
+        self._query(f"ANALYZE TABLE {table}")
+
+    def drop_index(self, index_name, table):
+        self._query(f"DROP INDEX {index_name} ON {table}")
+
+def table_aliases(sql):
+    """Map every alias (and bare table name) in FROM/JOIN clauses to its table"""
+    aliases = {}
+    for table, alias in re.findall(r'\b(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?', sql, re.I):
+        aliases[table] = table
+        if alias and alias.upper() not in NOT_ALIASES:
+            aliases[alias] = table
+    return aliases
+
+def column_refs(text, aliases, table_columns):
+    """(table, column) references in a SQL fragment, in order of appearance"""
+    refs = []
+    for qualifier, column in re.findall(r'\b(?:(\w+)\.)?(\w+)\b', text):
+        if qualifier:
+            table = aliases.get(qualifier)
+            if table and column in table_columns.get(table, []):
+                refs.append((table, column))
+        else:
+            owners = [t for t in set(aliases.values()) if column in table_columns.get(t, [])]
+            if len(owners) == 1:
+                refs.append((owners[0], column))
+    return list(dict.fromkeys(refs))
+
+def clause_text(sql, keyword):
+    """Concatenated text of every occurrence of a clause (WHERE, GROUP BY, ON)"""
+    return ' '.join(re.findall(rf'\b{keyword}\b(.*?){CLAUSE_END}', sql, re.I | re.S))
+
+def candidate_indexes(sql, aliases, table_columns, tables):
+    """Suggested (table, columns) indexes: equality filters, then range/group/join keys, then covering"""
+    where = clause_text(sql, 'WHERE')
+    equality = column_refs(' '.join(re.findall(rf'((?:\w+\.)?\w+)\s*=\s*{LITERAL}', where)), aliases, table_columns)
+    ranges = column_refs(' '.join(re.findall(rf'((?:\w+\.)?\w+)\s*(?:<=|>=|<|>)\s*{LITERAL}', where)),
+                         aliases, table_columns)
+    grouping = column_refs(clause_text(sql, 'GROUP BY') + ' ' + clause_text(sql, 'ON'), aliases, table_columns)
+    referenced = column_refs(sql, aliases, table_columns)
+
+    candidates = []
+    for table in tables:
+        keys = [c for t, c in equality if t == table]
+        keys += [c for t, c in ranges + grouping if t == table and c not in keys][:1]
+        used = [c for t, c in referenced if t == table]
+        covering = keys + [c for c in used if c not in keys]
+        if keys:
+            candidates.append((table, keys[:MAX_INDEX_COLUMNS]))
+        if len(covering) <= MAX_INDEX_COLUMNS and covering != keys:
+            candidates.append((table, covering))
+    return candidates
+
+def index_name(prefix, table, columns):
+    """Index name from its table and columns, within MySQL's 64-character limit"""
+    return f"{prefix}_{table}_{'_'.join(columns)}"[:64]
+
+def already_indexed(columns, existing):
+    """True if an existing index starts with exactly these columns"""
+    return any(index[:len(columns)] == columns for index in existing)
+
+def median_run(target, sql, repeats):
+    """Median (seconds, rows, examined) over repeats"""
+    runs = sorted(target.run(sql) for _ in range(repeats))
+    return runs[len(runs) // 2]
+
+def profile_query(target, query, repeats, min_table_rows, table_columns, row_counts, measure):
+    """Explain, time and (optionally) measure suggested indexes for one query"""
+    sql = query['sql']
+    aliases = table_aliases(sql)
+    plan, scans, lookups, temp_btrees = target.explain(sql, aliases)
+    seconds, rows, examined = median_run(target, sql, repeats)
+    report = {
+        'number': query['number'], 'name': query['name'], 'seconds': seconds, 'result_rows': rows,
+        'examined': examined, 'examined_unit': target.examined_unit, 'full_scans': scans, 'index_lookups': lookups, 'temp_btrees': temp_btrees,
+        'plan': plan,
+        'suggestions': []
+    }
+    # Large tables read in full, or through an index that still needs a row lookup per match
+    targets = [t for t in dict.fromkeys(scans + lookups) if row_counts.get(t, 0) >= min_table_rows]
+    for table, columns in candidate_indexes(sql, aliases, table_columns, targets):
+        if already_indexed(columns, target.existing_indexes(table)):
+            continue
+        suggestion = {'table': table, 'columns': columns,
+                      'ddl': f"CREATE INDEX {index_name('idx', table, columns)} ON {table} ({', '.join(columns)});"}
+        if measure:
+            trial_index = index_name('advisor', table, columns)
+            start = time.perf_counter()
+            target.create_index(trial_index, table, columns)
+            suggestion['build_seconds'] = time.perf_counter() - start
+            try:
+                _, new_scans, new_lookups, new_temp = target.explain(sql, aliases)
+                new_seconds, _, new_examined = median_run(target, sql, repeats)
+            finally:
+                target.drop_index(trial_index, table)
+            speedup = seconds / max(new_seconds, 1e-9)
+            suggestion.update(seconds=new_seconds, examined=new_examined, full_scans=new_scans,
+                              index_lookups=new_lookups, temp_btrees=new_temp, speedup=speedup,
+                              recommended=speedup >= RECOMMEND_SPEEDUP)
+        report['suggestions'].append(suggestion)
+    return report
+
+def print_report(report):
+    """Print one query's profile"""
+    flags = []
+    if report['full_scans']:
+        flags.append(f"SCAN {', '.join(report['full_scans'])}")
+    if report['temp_btrees']:
+        flags.append(f"{report['temp_btrees']} temp B-tree(s)")
+    marker = '!' if flags else '✓'
+    print(f"\n{marker} {report['number']} {report['name']}")
+    print(f"    {report['seconds'] * 1000:,.1f} ms, {report['result_rows']:,} rows returned, "
+          f"{report['examined']:,} {report['examined_unit']}" + (f" | {'; '.join(flags)}" if flags else ''))
+    for suggestion in report['suggestions']:
+        marker = '✓' if suggestion.get('recommended') else '->'
+        line = f"    {marker} {suggestion['ddl']}"
+        if 'speedup' in suggestion:
+            line += (f"  {suggestion['seconds'] * 1000:,.1f} ms ({suggestion['speedup']:.2f}x, "
+                     f"built in {suggestion['build_seconds']:.2f}s)")
+        print(line)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Profile the analytics queries and suggest indexes')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='profile the MySQL database from load_data_mysql.py')
+    parser.add_argument('--queries', nargs='*', help='only these query numbers (default: all)')
+    parser.add_argument('--repeat', type=int, default=REPEATS, help='timed runs per query; the median is kept')
+    parser.add_argument('--min-table-rows', type=int, default=MIN_TABLE_ROWS,
+                        help='only suggest indexes for scanned tables at least this large')
+    parser.add_argument('--no-measure', action='store_true', help='suggest indexes without building them')
+    parser.add_argument('--output', default=OUTPUT_PATH, help='JSON report')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Query Profiler")
+    print("=" * 60)
+    target = MySQLTarget() if args.mysql else SQLiteTarget(args.db_path)
+    if target.conn is None:
+        return
+
+    queries = [q for q in parse_queries() if not args.queries or q['number'] in args.queries]
+    tables = set()
+    for query in queries:
+        tables.update(table_aliases(query['sql']).values())
+    table_columns = {table: target.columns(table) for table in tables}
+    row_counts = {table: target.row_count(table) for table in tables}
+
+    reports = [profile_query(target, query, args.repeat, args.min_table_rows, table_columns, row_counts,
+                             not args.no_measure) for query in queries]
+    for report in reports:
+        print_report(report)
+
+    with open(args.output, 'w') as f:
+        json.dump({'engine': target.name, 'queries': reports}, f, indent=2)
+    print(f"\nReport written to {args.output}")
+    target.conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+QuickShop Analytics - RFM Scoring Engine
+Vectorized, incremental recency / frequency / monetary quintile scores from orders
+"""
+
+import argparse
+import sqlite3
+import time
+from pathlib import Path
+import numpy as np
+import pandas as pd
+
+from columnar_cache import open_table
+
+DB_PATH = 'quickshop.db'
+STATE_PATH = 'rfm_state.npz'
+OUTPUT_PATH = 'rfm_scores.csv'
+ORDERS_PER_BLOCK = 1_000_000
+NUM_TILES = 5
+SECONDS_PER_DAY = 86_400
+
+# calculate_rfm() from schema_mysql_fixed.sql, ported to SQLite with NOW() pinned to an
+# as-of date and ties broken by customer_id (MySQL leaves the order of ties undefined)
+RFM_REFERENCE_SQL = """
+SELECT
+    customer_id,
+    CAST(julianday(DATE(:as_of)) - julianday(DATE(last_order_date)) AS INTEGER) as recency_days,
+    total_orders as frequency,
+    total_spent as monetary,
+    NTILE(5) OVER (ORDER BY julianday(DATE(:as_of)) - julianday(DATE(last_order_date)) DESC, customer_id)
+        as recency_score,
+    NTILE(5) OVER (ORDER BY total_orders ASC, customer_id) as frequency_score,
+    NTILE(5) OVER (ORDER BY total_spent ASC, customer_id) as monetary_score
+FROM customers
+WHERE last_order_date IS NOT NULL
+ORDER BY monetary DESC
+"""
+
+def ntile(order, num_tiles=NUM_TILES):
+    """NTILE(num_tiles) scores for rows visited in the given order (SQL bucket sizing)"""
+    n = len(order)
+    size, remainder = divmod(n, num_tiles)
+    position = np.arange(n)
+    big = remainder * (size + 1)  # the first `remainder` tiles hold one extra row
+    tile = np.where(position < big, position // max(size + 1, 1),
+                    remainder + (position - big) // max(size, 1))
+    scores = np.empty(n, dtype=np.int8)
+    scores[order] = tile + 1
+    return scores
+
+def narrow(values):
+    """Integer keys as uint16 when they fit, so NumPy radix-sorts them"""
+    if len(values) and values.min() >= 0 and values.max() < 1 << 16:
+        return values.astype(np.uint16)
+    return values
+
+def descending(order, keys):
+    """Reverse an ascending stable order while keeping rows with equal keys in ascending order"""
+    reverse = order[::-1]
+    if len(reverse) == 0:
+        return reverse
+    values = keys[reverse]
+    boundary = np.ones(len(reverse), dtype=bool)
+    boundary[1:] = values[1:] != values[:-1]
+    starts = np.flatnonzero(boundary)
+    ends = np.append(starts[1:], len(reverse))
+    run = np.cumsum(boundary) - 1
+    # Flip each run of equal keys back into place
+    return reverse[starts[run] + ends[run] - 1 - np.arange(len(reverse))]
+
+class RFMEngine:
+    """Per-customer delivered-order aggregates, indexed by customer_id, folded in incrementally
+
+    Orders are append-only and watermarked on order_id, as in the loaders; amounts
+    are summed in integer cents so totals are exact and order independent.
+    """
+
+    def __init__(self):
+        self.frequency = np.zeros(0, dtype=np.int64)
+        self.monetary_cents = np.zeros(0, dtype=np.int64)
+        self.last_order = np.zeros(0, dtype=np.int64)  # seconds since epoch, 0 = never
+        self.last_order_id = 0
+
+    def _grow(self, size):
+        if size > len(self.frequency):
+            extra = size - len(self.frequency)
+            self.frequency = np.concatenate([self.frequency, np.zeros(extra, dtype=np.int64)])
+            self.monetary_cents = np.concatenate([self.monetary_cents, np.zeros(extra, dtype=np.int64)])
+            self.last_order = np.concatenate([self.last_order, np.zeros(extra, dtype=np.int64)])
+
+    def add_orders(self, order_ids, customer_ids, order_seconds, total_amounts):
+        """Fold delivered orders into the aggregates"""
+        if len(order_ids) == 0:
+            return
+        customer_ids = np.asarray(customer_ids, dtype=np.int64)
+        self._grow(int(customer_ids.max()) + 1)
+        size = len(self.frequency)
+        cents = np.rint(np.asarray(total_amounts, dtype=np.float64) * 100).astype(np.int64)
+        self.frequency += np.bincount(customer_ids, minlength=size)
+        # bincount weights are float64; per-block sums of cents stay exact well past 2**53 / block size
+        self.monetary_cents += np.rint(np.bincount(customer_ids, weights=cents, minlength=size)).astype(np.int64)
+        np.maximum.at(self.last_order, customer_ids, np.asarray(order_seconds, dtype=np.int64))
+        self.last_order_id = max(self.last_order_id, int(np.max(order_ids)))
+
+    def update_from_db(self, conn, orders_per_block=ORDERS_PER_BLOCK, placeholder='?'):
+        """Fold in delivered orders past last_order_id; returns orders added"""
+        cursor = conn.cursor()
+        cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+        high = int(cursor.fetchone()[0])
+        added = 0
+        for low in range(self.last_order_id, high, orders_per_block):
+            cursor.execute(f"""
+                SELECT order_id, customer_id, order_date, total_amount FROM orders
+                WHERE order_id > {placeholder} AND order_id <= {placeholder} AND status = 'Delivered'""",
+                           (low, min(low + orders_per_block, high)))
+            block = pd.DataFrame(cursor.fetchall(), columns=['order_id', 'customer_id', 'order_date', 'total_amount'])
+            seconds = pd.to_datetime(block['order_date']).to_numpy('datetime64[s]').view(np.int64)
+            self.add_orders(block['order_id'].to_numpy(), block['customer_id'].to_numpy(), seconds,
+                            block['total_amount'].to_numpy())
+            added += len(block)
+        self.last_order_id = max(self.last_order_id, high)
+        cursor.close()
+        return added
+
+    def update_from_cache(self, cache_dir):
+        """Fold in delivered orders past last_order_id from the columnar cache (memory-mapped)"""
+        orders = open_table(cache_dir, 'orders')
+        status = orders.columns['status']['dictionary']
+        if 'Delivered' not in status:
+            return 0
+        order_ids = orders.raw('order_id')
+        mask = (orders.raw('status') == status.index('Delivered')) & (order_ids > self.last_order_id)
+        self.add_orders(order_ids[mask], orders.raw('customer_id')[mask], orders.raw('order_date')[mask],
+                        orders.raw('total_amount')[mask])
+        if len(order_ids):
+            self.last_order_id = max(self.last_order_id, int(order_ids.max()))
+        return int(mask.sum())
+
+    def latest_order_date(self):
+        """Date of the most recent delivered order, the default as-of date"""
+        return np.datetime64(int(self.last_order.max()), 's').astype('datetime64[D]')
+
+    def scores(self, as_of):
+        """RFM values and NTILE(5) scores as of a date, for customers with a delivered order"""
+        customer_ids = np.flatnonzero(self.frequency)
+        as_of_day = np.datetime64(as_of, 'D').astype(np.int64)
+        last_day = self.last_order[customer_ids] // SECONDS_PER_DAY
+        frequency = self.frequency[customer_ids]
+        monetary_cents = self.monetary_cents[customer_ids]
+        # Stable sorts over customer_id order break ties by customer_id; keys narrowed to
+        # 16 bits where they fit sort by radix instead of timsort
+        recency_order = np.argsort(narrow(last_day), kind='stable')  # oldest = score 1
+        frequency_order = np.argsort(narrow(frequency), kind='stable')
+        monetary_order = np.argsort(monetary_cents, kind='stable')
+        output_order = descending(monetary_order, monetary_cents)
+        return pd.DataFrame({
+            'customer_id': customer_ids[output_order],
+            'recency_days': (as_of_day - last_day)[output_order],
+            'frequency': frequency[output_order],
+            'monetary': monetary_cents[output_order] / 100,
+            'recency_score': ntile(recency_order)[output_order],
+            'frequency_score': ntile(frequency_order)[output_order],
+            'monetary_score': ntile(monetary_order)[output_order]
+        })
+
+    def save(self, path):
+        """Persist aggregates and watermark"""
+        np.savez(path, frequency=self.frequency, monetary_cents=self.monetary_cents,
+                 last_order=self.last_order, last_order_id=self.last_order_id)
+
+    @classmethod
+    def load(cls, path):
+        """Restore an engine written by save()"""
+        state = np.load(path)
+        engine = cls()
+        engine.frequency = state['frequency']
+        engine.monetary_cents = state['monetary_cents']
+        engine.last_order = state['last_order']
+        engine.last_order_id = int(state['last_order_id'])
+        return engine
+
+def check_against_procedure(conn, scores, as_of):
+    """Compare with calculate_rfm() run on the customers table; returns (mismatched rows, rows)"""
+    expected = pd.read_sql_query(RFM_REFERENCE_SQL, conn, params={'as_of': str(as_of)})
+    merged = expected.merge(scores, on='customer_id', how='outer', suffixes=('_sql', ''))
+    mismatched = merged['recency_score'].isna() | merged['recency_score_sql'].isna()
+    for column in ['recency_days', 'frequency', 'recency_score', 'frequency_score', 'monetary_score']:
+        mismatched |= merged[f'{column}_sql'] != merged[column]
+    mismatched |= (merged['monetary_sql'] - merged['monetary']).abs() > 0.005
+    return int(mismatched.sum()), len(expected)
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='RFM scores from orders with an explicit as-of date')
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='read orders from MySQL instead of SQLite')
+    parser.add_argument('--cache-dir', help='read orders from this columnar cache instead of the database')
+    parser.add_argument('--as-of', help='YYYY-MM-DD (default: date of the latest delivered order)')
+    parser.add_argument('--state', default=STATE_PATH, help='persisted aggregates, updated incrementally')
+    parser.add_argument('--rebuild', action='store_true', help='ignore the saved state')
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    parser.add_argument('--check', action='store_true', help='compare with calculate_rfm() on the customers table')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - RFM Scoring")
+    print("=" * 60)
+    engine = RFMEngine.load(args.state) if Path(args.state).exists() and not args.rebuild else RFMEngine()
+
+    start = time.perf_counter()
+    if args.cache_dir:
+        added = engine.update_from_cache(args.cache_dir)
+    elif args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+        added = engine.update_from_db(conn, placeholder='%s')
+        conn.close()
+    else:
+        conn = sqlite3.connect(args.db_path)
+        added = engine.update_from_db(conn)
+        conn.close()
+    print(f"  ✓ Folded in {added:,} delivered orders in {time.perf_counter() - start:.2f}s "
+          f"(through order {engine.last_order_id:,})")
+    engine.save(args.state)
+
+    as_of = args.as_of or str(engine.latest_order_date())
+    start = time.perf_counter()
+    scores = engine.scores(as_of)
+    print(f"  ✓ Scored {len(scores):,} customers as of {as_of} in {time.perf_counter() - start:.2f}s")
+    scores.to_csv(args.output, index=False)
+    print(f"  ✓ Saved to {args.output}")
+
+    print("\nCustomers per RFM score (R / F / M):")
+    print(pd.DataFrame({
+        'recency': scores['recency_score'].value_counts().sort_index(),
+        'frequency': scores['frequency_score'].value_counts().sort_index(),
+        'monetary': scores['monetary_score'].value_counts().sort_index()
+    }).to_string())
+
+    if args.check:
+        conn = sqlite3.connect(args.db_path)
+        mismatches, expected = check_against_procedure(conn, scores, as_of)
+        conn.close()
+        print(f"\n  {'✓' if mismatches == 0 else '✗'} {expected:,} customers from calculate_rfm(), "
+              f"{mismatches} mismatches")
+
+if __name__ == "__main__":
+    main()
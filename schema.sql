@@ -0,0 +1,214 @@
+-- QuickShop Analytics - SQLite Database Schema
+-- SQLite counterpart of schema_mysql_fixed.sql, used by load_data.py
+
+DROP TABLE IF EXISTS inventory;
+DROP TABLE IF EXISTS deliveries;
+DROP TABLE IF EXISTS order_items;
+DROP TABLE IF EXISTS orders;
+DROP TABLE IF EXISTS promotions;
+DROP TABLE IF EXISTS products;
+DROP TABLE IF EXISTS customers;
+DROP TABLE IF EXISTS local_shops;
+
+-- 1. Local Shops Table
+CREATE TABLE local_shops (
+    shop_id INTEGER PRIMARY KEY,
+    shop_name TEXT NOT NULL,
+    shop_type TEXT NOT NULL,
+    city TEXT NOT NULL,
+    district TEXT NOT NULL,
+    partnership_start_date DATETIME NOT NULL,
+    commission_rate DECIMAL(4,2) NOT NULL,
+    avg_preparation_time_minutes INTEGER NOT NULL,
+    is_active BOOLEAN NOT NULL DEFAULT 1
+);
+
+-- 2. Products Table
+CREATE TABLE products (
+    product_id INTEGER PRIMARY KEY,
+    product_name TEXT NOT NULL,
+    category TEXT NOT NULL,
+    subcategory TEXT NOT NULL,
+    base_price DECIMAL(10,2) NOT NULL,
+    unit TEXT NOT NULL
+);
+
+-- 3. Customers Table
+CREATE TABLE customers (
+    customer_id INTEGER PRIMARY KEY,
+    registration_date DATETIME NOT NULL,
+    city TEXT NOT NULL,
+    customer_segment TEXT NOT NULL,
+    total_orders INTEGER DEFAULT 0,
+    total_spent DECIMAL(10,2) DEFAULT 0.00,
+    last_order_date DATETIME
+);
+
+-- 4. Promotions Table
+CREATE TABLE promotions (
+    promotion_id INTEGER PRIMARY KEY,
+    promotion_name TEXT NOT NULL,
+    promotion_type TEXT NOT NULL,
+    discount_value DECIMAL(10,2) NOT NULL,
+    start_date DATETIME NOT NULL,
+    end_date DATETIME NOT NULL,
+    min_order_value DECIMAL(10,2) DEFAULT 0.00,
+    total_uses INTEGER DEFAULT 0,
+    total_revenue_impact DECIMAL(12,2) DEFAULT 0.00
+);
+
+-- 5. Orders Table
+CREATE TABLE orders (
+    order_id INTEGER PRIMARY KEY,
+    customer_id INTEGER NOT NULL REFERENCES customers(customer_id),
+    shop_id INTEGER NOT NULL REFERENCES local_shops(shop_id),
+    order_date DATETIME NOT NULL,
+    status TEXT NOT NULL,
+    subtotal DECIMAL(10,2) NOT NULL,
+    discount DECIMAL(10,2) DEFAULT 0.00,
+    delivery_fee DECIMAL(10,2) NOT NULL,
+    total_amount DECIMAL(10,2) NOT NULL,
+    payment_method TEXT NOT NULL
+);
+
+-- 6. Order Items Table
+CREATE TABLE order_items (
+    order_item_id INTEGER PRIMARY KEY,
+    order_id INTEGER NOT NULL REFERENCES orders(order_id),
+    product_id INTEGER NOT NULL REFERENCES products(product_id),
+    quantity INTEGER NOT NULL,
+    unit_price DECIMAL(10,2) NOT NULL,
+    total_price DECIMAL(10,2) NOT NULL
+);
+
+-- 7. Deliveries Table
+CREATE TABLE deliveries (
+    delivery_id INTEGER PRIMARY KEY,
+    order_id INTEGER NOT NULL UNIQUE REFERENCES orders(order_id),
+    preparation_time_minutes INTEGER NOT NULL,
+    delivery_time_minutes INTEGER NOT NULL,
+    total_time_minutes INTEGER NOT NULL,
+    delivery_rating DECIMAL(2,1)
+);
+
+-- 8. Inventory Table
+CREATE TABLE inventory (
+    inventory_id INTEGER PRIMARY KEY,
+    shop_id INTEGER NOT NULL REFERENCES local_shops(shop_id),
+    product_id INTEGER NOT NULL REFERENCES products(product_id),
+    stock_level INTEGER NOT NULL,
+    reorder_point INTEGER NOT NULL,
+    last_restocked DATETIME NOT NULL,
+    is_available BOOLEAN NOT NULL DEFAULT 1
+);
+
+-- Secondary Indexes
+CREATE INDEX idx_shops_city ON local_shops(city);
+CREATE INDEX idx_shops_type ON local_shops(shop_type);
+CREATE INDEX idx_shops_active ON local_shops(is_active);
+CREATE INDEX idx_products_category ON products(category);
+CREATE INDEX idx_products_subcategory ON products(subcategory);
+CREATE INDEX idx_customers_registration_date ON customers(registration_date);
+CREATE INDEX idx_customers_city ON customers(city);
+CREATE INDEX idx_customers_segment ON customers(customer_segment);
+CREATE INDEX idx_customers_last_order ON customers(last_order_date);
+CREATE INDEX idx_promotions_dates ON promotions(start_date, end_date);
+CREATE INDEX idx_promotions_type ON promotions(promotion_type);
+CREATE INDEX idx_customer ON orders(customer_id);
+CREATE INDEX idx_shop ON orders(shop_id);
+CREATE INDEX idx_order_date ON orders(order_date);
+CREATE INDEX idx_status ON orders(status);
+CREATE INDEX idx_order_items_order ON order_items(order_id);
+CREATE INDEX idx_order_items_product ON order_items(product_id);
+CREATE INDEX idx_deliveries_rating ON deliveries(delivery_rating);
+CREATE INDEX idx_inventory_shop ON inventory(shop_id);
+CREATE INDEX idx_inventory_product ON inventory(product_id);
+CREATE INDEX idx_inventory_available ON inventory(is_available);
+
+-- Create Views for Common Analytics Queries
+
+-- Daily Metrics View
+CREATE VIEW daily_metrics AS
+SELECT
+    DATE(order_date) as date,
+    COUNT(*) as total_orders,
+    COUNT(DISTINCT customer_id) as unique_customers,
+    SUM(CASE WHEN status = 'Delivered' THEN total_amount ELSE 0 END) as gmv,
+    AVG(CASE WHEN status = 'Delivered' THEN total_amount ELSE NULL END) as avg_order_value,
+    SUM(CASE WHEN status = 'Delivered' THEN 1 ELSE 0 END) as delivered_orders,
+    SUM(CASE WHEN status = 'Cancelled' THEN 1 ELSE 0 END) as cancelled_orders
+FROM orders
+GROUP BY DATE(order_date)
+ORDER BY date DESC;
+
+-- Shop Performance View
+CREATE VIEW shop_performance AS
+SELECT
+    s.shop_id,
+    s.shop_name,
+    s.shop_type,
+    s.city,
+    COUNT(o.order_id) as total_orders,
+    SUM(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE 0 END) as total_revenue,
+    AVG(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE NULL END) as avg_order_value,
+    AVG(d.delivery_rating) as avg_rating,
+    AVG(d.total_time_minutes) as avg_delivery_time,
+    COUNT(DISTINCT o.customer_id) as unique_customers
+FROM local_shops s
+LEFT JOIN orders o ON s.shop_id = o.shop_id
+LEFT JOIN deliveries d ON o.order_id = d.order_id
+GROUP BY s.shop_id, s.shop_name, s.shop_type, s.city;
+
+-- Customer Segments Summary View
+CREATE VIEW customer_segments_summary AS
+SELECT
+    customer_segment,
+    COUNT(*) as customer_count,
+    AVG(total_orders) as avg_orders_per_customer,
+    AVG(total_spent) as avg_lifetime_value,
+    SUM(total_spent) as total_segment_revenue
+FROM customers
+GROUP BY customer_segment;
+
+-- Product Performance View
+CREATE VIEW product_performance AS
+SELECT
+    p.product_id,
+    p.product_name,
+    p.category,
+    p.subcategory,
+    COUNT(oi.order_item_id) as times_ordered,
+    SUM(oi.quantity) as total_quantity_sold,
+    SUM(oi.total_price) as total_revenue,
+    AVG(oi.unit_price) as avg_selling_price
+FROM products p
+LEFT JOIN order_items oi ON p.product_id = oi.product_id
+GROUP BY p.product_id, p.product_name, p.category, p.subcategory;
+
+-- City Performance View
+CREATE VIEW city_performance AS
+SELECT
+    c.city,
+    COUNT(DISTINCT c.customer_id) as total_customers,
+    COUNT(DISTINCT s.shop_id) as total_shops,
+    COUNT(o.order_id) as total_orders,
+    SUM(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE 0 END) as total_gmv,
+    AVG(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE NULL END) as avg_order_value
+FROM customers c
+LEFT JOIN orders o ON c.customer_id = o.customer_id
+LEFT JOIN local_shops s ON c.city = s.city
+GROUP BY c.city;
+
+-- Delivery Performance View
+CREATE VIEW delivery_performance AS
+SELECT
+    DATE(o.order_date) as date,
+    AVG(d.preparation_time_minutes) as avg_prep_time,
+    AVG(d.delivery_time_minutes) as avg_delivery_time,
+    AVG(d.total_time_minutes) as avg_total_time,
+    AVG(d.delivery_rating) as avg_rating,
+    COUNT(*) as total_deliveries
+FROM deliveries d
+JOIN orders o ON d.order_id = o.order_id
+GROUP BY DATE(o.order_date)
+ORDER BY date DESC;
@@ -0,0 +1,116 @@
+"""
+QuickShop Analytics - SQL Query Collection
+Parses the analytics SQL file into named, numbered queries and runs them through the query cache
+"""
+
+import argparse
+import re
+import sqlite3
+import time
+from pathlib import Path
+
+from query_cache import QueryCache, CACHE_PATH, cache_path
+
+QUERIES_PATH = Path(__file__).parent / 'SQl_Analytics querries.sql'
+DB_PATH = 'quickshop.db'
+MAX_ROWS = 20
+
+SECTION_PATTERN = re.compile(r'^--\s*(\d+)\.\s+[A-Z]')
+TITLE_PATTERN = re.compile(r'^--\s*(?:(\d+\.\d+)\s+)?(.+)$')
+
+def slugify(title):
+    """'Cross-Sell Analysis (Products ...)' -> 'cross_sell_analysis_products_...'"""
+    return re.sub(r'[^a-z0-9]+', '_', title.lower()).strip('_')
+
+def parse_queries(path=QUERIES_PATH):
+    """Return the queries in file order as dicts with number, title, name, purpose, section and sql
+
+    Queries without a number in their title comment are numbered by position
+    within their section, so "Top Performing Products" in section 3 becomes 3.1.
+    """
+    queries = []
+    section, comments, pending = None, [], ''
+    for line in Path(path).read_text().splitlines(keepends=True):
+        stripped = line.strip()
+        if not pending:
+            if not stripped:
+                continue
+            if stripped.startswith('--'):
+                match = SECTION_PATTERN.match(stripped)
+                if match:
+                    section, comments = int(match.group(1)), []
+                elif not set(stripped) <= set('-= '):
+                    comments.append(stripped)
+                continue
+        pending += line
+        if sqlite3.complete_statement(pending):
+            purpose = next((c.split(':', 1)[1].strip() for c in comments if c.startswith('-- Purpose:')), '')
+            titles = [c for c in comments if not c.startswith('-- Purpose:')]
+            number, title = TITLE_PATTERN.match(titles[-1]).groups() if titles else (None, 'Query')
+            if number is None:
+                taken = {q['number'] for q in queries}
+                position = 1
+                while f'{section}.{position}' in taken:
+                    position += 1
+                number = f'{section}.{position}'
+            queries.append({
+                'number': number,
+                'title': title.strip(),
+                'name': f"q{number.replace('.', '_')}_{slugify(title)}",
+                'purpose': purpose,
+                'section': section,
+                'sql': pending.strip()
+            })
+            comments, pending = [], ''
+    return queries
+
+def get_query(key, path=QUERIES_PATH):
+    """Look up a query by number ('3.4') or name"""
+    for query in parse_queries(path):
+        if key in (query['number'], query['name']):
+            return query
+    raise KeyError(f"No query {key!r} in {path}")
+
+def run_query(cache, key, path=QUERIES_PATH):
+    """Result of a collection query as a DataFrame, served by a QueryCache until the next load"""
+    return cache.fetch_frame(get_query(key, path)['sql'])
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Run queries from the analytics collection through the query cache')
+    parser.add_argument('queries', nargs='+', help="query numbers ('3.4') or names")
+    parser.add_argument('--db-path', default=DB_PATH)
+    parser.add_argument('--mysql', action='store_true', help='query the MySQL database from load_data_mysql.py')
+    parser.add_argument('--cache-path', help='persisted query cache (default: next to the SQLite database, or '
+                        f'{CACHE_PATH} for MySQL)')
+    parser.add_argument('--max-rows', type=int, default=MAX_ROWS, help='rows printed per query')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - SQL Query Collection")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn = create_connection()
+        if conn is None:
+            return
+    else:
+        conn = sqlite3.connect(args.db_path)
+    default_cache = CACHE_PATH if args.mysql else cache_path(args.db_path)
+    cache = QueryCache(conn, persist_path=args.cache_path or default_cache)
+    for key in args.queries:
+        query = get_query(key)
+        start = time.perf_counter()
+        result = run_query(cache, key)
+        print(f"\n{query['number']} {query['title']} ({len(result):,} rows, "
+              f"{(time.perf_counter() - start) * 1000:.2f} ms)")
+        print(result.head(args.max_rows).to_string(index=False))
+    stats = cache.stats()
+    cache.save()
+    print(f"\n  Query cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
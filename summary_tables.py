@@ -0,0 +1,510 @@
+"""
+QuickShop Analytics - Materialized Summary Tables
+Incrementally maintained tables behind the dashboard views, for SQLite and MySQL
+"""
+
+import sqlite3
+import argparse
+import time
+import re
+from datetime import date, timedelta
+from pathlib import Path
+
+from query_cache import bump_versions
+
+# Views served from summary tables. The original definitions stay available as
+# <view>_live and are what check_summaries() compares against.
+MATERIALIZED_VIEWS = ['daily_metrics', 'shop_performance', 'product_performance',
+                      'city_performance', 'delivery_performance']
+SUMMARY_TABLES = ['mv_daily_metrics', 'mv_delivery_performance', 'mv_shop_totals', 'mv_shop_customers',
+                  'mv_product_totals', 'mv_customer_totals']
+# Replaced by mv_customer_totals; installing over it triggers a rebuild
+LEGACY_TABLES = ['mv_city_totals']
+VIEW_KEYS = {
+    'daily_metrics': 'date',
+    'shop_performance': 'shop_id',
+    'product_performance': 'product_id',
+    'city_performance': 'city',
+    'delivery_performance': 'date'
+}
+
+SQLITE = {
+    'name': 'sqlite',
+    'placeholder': '?',
+    'schema_path': Path(__file__).parent / 'schema.sql',
+    'insert_ignore': 'INSERT OR IGNORE',
+    'upsert_add': 'INSERT INTO {table} ({columns}) VALUES ({values}) '
+                  'ON CONFLICT({key}) DO UPDATE SET {assignments}',
+    'add_assignment': '{column} = {column} + excluded.{column}',
+    'create_view': 'DROP VIEW IF EXISTS {name}; CREATE VIEW {name} AS {body}',
+}
+MYSQL = {
+    'name': 'mysql',
+    'placeholder': '%s',
+    'schema_path': Path(__file__).parent / 'schema_mysql_fixed.sql',
+    'insert_ignore': 'INSERT IGNORE',
+    'upsert_add': 'INSERT INTO {table} ({columns}) VALUES ({values}) '
+                  'ON DUPLICATE KEY UPDATE {assignments}',
+    'add_assignment': '{column} = {column} + VALUES({column})',
+    'create_view': 'CREATE OR REPLACE VIEW {name} AS {body}',
+}
+
+SUMMARY_DDL = [
+    """CREATE TABLE IF NOT EXISTS mv_refresh_state (
+        name VARCHAR(64) PRIMARY KEY,
+        last_order_id BIGINT NOT NULL,
+        refreshed_at VARCHAR(19) NOT NULL
+    )""",
+    # Date partitions, recomputed whole whenever new orders land on that date
+    """CREATE TABLE IF NOT EXISTS mv_daily_metrics (
+        date DATE PRIMARY KEY,
+        total_orders BIGINT NOT NULL,
+        unique_customers BIGINT NOT NULL,
+        gmv DECIMAL(18,2),
+        avg_order_value DECIMAL(14,4),
+        delivered_orders BIGINT NOT NULL,
+        cancelled_orders BIGINT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS mv_delivery_performance (
+        date DATE PRIMARY KEY,
+        avg_prep_time DECIMAL(14,4),
+        avg_delivery_time DECIMAL(14,4),
+        avg_total_time DECIMAL(14,4),
+        avg_rating DECIMAL(14,4),
+        total_deliveries BIGINT NOT NULL
+    )""",
+    # Additive per-key totals, updated from the delta of new orders
+    """CREATE TABLE IF NOT EXISTS mv_shop_totals (
+        shop_id INT PRIMARY KEY,
+        total_orders BIGINT NOT NULL,
+        delivered_orders BIGINT NOT NULL,
+        delivered_revenue DECIMAL(18,2) NOT NULL,
+        rating_sum DECIMAL(18,1) NOT NULL,
+        rating_count BIGINT NOT NULL,
+        delivery_time_sum BIGINT NOT NULL,
+        delivery_count BIGINT NOT NULL,
+        unique_customers BIGINT NOT NULL
+    )""",
+    """CREATE TABLE IF NOT EXISTS mv_shop_customers (
+        shop_id INT NOT NULL,
+        customer_id INT NOT NULL,
+        PRIMARY KEY (shop_id, customer_id)
+    )""",
+    """CREATE TABLE IF NOT EXISTS mv_product_totals (
+        product_id INT PRIMARY KEY,
+        times_ordered BIGINT NOT NULL,
+        total_quantity_sold BIGINT NOT NULL,
+        total_revenue DECIMAL(18,2) NOT NULL,
+        unit_price_sum DECIMAL(18,2) NOT NULL
+    )""",
+    # Per customer rather than per city: the view groups orders by the customer's current city,
+    # so a customer who moves takes their history along
+    """CREATE TABLE IF NOT EXISTS mv_customer_totals (
+        customer_id INT PRIMARY KEY,
+        total_orders BIGINT NOT NULL,
+        delivered_orders BIGINT NOT NULL,
+        delivered_gmv DECIMAL(18,2) NOT NULL
+    )""",
+]
+
+SERVING_VIEWS = {
+    'daily_metrics': """
+        SELECT date, total_orders, unique_customers, gmv, avg_order_value,
+               delivered_orders, cancelled_orders
+        FROM mv_daily_metrics
+        ORDER BY date DESC""",
+    'delivery_performance': """
+        SELECT date, avg_prep_time, avg_delivery_time, avg_total_time, avg_rating, total_deliveries
+        FROM mv_delivery_performance
+        ORDER BY date DESC""",
+    'shop_performance': """
+        SELECT
+            s.shop_id,
+            s.shop_name,
+            s.shop_type,
+            s.city,
+            COALESCE(m.total_orders, 0) as total_orders,
+            COALESCE(m.delivered_revenue, 0) as total_revenue,
+            m.delivered_revenue * 1.0 / NULLIF(m.delivered_orders, 0) as avg_order_value,
+            m.rating_sum * 1.0 / NULLIF(m.rating_count, 0) as avg_rating,
+            m.delivery_time_sum * 1.0 / NULLIF(m.delivery_count, 0) as avg_delivery_time,
+            COALESCE(m.unique_customers, 0) as unique_customers
+        FROM local_shops s
+        LEFT JOIN mv_shop_totals m ON s.shop_id = m.shop_id""",
+    'product_performance': """
+        SELECT
+            p.product_id,
+            p.product_name,
+            p.category,
+            p.subcategory,
+            COALESCE(m.times_ordered, 0) as times_ordered,
+            m.total_quantity_sold,
+            m.total_revenue,
+            m.unit_price_sum * 1.0 / NULLIF(m.times_ordered, 0) as avg_selling_price
+        FROM products p
+        LEFT JOIN mv_product_totals m ON p.product_id = m.product_id""",
+    # Mirrors the original view exactly, including its customer x shop fan-out on city:
+    # order counts and GMV are multiplied by the number of shops in the city.
+    'city_performance': """
+        SELECT
+            c.city,
+            c.total_customers,
+            COALESCE(s.total_shops, 0) as total_shops,
+            COALESCE(c.total_orders, 0) * COALESCE(s.total_shops, 1) as total_orders,
+            COALESCE(c.delivered_gmv, 0) * COALESCE(s.total_shops, 1) as total_gmv,
+            c.delivered_gmv * 1.0 / NULLIF(c.delivered_orders, 0) as avg_order_value
+        FROM (SELECT cu.city, COUNT(*) as total_customers, SUM(m.total_orders) as total_orders,
+                     SUM(m.delivered_orders) as delivered_orders, SUM(m.delivered_gmv) as delivered_gmv
+              FROM customers cu
+              LEFT JOIN mv_customer_totals m ON cu.customer_id = m.customer_id
+              GROUP BY cu.city) c
+        LEFT JOIN (SELECT city, COUNT(*) as total_shops FROM local_shops GROUP BY city) s ON c.city = s.city""",
+}
+
+def original_view_definitions(schema_path):
+    """Parse {view name: SELECT body} from a schema file"""
+    schema_sql = Path(schema_path).read_text()
+    return {name: body.strip() for name, body in
+            re.findall(r'CREATE (?:OR REPLACE )?VIEW (\w+) AS\s+(.*?);', schema_sql, re.S)}
+
+def execute_script(cursor, sql):
+    """Execute one or more ';'-separated statements"""
+    for statement in sql.split(';'):
+        if statement.strip():
+            cursor.execute(statement)
+
+def table_exists(conn, cursor, table):
+    try:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        cursor.fetchall()
+        return True
+    except Exception:
+        if not isinstance(conn, sqlite3.Connection):
+            conn.rollback()
+        return False
+
+def summaries_installed(conn):
+    """Whether install_summaries() has run against this database"""
+    cursor = conn.cursor()
+    installed = table_exists(conn, cursor, 'mv_refresh_state')
+    cursor.close()
+    return installed
+
+def clear_summaries(cursor):
+    """Empty the summary tables and their refresh state, so the next refresh recomputes everything"""
+    for table in ['mv_refresh_state'] + SUMMARY_TABLES:
+        cursor.execute(f"DELETE FROM {table}")
+
+def install_summaries(conn, dialect=SQLITE):
+    """Create the summary tables and point the dashboard views at them (idempotent)"""
+    cursor = conn.cursor()
+    for ddl in SUMMARY_DDL:
+        cursor.execute(ddl)
+    legacy = [table for table in LEGACY_TABLES if table_exists(conn, cursor, table)]
+    if legacy:
+        clear_summaries(cursor)
+        for table in legacy:
+            cursor.execute(f"DROP TABLE {table}")
+    originals = original_view_definitions(dialect['schema_path'])
+    for name in MATERIALIZED_VIEWS:
+        execute_script(cursor, dialect['create_view'].format(name=f'{name}_live', body=originals[name]))
+        execute_script(cursor, dialect['create_view'].format(name=name, body=SERVING_VIEWS[name]))
+    conn.commit()
+    cursor.close()
+
+def date_ranges(dates):
+    """Collapse sorted dates into contiguous (first, last) runs"""
+    ranges = []
+    for day in dates:
+        if ranges and day == ranges[-1][1] + timedelta(days=1):
+            ranges[-1][1] = day
+        else:
+            ranges.append([day, day])
+    return ranges
+
+def upsert_add(cursor, dialect, table, key, columns, rows):
+    """Add rows of per-key deltas onto an additive summary table"""
+    if not rows:
+        return
+    p = dialect['placeholder']
+    cursor.executemany(dialect['upsert_add'].format(
+        table=table, key=key,
+        columns=', '.join([key] + columns),
+        values=', '.join([p] * (len(columns) + 1)),
+        assignments=', '.join(dialect['add_assignment'].format(column=c) for c in columns)), rows)
+
+def refresh_date_partitions(cursor, dialect, low, high):
+    """Recompute daily_metrics and delivery_performance for every date touched by new orders"""
+    p = dialect['placeholder']
+    cursor.execute(f"SELECT DISTINCT DATE(order_date) FROM orders WHERE order_id > {p} AND order_id <= {p}",
+                   (low, high))
+    touched = sorted(day if isinstance(day, date) else date.fromisoformat(str(day))
+                     for (day,) in cursor.fetchall())
+    for first, last in date_ranges(touched):
+        start, end = first.isoformat(), (last + timedelta(days=1)).isoformat()
+        cursor.execute(f"DELETE FROM mv_daily_metrics WHERE date >= {p} AND date <= {p}",
+                       (first.isoformat(), last.isoformat()))
+        cursor.execute(f"""
+            INSERT INTO mv_daily_metrics
+            SELECT
+                DATE(order_date),
+                COUNT(*),
+                COUNT(DISTINCT customer_id),
+                SUM(CASE WHEN status = 'Delivered' THEN total_amount ELSE 0 END),
+                AVG(CASE WHEN status = 'Delivered' THEN total_amount ELSE NULL END),
+                SUM(CASE WHEN status = 'Delivered' THEN 1 ELSE 0 END),
+                SUM(CASE WHEN status = 'Cancelled' THEN 1 ELSE 0 END)
+            FROM orders
+            WHERE order_date >= {p} AND order_date < {p}
+            GROUP BY DATE(order_date)""", (start, end))
+        cursor.execute(f"DELETE FROM mv_delivery_performance WHERE date >= {p} AND date <= {p}",
+                       (first.isoformat(), last.isoformat()))
+        cursor.execute(f"""
+            INSERT INTO mv_delivery_performance
+            SELECT
+                DATE(o.order_date),
+                AVG(d.preparation_time_minutes),
+                AVG(d.delivery_time_minutes),
+                AVG(d.total_time_minutes),
+                AVG(d.delivery_rating),
+                COUNT(*)
+            FROM deliveries d
+            JOIN orders o ON d.order_id = o.order_id
+            WHERE o.order_date >= {p} AND o.order_date < {p}
+            GROUP BY DATE(o.order_date)""", (start, end))
+    return len(touched)
+
+def refresh_additive_totals(cursor, dialect, low, high):
+    """Fold the orders in (low, high] into the shop, product and city totals"""
+    p = dialect['placeholder']
+    # Shops: distinct (shop, customer) pairs not seen before feed unique_customers
+    cursor.execute(f"""
+        SELECT pairs.shop_id, COUNT(*)
+        FROM (SELECT DISTINCT shop_id, customer_id FROM orders WHERE order_id > {p} AND order_id <= {p}) pairs
+        WHERE NOT EXISTS (SELECT 1 FROM mv_shop_customers m
+                          WHERE m.shop_id = pairs.shop_id AND m.customer_id = pairs.customer_id)
+        GROUP BY pairs.shop_id""", (low, high))
+    new_customers = dict(cursor.fetchall())
+    cursor.execute(f"""
+        {dialect['insert_ignore']} INTO mv_shop_customers (shop_id, customer_id)
+        SELECT DISTINCT shop_id, customer_id FROM orders WHERE order_id > {p} AND order_id <= {p}""",
+                   (low, high))
+    cursor.execute(f"""
+        SELECT
+            o.shop_id,
+            COUNT(o.order_id),
+            SUM(CASE WHEN o.status = 'Delivered' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE 0 END),
+            COALESCE(SUM(d.delivery_rating), 0),
+            COUNT(d.delivery_rating),
+            COALESCE(SUM(d.total_time_minutes), 0),
+            COUNT(d.total_time_minutes)
+        FROM orders o
+        LEFT JOIN deliveries d ON o.order_id = d.order_id
+        WHERE o.order_id > {p} AND o.order_id <= {p}
+        GROUP BY o.shop_id""", (low, high))
+    shop_rows = [row + (new_customers.get(row[0], 0),) for row in cursor.fetchall()]
+    upsert_add(cursor, dialect, 'mv_shop_totals', 'shop_id',
+               ['total_orders', 'delivered_orders', 'delivered_revenue', 'rating_sum', 'rating_count',
+                'delivery_time_sum', 'delivery_count', 'unique_customers'], shop_rows)
+
+    cursor.execute(f"""
+        SELECT product_id, COUNT(order_item_id), SUM(quantity), SUM(total_price), SUM(unit_price)
+        FROM order_items
+        WHERE order_id > {p} AND order_id <= {p}
+        GROUP BY product_id""", (low, high))
+    upsert_add(cursor, dialect, 'mv_product_totals', 'product_id',
+               ['times_ordered', 'total_quantity_sold', 'total_revenue', 'unit_price_sum'], cursor.fetchall())
+
+    cursor.execute(f"""
+        SELECT
+            customer_id,
+            COUNT(order_id),
+            SUM(CASE WHEN status = 'Delivered' THEN 1 ELSE 0 END),
+            SUM(CASE WHEN status = 'Delivered' THEN total_amount ELSE 0 END)
+        FROM orders
+        WHERE order_id > {p} AND order_id <= {p}
+        GROUP BY customer_id""", (low, high))
+    upsert_add(cursor, dialect, 'mv_customer_totals', 'customer_id',
+               ['total_orders', 'delivered_orders', 'delivered_gmv'], cursor.fetchall())
+
+def refresh_summaries(conn, dialect=SQLITE, rebuild=False):
+    """Bring the summary tables up to date with orders loaded since the last refresh"""
+    p = dialect['placeholder']
+    cursor = conn.cursor()
+    if rebuild:
+        clear_summaries(cursor)
+        bump_versions(cursor, SUMMARY_TABLES, p)
+    cursor.execute("SELECT last_order_id FROM mv_refresh_state WHERE name = 'orders'")
+    row = cursor.fetchone()
+    low = int(row[0]) if row else 0
+    cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+    high = int(cursor.fetchone()[0])
+    touched_dates = 0
+    if high > low:
+        touched_dates = refresh_date_partitions(cursor, dialect, low, high)
+        refresh_additive_totals(cursor, dialect, low, high)
+        bump_versions(cursor, SUMMARY_TABLES, p)
+        cursor.execute(f"DELETE FROM mv_refresh_state WHERE name = {p}", ('orders',))
+        cursor.execute(f"INSERT INTO mv_refresh_state VALUES ({p}, {p}, {p})",
+                       ('orders', high, time.strftime('%Y-%m-%d %H:%M:%S')))
+    conn.commit()
+    cursor.close()
+    return {'orders': max(high - low, 0), 'dates': touched_dates}
+
+def retract_orders(conn, dialect, lower, upper):
+    """Take the orders dated [lower, upper) out of the summary tables before they are removed
+
+    Called by partitioning.archive_month() while the month is still attached, since the
+    refresh only ever folds new orders in. Bounds are whole days; their date partitions are
+    emptied and only orders the refresh has already folded in are subtracted from the
+    totals. Returns the number of orders retracted.
+    """
+    p = dialect['placeholder']
+    cursor = conn.cursor()
+    if not table_exists(conn, cursor, 'mv_refresh_state'):
+        cursor.close()
+        return 0
+    cursor.execute("SELECT last_order_id FROM mv_refresh_state WHERE name = 'orders'")
+    row = cursor.fetchone()
+    if not row:
+        cursor.close()
+        return 0
+    folded = f"o.order_date >= {p} AND o.order_date < {p} AND o.order_id <= {p}"
+    params = (lower, upper, int(row[0]))
+    for table in ['mv_daily_metrics', 'mv_delivery_performance']:
+        cursor.execute(f"DELETE FROM {table} WHERE date >= {p} AND date < {p}", (lower[:10], upper[:10]))
+
+    # Pairs with no folded order left outside the range stop counting towards unique_customers
+    cursor.execute(f"""
+        SELECT DISTINCT o.shop_id, o.customer_id
+        FROM orders o
+        WHERE {folded}
+          AND NOT EXISTS (SELECT 1 FROM orders r
+                          WHERE r.shop_id = o.shop_id AND r.customer_id = o.customer_id AND r.order_id <= {p}
+                            AND (r.order_date < {p} OR r.order_date >= {p}))""",
+                   params + (params[2], lower, upper))
+    gone = cursor.fetchall()
+    cursor.executemany(f"DELETE FROM mv_shop_customers WHERE shop_id = {p} AND customer_id = {p}", gone)
+    lost_customers = {}
+    for shop_id, _ in gone:
+        lost_customers[shop_id] = lost_customers.get(shop_id, 0) + 1
+    cursor.execute(f"""
+        SELECT
+            o.shop_id,
+            -COUNT(o.order_id),
+            -SUM(CASE WHEN o.status = 'Delivered' THEN 1 ELSE 0 END),
+            -SUM(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE 0 END),
+            -COALESCE(SUM(d.delivery_rating), 0),
+            -COUNT(d.delivery_rating),
+            -COALESCE(SUM(d.total_time_minutes), 0),
+            -COUNT(d.total_time_minutes)
+        FROM orders o
+        LEFT JOIN deliveries d ON o.order_id = d.order_id
+        WHERE {folded}
+        GROUP BY o.shop_id""", params)
+    shop_rows = [row + (-lost_customers.get(row[0], 0),) for row in cursor.fetchall()]
+    upsert_add(cursor, dialect, 'mv_shop_totals', 'shop_id',
+               ['total_orders', 'delivered_orders', 'delivered_revenue', 'rating_sum', 'rating_count',
+                'delivery_time_sum', 'delivery_count', 'unique_customers'], shop_rows)
+
+    cursor.execute(f"""
+        SELECT i.product_id, -COUNT(i.order_item_id), -SUM(i.quantity), -SUM(i.total_price), -SUM(i.unit_price)
+        FROM order_items i
+        JOIN orders o ON i.order_id = o.order_id
+        WHERE {folded}
+        GROUP BY i.product_id""", params)
+    upsert_add(cursor, dialect, 'mv_product_totals', 'product_id',
+               ['times_ordered', 'total_quantity_sold', 'total_revenue', 'unit_price_sum'], cursor.fetchall())
+
+    cursor.execute(f"""
+        SELECT
+            o.customer_id,
+            -COUNT(o.order_id),
+            -SUM(CASE WHEN o.status = 'Delivered' THEN 1 ELSE 0 END),
+            -SUM(CASE WHEN o.status = 'Delivered' THEN o.total_amount ELSE 0 END)
+        FROM orders o
+        WHERE {folded}
+        GROUP BY o.customer_id""", params)
+    customer_rows = cursor.fetchall()
+    upsert_add(cursor, dialect, 'mv_customer_totals', 'customer_id',
+               ['total_orders', 'delivered_orders', 'delivered_gmv'], customer_rows)
+
+    # Keys left without orders read as absent, as in the original views
+    cursor.execute("DELETE FROM mv_shop_totals WHERE total_orders = 0")
+    cursor.execute("DELETE FROM mv_product_totals WHERE times_ordered = 0")
+    cursor.execute("DELETE FROM mv_customer_totals WHERE total_orders = 0")
+    bump_versions(cursor, SUMMARY_TABLES, p)
+    cursor.close()
+    return -sum(row[1] for row in customer_rows)
+
+def values_match(a, b, tolerance=1e-6):
+    """Compare two result values, allowing for float/decimal summation order"""
+    if a is None or b is None:
+        return a is None and b is None
+    if isinstance(a, str) or isinstance(b, str):
+        return str(a) == str(b)
+    return abs(float(a) - float(b)) <= tolerance * max(1.0, abs(float(a)), abs(float(b)))
+
+def check_summaries(conn):
+    """Compare every materialized view with its original definition; returns {view: mismatches}"""
+    cursor = conn.cursor()
+    mismatches = {}
+    for name in MATERIALIZED_VIEWS:
+        key = VIEW_KEYS[name]
+        cursor.execute(f"SELECT * FROM {name} ORDER BY {key}")
+        served = cursor.fetchall()
+        cursor.execute(f"SELECT * FROM {name}_live ORDER BY {key}")
+        live = cursor.fetchall()
+        bad = 0 if len(served) == len(live) else abs(len(served) - len(live))
+        for served_row, live_row in zip(served, live):
+            if not all(values_match(a, b) for a, b in zip(served_row, live_row)):
+                bad += 1
+        mismatches[name] = bad
+    cursor.close()
+    return mismatches
+
+def parse_args():
+    """Parse command line options"""
+    parser = argparse.ArgumentParser(description='Maintain the materialized summary tables')
+    parser.add_argument('--db-path', default='quickshop.db', help='SQLite database')
+    parser.add_argument('--mysql', action='store_true', help='use the MySQL database from load_data_mysql.py')
+    parser.add_argument('--rebuild', action='store_true', help='recompute every partition from scratch')
+    parser.add_argument('--check', action='store_true',
+                        help='compare the stored summaries against the original views without refreshing them')
+    return parser.parse_args()
+
+def main():
+    """Main execution function"""
+    args = parse_args()
+    print("QuickShop Analytics - Summary Table Refresh")
+    print("=" * 60)
+    if args.mysql:
+        from load_data_mysql import create_connection
+        conn, dialect = create_connection(), MYSQL
+        if conn is None:
+            return
+    else:
+        conn, dialect = sqlite3.connect(args.db_path), SQLITE
+
+    if args.check:
+        # Checks what the dashboards read right now, so a missed refresh shows up as mismatches
+        if not summaries_installed(conn):
+            print("  ✗ Summary tables are not installed; run without --check first")
+            conn.close()
+            return
+        print("Checking materialized views against their definitions...")
+        for name, bad in check_summaries(conn).items():
+            print(f"  {'✓' if bad == 0 else '✗'} {name}: {bad} mismatched rows")
+        conn.close()
+        return
+
+    install_summaries(conn, dialect)
+    start = time.perf_counter()
+    result = refresh_summaries(conn, dialect, args.rebuild)
+    print(f"  ✓ Refreshed {result['orders']:,} new orders across {result['dates']:,} dates "
+          f"in {time.perf_counter() - start:.3f}s")
+    conn.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+QuickShop Analytics - Anomaly Detector Tests
+Flat windows and incremental runs against a full replay
+"""
+
+import numpy as np
+import pandas as pd
+
+from anomaly_detector import AnomalyDetector, WINDOW
+
+FIRST_DAY = 20_000  # days since the epoch
+
+def gmv_series():
+    """Shop GMV: two weeks of sales, WINDOW days without any, then one sale
+
+    Overall orders are reported every day, as they are from the database, so the
+    shop's days without rows are folded in as zeros.
+    """
+    rng = np.random.default_rng(1)  # leaves Welford rounding dust once the window is all zeros
+    sales = list(enumerate(np.round(rng.uniform(50, 400, 14), 2)))
+    sales.append((14 + WINDOW, 317.57))
+    days = np.arange(FIRST_DAY, FIRST_DAY + 15 + WINDOW)
+    shop = pd.DataFrame({'day': [FIRST_DAY + offset for offset, _ in sales], 'metric': 'gmv',
+                         'dimension': 'shop', 'member': '97', 'value': [value for _, value in sales]})
+    overall = pd.DataFrame({'day': days, 'metric': 'orders', 'dimension': 'all', 'member': 'all',
+                            'value': 100.0 + days % 7})
+    return pd.concat([shop, overall], ignore_index=True).sort_values('day', kind='stable')
+
+def test_sale_after_flat_window_has_no_rolling_z():
+    aggregates = gmv_series()
+    anomalies = AnomalyDetector().update(aggregates)
+    anomalies = anomalies[anomalies['metric'] == 'gmv']
+    last = anomalies[anomalies['date'] == str(np.datetime64(FIRST_DAY + 14 + WINDOW, 'D'))]
+    # The EWMA still remembers the early sales and flags the day; the rolling window cannot
+    assert len(last) == 1
+    assert last['z_score'].iloc[0] == 0
+    assert last['rolling_mean'].iloc[0] == 0 and last['rolling_std'].iloc[0] == 0
+    assert (anomalies['z_score'].abs() < 100).all()
+
+def test_incremental_run_matches_full_replay(tmp_path):
+    aggregates = gmv_series()
+    replay = AnomalyDetector().update(aggregates)
+    # Split inside the run of zero days; load() rebuilds the mean and M2 from the ring
+    split = FIRST_DAY + 14 + WINDOW // 2
+    detector = AnomalyDetector()
+    parts = [detector.update(aggregates[aggregates['day'] <= split])]
+    detector.save(tmp_path / 'state.npz')
+    detector = AnomalyDetector.load(tmp_path / 'state.npz')
+    parts.append(detector.update(aggregates[aggregates['day'] > split]))
+    incremental = pd.concat(parts, ignore_index=True)
+    pd.testing.assert_frame_equal(incremental, replay)
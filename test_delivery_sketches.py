@@ -0,0 +1,68 @@
+"""
+QuickShop Analytics - Delivery Sketch Tests
+Rank error of rolled-up t-digest estimates against exact percentiles
+"""
+
+import sqlite3
+import numpy as np
+
+from delivery_sketches import DeliverySketches, ROLLUPS, check_error_bounds, load_shop_cities
+
+NUM_SHOPS = 24
+NUM_DELIVERIES = 6000
+CITIES = ['Berlin', 'Hamburg', 'Munich']
+
+def build_database(num_deliveries=NUM_DELIVERIES, seed=7):
+    """Shops, orders and deliveries over 75 days, with skewed delivery times"""
+    rng = np.random.default_rng(seed)
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE local_shops (shop_id INTEGER PRIMARY KEY, city TEXT)")
+    conn.execute("CREATE TABLE orders (order_id INTEGER PRIMARY KEY, shop_id INTEGER, order_date TEXT)")
+    conn.execute("CREATE TABLE deliveries (delivery_id INTEGER PRIMARY KEY, order_id INTEGER, "
+                 "total_time_minutes INTEGER)")
+    conn.executemany("INSERT INTO local_shops VALUES (?, ?)",
+                     [(shop_id, CITIES[shop_id % len(CITIES)]) for shop_id in range(1, NUM_SHOPS + 1)])
+    shop_ids = rng.integers(1, NUM_SHOPS + 1, num_deliveries)
+    dates = np.datetime64('2025-01-20') + rng.integers(0, 75, num_deliveries).astype('timedelta64[D]')
+    # Slow shops and a long tail, so the percentiles differ between groups
+    minutes = np.round(rng.lognormal(3.2, 0.45, num_deliveries) * (1 + (shop_ids % 4) / 4))
+    order_ids = np.arange(1, num_deliveries + 1)
+    conn.executemany("INSERT INTO orders VALUES (?, ?, ?)",
+                     [(int(o), int(s), f'{d} 12:00:00') for o, s, d in zip(order_ids, shop_ids, dates)])
+    conn.executemany("INSERT INTO deliveries VALUES (?, ?, ?)",
+                     [(int(o), int(o), int(m)) for o, m in zip(order_ids, minutes)])
+    return conn
+
+def assert_within_bounds(conn, sketches):
+    report = check_error_bounds(conn, sketches, load_shop_cities(conn)).set_index('rollup')
+    assert sorted(report.index) == sorted(ROLLUPS)
+    for rollup in ROLLUPS:
+        assert report.loc[rollup, 'failures'] == 0, report.loc[rollup].to_dict()
+
+def test_rollups_within_rank_error_bound():
+    conn = build_database()
+    sketches = DeliverySketches()
+    assert sketches.update_from_db(conn) == NUM_DELIVERIES
+    assert_within_bounds(conn, sketches)
+
+def test_incremental_update_past_watermark():
+    conn = build_database()
+    half = NUM_DELIVERIES // 2
+    moved = conn.execute("SELECT * FROM deliveries WHERE delivery_id > ?", (half,)).fetchall()
+    conn.execute("DELETE FROM deliveries WHERE delivery_id > ?", (half,))
+    sketches = DeliverySketches()
+    assert sketches.update_from_db(conn, rows_per_block=1000) == half
+    assert sketches.last_delivery_id == half
+
+    conn.executemany("INSERT INTO deliveries VALUES (?, ?, ?)", moved)
+    assert sketches.update_from_db(conn, rows_per_block=1000) == NUM_DELIVERIES - half
+    assert sketches.last_delivery_id == NUM_DELIVERIES
+    assert sketches.update_from_db(conn) == 0
+    assert sketches.rollup('all', load_shop_cities(conn))['deliveries'].iloc[0] == NUM_DELIVERIES
+
+    rebuilt = DeliverySketches()
+    rebuilt.update_from_db(conn)
+    assert np.array_equal(sketches.sketch_keys, rebuilt.sketch_keys)
+    assert np.array_equal(sketches.minimums, rebuilt.minimums)
+    assert np.array_equal(sketches.maximums, rebuilt.maximums)
+    assert_within_bounds(conn, sketches)
@@ -0,0 +1,63 @@
+"""
+QuickShop Analytics - Query Cache Tests
+View expansion of MySQL-style and SQLite view definitions
+"""
+
+import sqlite3
+
+from query_cache import QueryCache, referenced_names
+
+# information_schema.views.view_definition as MySQL 8 stores the schema_mysql_fixed.sql views
+MYSQL_DAILY_METRICS = (
+    "select cast(`quickshop`.`orders`.`order_date` as date) AS `date`,count(0) AS `total_orders`,"
+    "count(distinct `quickshop`.`orders`.`customer_id`) AS `unique_customers`,"
+    "sum((case when (`quickshop`.`orders`.`status` = 'Delivered') then `quickshop`.`orders`.`total_amount` "
+    "else 0 end)) AS `gmv` from `quickshop`.`orders` group by cast(`quickshop`.`orders`.`order_date` as date) "
+    "order by `date` desc"
+)
+MYSQL_SHOP_PERFORMANCE = (
+    "select `s`.`shop_id` AS `shop_id`,`s`.`shop_name` AS `shop_name`,count(`o`.`order_id`) AS `total_orders`,"
+    "avg(`d`.`delivery_rating`) AS `avg_rating` from ((`quickshop`.`local_shops` `s` "
+    "left join `quickshop`.`orders` `o` on((`s`.`shop_id` = `o`.`shop_id`))) "
+    "left join `quickshop`.`deliveries` `d` on((`o`.`order_id` = `d`.`order_id`))) "
+    "group by `s`.`shop_id`,`s`.`shop_name`"
+)
+MYSQL_SUMMARY_VIEW = (
+    "select `m`.`date` AS `date`,`m`.`total_orders` AS `total_orders` "
+    "from (select `quickshop`.`mv_daily_metrics`.`date` AS `date`,`quickshop`.`mv_daily_metrics`.`total_orders` "
+    "AS `total_orders` from `quickshop`.`mv_daily_metrics`) `m`"
+)
+
+def test_mysql_view_definitions():
+    assert referenced_names(MYSQL_DAILY_METRICS) == {'orders'}
+    assert referenced_names(MYSQL_SHOP_PERFORMANCE) == {'local_shops', 'orders', 'deliveries'}
+    assert referenced_names(MYSQL_SUMMARY_VIEW) == {'mv_daily_metrics'}
+
+def test_plain_sql():
+    sql = "SELECT * FROM orders o JOIN order_items i ON o.order_id = i.order_id -- FROM customers"
+    assert referenced_names(sql) == {'orders', 'order_items'}
+
+def test_comma_joins():
+    sql = "SELECT o.order_id, c.city FROM orders o, customers c WHERE o.customer_id = c.customer_id"
+    assert referenced_names(sql) == {'orders', 'customers'}
+    sql = ("SELECT t.n, s.city FROM (SELECT shop_id, COUNT(*) AS n FROM orders GROUP BY shop_id) t, "
+           "local_shops AS s JOIN products p ON p.product_id = t.shop_id, promotions WHERE t.shop_id = s.shop_id")
+    assert referenced_names(sql) == {'orders', 'local_shops', 'products', 'promotions'}
+
+def test_dependencies_follow_views():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE orders (order_id INTEGER, shop_id INTEGER)")
+    conn.execute("CREATE TABLE local_shops (shop_id INTEGER)")
+    conn.execute("CREATE VIEW shop_orders AS SELECT s.shop_id, COUNT(o.order_id) AS n "
+                 "FROM (`main`.`local_shops` `s` LEFT JOIN `main`.`orders` `o` ON s.shop_id = o.shop_id) "
+                 "GROUP BY s.shop_id")
+    conn.execute("CREATE VIEW busy_shops AS SELECT * FROM shop_orders WHERE n > 10")
+    cache = QueryCache(conn)
+    assert cache.dependencies("SELECT * FROM busy_shops") == ('local_shops', 'orders')
+
+def test_partitions_versioned_as_fact_table():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE orders_p202401 (order_id INTEGER)")
+    conn.execute("CREATE TABLE orders_pmax (order_id INTEGER)")
+    conn.execute("CREATE VIEW orders AS SELECT * FROM orders_p202401 UNION ALL SELECT * FROM orders_pmax")
+    assert QueryCache(conn).dependencies("SELECT COUNT(*) FROM orders") == ('orders',)